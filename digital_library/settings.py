@@ -128,3 +128,260 @@ STATIC_URL = '/static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Google Books recommendations
+# Queries run concurrently on a bounded pool and the whole batch shares a
+# single deadline in seconds. Per-request timeouts live in OUTBOUND_HTTP.
+
+GOOGLE_BOOKS_API_URL = "https://www.googleapis.com/books/v1/volumes"
+GOOGLE_BOOKS_MAX_WORKERS = 8
+GOOGLE_BOOKS_DEADLINE = 6
+
+
+# Outbound HTTP
+# Every external call goes through library.http_client: one pooled keep-alive
+# session, per-host timeouts, retries with jittered backoff, a circuit breaker
+# and a token-bucket rate limit. Hosts not listed here use 'default'.
+# timeout is (connect, read) seconds, rate is requests per second.
+
+OUTBOUND_HTTP_POOL_HOSTS = 10
+OUTBOUND_HTTP_POOL_SIZE = 20
+
+OUTBOUND_HTTP = {
+    'default': {
+        'timeout': (3.05, 10),
+        'retries': 2,
+        'backoff': 0.3,
+        'rate': 10,
+        'burst': 20,
+        'failure_threshold': 5,
+        'reset_timeout': 30,
+    },
+    'www.googleapis.com': {
+        'timeout': (2, 4),
+        'retries': 1,
+        'rate': 20,
+        'burst': 40,
+    },
+    'api.dictionaryapi.dev': {
+        'timeout': (2, 5),
+        'retries': 1,
+    },
+    'translate.googleapis.com': {
+        'rate': 20,
+        'burst': 40,
+    },
+}
+
+
+# Background jobs
+# Work that must not block a request runs on a small in-process thread pool.
+# Set BACKGROUND_JOBS_INLINE to run jobs synchronously (handy for debugging).
+
+BACKGROUND_JOB_WORKERS = 4
+BACKGROUND_JOBS_INLINE = False
+
+
+# External query cache
+# Google Books responses are kept in an in-process LRU backed by a database
+# table. Entries are fresh for QUERY_CACHE_TTL seconds and may be served for
+# another QUERY_CACHE_STALE_TTL seconds while they are refreshed in the
+# background. Hits in memory refresh the row's last_accessed at most every
+# QUERY_CACHE_TOUCH_INTERVAL seconds, and each process trims the table down to
+# QUERY_CACHE_DB_SIZE at most every QUERY_CACHE_EVICT_INTERVAL seconds.
+
+QUERY_CACHE_TTL = 6 * 60 * 60
+QUERY_CACHE_STALE_TTL = 24 * 60 * 60
+QUERY_CACHE_MEMORY_SIZE = 512
+QUERY_CACHE_DB_SIZE = 10000
+QUERY_CACHE_TOUCH_INTERVAL = 10 * 60
+QUERY_CACHE_EVICT_INTERVAL = 60
+
+
+# Precomputed recommendations
+# main_page only reads UserRecommendation; entries older than this (seconds)
+# are rebuilt in the background or by `manage.py refresh_recommendations`.
+
+RECOMMENDATIONS_MAX_AGE = 12 * 60 * 60
+
+
+# Local content-based recommender
+# Book feature vectors are kept in memory per process. New books are appended
+# incrementally; the vocabulary is refitted when the catalog grows by more
+# than LOCAL_RECOMMENDER_REFIT_GROWTH (fraction) or after
+# LOCAL_RECOMMENDER_REFIT_INTERVAL seconds.
+
+LOCAL_RECOMMENDER_MAX_TERMS = 5000
+LOCAL_RECOMMENDER_REFIT_GROWTH = 0.5
+LOCAL_RECOMMENDER_REFIT_INTERVAL = 6 * 60 * 60
+
+
+# Catalog title lookups
+# Recommendation candidates are checked against Book.normalized_title in one
+# batched query. The optional in-memory Bloom filter skips that query for
+# titles that are certainly not in the catalog. Every
+# TITLE_BLOOM_FILTER_CHECK_INTERVAL seconds it adds the titles of books saved
+# since the last check, so books added or renamed by other workers are seen.
+
+TITLE_BLOOM_FILTER_ENABLED = True
+TITLE_BLOOM_FILTER_CHECK_INTERVAL = 5
+
+
+# Recommendation query planner
+# Read books are turned into weighted author/genre/mood signals (votes halve
+# every RECOMMENDATION_RECENCY_HALF_LIFE days since the book was last read).
+# Only the strongest signals of each kind are kept and merged into one
+# Google Books query per kind.
+
+RECOMMENDATION_RECENCY_HALF_LIFE = 90
+RECOMMENDATION_SIGNAL_LIMITS = {'author': 3, 'genre': 3, 'mood': 2}
+GOOGLE_BOOKS_PLANNED_MAX_RESULTS = 20
+
+
+# Dictionary and translation upstreams
+# Point these at `manage.py run_fake_upstreams` to work offline. TRANSLATOR_URL
+# replaces googletrans with the stand-in's simple HTTP translate endpoint.
+
+DICTIONARY_API_URL = "https://api.dictionaryapi.dev/api/v2/entries/en"
+TRANSLATOR_URL = None
+
+
+# Upstream fixtures
+# 'record' saves every upstream response under UPSTREAM_FIXTURES_DIR,
+# 'replay' answers from those files without touching the network.
+
+UPSTREAM_FIXTURES_MODE = 'off'
+UPSTREAM_FIXTURES_DIR = BASE_DIR / 'upstream_fixtures'
+
+
+# Single-flight
+# Expensive per-key work (Google Books queries, recommendation refreshes,
+# word lookups) runs once at a time per key. Other threads wait for the
+# result; other processes are serialised through lock files in
+# SINGLEFLIGHT_LOCK_DIR (defaults to the system temp dir).
+
+SINGLEFLIGHT_LOCK_DIR = None
+SINGLEFLIGHT_LOCK_STRIPES = 1024
+SINGLEFLIGHT_WAIT_TIMEOUT = 10
+
+
+# Translation batching
+# Dictionary definitions are translated in chunks of up to this many
+# characters; chunks that cannot be split back are translated one by one
+# with at most TRANSLATION_MAX_WORKERS requests in flight.
+
+TRANSLATION_BATCH_MAX_CHARS = 4000
+TRANSLATION_MAX_WORKERS = 4
+
+
+# Definition cache
+# Translated dictionary results shared across users. Entries older than
+# DEFINITION_CACHE_TTL are fetched again; the least recently used ones are
+# dropped once the table grows past DEFINITION_CACHE_SIZE. Hits refresh an
+# entry's last_accessed at most every DEFINITION_CACHE_TOUCH_INTERVAL seconds,
+# and each process trims the table at most every
+# DEFINITION_CACHE_EVICT_INTERVAL seconds.
+
+DEFINITION_CACHE_TTL = 60 * 60 * 24 * 30
+DEFINITION_CACHE_SIZE = 20000
+DEFINITION_CACHE_TOUCH_INTERVAL = 10 * 60
+DEFINITION_CACHE_EVICT_INTERVAL = 60
+
+
+# Offline dictionary
+# Bundle written by `manage.py import_dictionary`. Words found in it are
+# defined without calling DICTIONARY_API_URL.
+
+OFFLINE_DICTIONARY_PATH = BASE_DIR / 'offline_dictionary.bin'
+
+
+# Translator pool
+# googletrans clients shared by all requests in a process. A borrower waits
+# up to TRANSLATOR_POOL_TIMEOUT seconds for a free client; waits longer than
+# TRANSLATOR_POOL_SLOW_WAIT are logged. Clients are replaced after an error,
+# after TRANSLATOR_POOL_MAX_USES translations or TRANSLATOR_POOL_MAX_AGE seconds.
+# Each process logs its pool's counters every TRANSLATOR_POOL_STATS_INTERVAL
+# seconds (0 turns this off).
+
+TRANSLATOR_POOL_SIZE = 4
+TRANSLATOR_POOL_TIMEOUT = 5
+TRANSLATOR_POOL_SLOW_WAIT = 0.5
+TRANSLATOR_POOL_MAX_USES = 500
+TRANSLATOR_POOL_MAX_AGE = 60 * 30
+TRANSLATOR_POOL_STATS_INTERVAL = 15 * 60
+
+
+# Reader vocabulary prefetch
+# For the page being read, up to VOCABULARY_PREFETCH_LIMIT words (at least
+# VOCABULARY_MIN_LENGTH letters, not stopwords, not looked up before) are
+# defined in the background so that tapping them hits the definition cache.
+
+VOCABULARY_PREFETCH_LIMIT = 30
+VOCABULARY_MIN_LENGTH = 4
+
+
+# File delivery
+# How ebooks and uploaded media are sent once Django has checked access:
+# 'django' streams them from the worker (development), 'nginx' answers with
+# X-Accel-Redirect to FILE_DELIVERY_INTERNAL_URL (an `internal` location
+# aliased to MEDIA_ROOT), 'apache' answers with X-Sendfile (mod_xsendfile).
+# Media under MEDIA_PROTECTED_PREFIXES is only served to the owner of the
+# book it belongs to; renditions are never served from there, only through
+# page_image and book_cover.
+
+FILE_DELIVERY_BACKEND = 'django'
+FILE_DELIVERY_INTERNAL_URL = '/protected-media/'
+MEDIA_PROTECTED_PREFIXES = ('ebooks/', 'blobs/', 'renditions/')
+
+
+# Search
+# 'auto' uses SQLite FTS5 or Postgres full-text search when the index from
+# migration 0030 exists, and plain substring matching otherwise. Can be
+# forced to 'sqlite', 'postgres' or 'basic'.
+
+SEARCH_BACKEND = 'auto'
+SEARCH_RESULTS_LIMIT = 20
+
+
+# Page renditions
+# JPEGs of single PDF pages (covers, thumbnails, the reader's first page),
+# rasterized with PyMuPDF or poppler's pdftoppm ('auto' picks whichever is
+# installed) at the widths in RENDITION_SIZES. They are cached under
+# RENDITION_CACHE_DIR in MEDIA_ROOT, and the least recently used files are
+# deleted once the cache grows past RENDITION_CACHE_MAX_BYTES. A process
+# walks the cache again once its own writes could have passed the budget or
+# RENDITION_EVICT_INTERVAL seconds after its last walk.
+
+RENDITION_RASTERIZER = 'auto'
+RENDITION_PDFTOPPM = 'pdftoppm'
+RENDITION_TIMEOUT = 30
+RENDITION_SIZES = {'thumb': 160, 'cover': 320, 'page': 1000}
+RENDITION_JPEG_QUALITY = 80
+RENDITION_CACHE_DIR = 'renditions/'
+RENDITION_CACHE_MAX_BYTES = 512 * 1024 * 1024
+RENDITION_EVICT_INTERVAL = 300
+
+
+# Ebook blob store
+# Uploaded PDFs are hashed while they stream in and stored once per SHA-256
+# under BLOB_STORE_DIR in MEDIA_ROOT; ebooks with the same content share the
+# file. `manage.py dedupe_ebooks` moves files uploaded before this into it.
+
+BLOB_STORE_DIR = 'blobs/'
+FILE_UPLOAD_HANDLERS = [
+    'library.upload_handlers.HashingMemoryFileUploadHandler',
+    'library.upload_handlers.HashingTemporaryFileUploadHandler',
+]
+
+
+# Chunked uploads
+# add_book sends PDFs to the upload endpoints in chunks of at most
+# CHUNKED_UPLOAD_CHUNK_SIZE bytes, collected in CHUNKED_UPLOAD_DIR, so a
+# dropped connection resumes from the last confirmed offset. Uploads left
+# untouched for CHUNKED_UPLOAD_EXPIRY seconds are deleted.
+
+CHUNKED_UPLOAD_DIR = BASE_DIR / 'chunked_uploads'
+CHUNKED_UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_SIZE = 1024 * 1024 * 1024
+CHUNKED_UPLOAD_EXPIRY = 60 * 60 * 24
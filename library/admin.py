@@ -1,11 +1,19 @@
 from django.contrib import admin
-from .models import (Book, Review, JournalEntry, EbookFile, MyBook, Chapter, WordLookup, ReadingSession, SavedQuote)
+from .models import (Book, DefinitionCache, Genre, Mood, Review, JournalEntry, EbookBlob, EbookFile, MyBook, Chapter, WordLookup, ReadingSession, SavedQuote)
 
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
     list_display = ("title", "author", "genre", "mood", "status", "added_by")
     search_fields = ("title", "author", "isbn")
-    list_filter = ("genre", "mood", "status")
+    list_filter = ("genres", "moods", "status")
+
+@admin.register(Genre)
+class GenreAdmin(admin.ModelAdmin):
+    search_fields = ("name",)
+
+@admin.register(Mood)
+class MoodAdmin(admin.ModelAdmin):
+    search_fields = ("name",)
 
 @admin.register(MyBook)
 class MyBookAdmin(admin.ModelAdmin):
@@ -30,7 +38,13 @@ class JournalEntryAdmin(admin.ModelAdmin):
 
 @admin.register(EbookFile)
 class EbookFileAdmin(admin.ModelAdmin):
-    list_display = ("book", "file")
+    list_display = ("book", "file", "blob", "page_count", "ingest_status")
+    list_filter = ("ingest_status",)
+
+@admin.register(EbookBlob)
+class EbookBlobAdmin(admin.ModelAdmin):
+    list_display = ("sha256", "size", "ref_count", "created_at")
+    search_fields = ("sha256",)
 
 @admin.register(WordLookup)
 class WordLookupAdmin(admin.ModelAdmin):
@@ -48,4 +62,7 @@ class SavedQuoteAdmin(admin.ModelAdmin):
     search_fields = ("quote_text", "book__title")
     list_filter = ("created_at",)
 
-
+@admin.register(DefinitionCache)
+class DefinitionCacheAdmin(admin.ModelAdmin):
+    list_display = ("word", "source_lang", "target_lang", "fetched_at", "last_accessed")
+    search_fields = ("word",)
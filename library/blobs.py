@@ -0,0 +1,123 @@
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import EbookBlob
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+_written = threading.local()
+
+
+def blob_name(sha256):
+    return f"{settings.BLOB_STORE_DIR}{sha256[:2]}/{sha256[2:4]}/{sha256}.pdf"
+
+
+def file_sha256(file):
+    # Uploads arrive with the digest from the upload handler; anything else
+    # (admin shell, commands, tests) is hashed here.
+    digest = getattr(file, 'sha256', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks(CHUNK_SIZE) if hasattr(file, 'chunks') else iter(lambda: file.read(CHUNK_SIZE), b''):
+        hasher.update(chunk)
+    file.seek(0)
+    return hasher.hexdigest()
+
+
+@contextmanager
+def discard_on_rollback():
+    # Wrap a transaction that acquires blobs in this, outside the atomic
+    # block: files written for new blobs are deleted again when it fails, as
+    # their rows were rolled back with it. On success they are handed to an
+    # enclosing block, whose transaction may still fail.
+    stack = getattr(_written, 'stack', None)
+    if stack is None:
+        stack = _written.stack = []
+    names = []
+    stack.append(names)
+    try:
+        yield
+    except BaseException:
+        stack.pop()
+        for name in names:
+            _delete_file(name)
+        raise
+    else:
+        stack.pop()
+        if stack:
+            stack[-1].extend(names)
+
+
+def _store(name, file):
+    if default_storage.exists(name):
+        return
+    saved = default_storage.save(name, file)
+    if saved != name:
+        # Another upload of the same bytes got there first.
+        default_storage.delete(saved)
+        return
+    stack = getattr(_written, 'stack', None)
+    if stack:
+        stack[-1].append(name)
+
+
+def acquire(file):
+    # Returns the blob holding file's bytes with one more reference, writing
+    # them to storage only when no blob has this content yet. The row is
+    # locked while the count goes up, so a concurrent release cannot delete
+    # it in between; callers wrap this and their own save in one transaction.
+    digest = file_sha256(file)
+    name = blob_name(digest)
+    with discard_on_rollback(), transaction.atomic():
+        while True:
+            blob = EbookBlob.objects.select_for_update().filter(sha256=digest).first()
+            if blob is None:
+                _store(name, file)
+                try:
+                    with transaction.atomic():
+                        return EbookBlob.objects.create(
+                            sha256=digest, file=name, size=default_storage.size(name), ref_count=1,
+                        )
+                except IntegrityError:
+                    continue
+            if EbookBlob.objects.filter(id=blob.id).update(ref_count=F('ref_count') + 1):
+                blob.ref_count += 1
+                return blob
+            # Released and deleted since it was read; store it again.
+
+
+def release(blob_id):
+    # Drops one reference; the last one deletes the row and, once the
+    # transaction commits, the stored file.
+    if blob_id is None:
+        return
+    with transaction.atomic():
+        blob = EbookBlob.objects.select_for_update().filter(id=blob_id).first()
+        if blob is None:
+            return
+        if blob.ref_count > 1 or blob.ebooks.exists():
+            EbookBlob.objects.filter(id=blob_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+            return
+        name = blob.file.name
+        blob.delete()
+    transaction.on_commit(lambda: _delete_file(name))
+
+
+def _delete_file(name):
+    if EbookBlob.objects.filter(file=name).exists():
+        return
+    try:
+        default_storage.delete(name)
+    except OSError as exc:
+        logger.warning("Could not delete blob %s: %s", name, exc)
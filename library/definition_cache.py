@@ -0,0 +1,72 @@
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import DefinitionCache
+
+
+def normalize_word(word):
+    return ' '.join(word.split()).casefold()
+
+
+def is_fresh(entry):
+    return (timezone.now() - entry.fetched_at).total_seconds() < settings.DEFINITION_CACHE_TTL
+
+
+def lookup(word, source_lang, target_lang):
+    entry = DefinitionCache.objects.filter(
+        word=normalize_word(word), source_lang=source_lang, target_lang=target_lang
+    ).first()
+    if entry is None or not is_fresh(entry):
+        return None
+
+    # last_accessed only has to be good enough for LRU eviction, so a hit
+    # writes it at most once per DEFINITION_CACHE_TOUCH_INTERVAL.
+    now = timezone.now()
+    if (now - entry.last_accessed).total_seconds() >= settings.DEFINITION_CACHE_TOUCH_INTERVAL:
+        entry.last_accessed = now
+        DefinitionCache.objects.filter(id=entry.id).update(last_accessed=now)
+    return entry
+
+
+def store(word, source_lang, target_lang, payload):
+    now = timezone.now()
+    entry, _ = DefinitionCache.objects.update_or_create(
+        word=normalize_word(word),
+        source_lang=source_lang,
+        target_lang=target_lang,
+        defaults={
+            'payload': payload,
+            'fetched_at': now,
+            'last_accessed': now,
+        },
+    )
+    if _evict_due():
+        _evict()
+    return entry
+
+
+_last_evict = None
+_evict_lock = threading.Lock()
+
+
+def _evict_due():
+    # Counting the table on every store is wasted work; each process trims it
+    # at most once per DEFINITION_CACHE_EVICT_INTERVAL and lets it run a little
+    # over its size in between.
+    global _last_evict
+    now = time.monotonic()
+    with _evict_lock:
+        if _last_evict is not None and now - _last_evict < settings.DEFINITION_CACHE_EVICT_INTERVAL:
+            return False
+        _last_evict = now
+        return True
+
+
+def _evict():
+    excess = DefinitionCache.objects.count() - settings.DEFINITION_CACHE_SIZE
+    if excess > 0:
+        oldest = DefinitionCache.objects.order_by('last_accessed').values_list('id', flat=True)[:excess]
+        DefinitionCache.objects.filter(id__in=list(oldest)).delete()
@@ -0,0 +1,167 @@
+import asyncio
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import definition_cache, http_client, offline_dictionary, singleflight, text_normalization
+from .models import DefinitionCache
+from .translation import atranslate, atranslate_many, translate, translate_many
+
+
+def language_pair(word):
+    return ('bg', 'en') if text_normalization.detect_language(word) == 'bg' else ('en', 'bg')
+
+
+def _dictionary_url(lookup_word):
+    return f"{settings.DICTIONARY_API_URL}/{lookup_word}"
+
+
+def _meanings(dict_response):
+    # Returns the meanings and whether the dictionary actually answered (a
+    # 404 means it has no definitions for the word).
+    if dict_response is None:
+        return [], False
+    if dict_response.status_code == 200:
+        return dict_response.json()[0].get("meanings", []), True
+    return [], dict_response.status_code == 404
+
+
+def _english_candidates(word):
+    # The word as written first; its lemma only if the dictionary has no
+    # entry for it ("evening" must not be defined as "even").
+    folded = text_normalization.fold(word)
+    lemma = text_normalization.normalize(folded, 'en')
+    return [folded] if lemma == folded else [folded, lemma]
+
+
+def _get_meanings(word):
+    # The offline bundle answers common words without a network call.
+    meanings = offline_dictionary.lookup(word)
+    if meanings is not None:
+        return meanings, True
+    try:
+        return _meanings(http_client.get(_dictionary_url(word)))
+    except requests.RequestException:
+        return [], False
+
+
+async def _aget_meanings(word):
+    meanings = offline_dictionary.lookup(word)
+    if meanings is not None:
+        return meanings, True
+    try:
+        return _meanings(await http_client.aget(_dictionary_url(word)))
+    except requests.RequestException:
+        return [], False
+
+
+def _english_definitions(meanings):
+    # (part of speech, definition) pairs in dictionary order.
+    pairs = []
+    for meaning in meanings:
+        part = meaning.get("partOfSpeech", "").strip().lower()
+        for d in meaning.get("definitions", []):
+            eng_def = d.get("definition", "")
+            if eng_def:
+                pairs.append((part, eng_def))
+    return pairs
+
+
+def _payload(display_translation, pairs, translated, answered):
+    # Returns the payload and whether it is complete enough to be cached.
+    definitions = {}
+    for (part, _), bul_def in zip(pairs, translated):
+        definitions.setdefault(part, []).append(bul_def)
+    return {"translated": display_translation, "definitions": definitions}, answered
+
+
+def _from_lemma(display_translation, entry, answered):
+    # Inflected forms with no entry of their own ("mornings") take the
+    # definitions of the lemma's shared entry, so every such form costs the
+    # lemma's dictionary and translation calls only once.
+    payload = {"translated": display_translation, "definitions": entry.payload["definitions"]}
+    return payload, answered and entry.pk is not None
+
+
+def fetch(word, src, dest):
+    if src == 'bg':
+        candidates = _english_candidates(translate(text_normalization.fold(word), 'bg', 'en'))
+        display_translation = word
+    else:
+        candidates = _english_candidates(word)
+        display_translation = translate(candidates[0], 'en', 'bg')
+
+    meanings, answered = _get_meanings(candidates[0])
+    if not meanings and len(candidates) > 1:
+        return _from_lemma(display_translation, lookup(candidates[1], 'en', 'bg'), answered)
+
+    pairs = _english_definitions(meanings)
+    # All definitions go out together instead of one request each.
+    translated = translate_many([eng_def for _, eng_def in pairs], 'en', 'bg')
+    return _payload(display_translation, pairs, translated, answered)
+
+
+async def afetch(word, src, dest):
+    if src == 'bg':
+        candidates = _english_candidates(await atranslate(text_normalization.fold(word), 'bg', 'en'))
+        display_translation = word
+        meanings, answered = await _aget_meanings(candidates[0])
+    else:
+        # The English word is looked up while its translation is in flight.
+        candidates = _english_candidates(word)
+        display_translation, (meanings, answered) = await asyncio.gather(
+            atranslate(candidates[0], 'en', 'bg'),
+            _aget_meanings(candidates[0]),
+        )
+
+    if not meanings and len(candidates) > 1:
+        return _from_lemma(display_translation, await alookup(candidates[1], 'en', 'bg'), answered)
+
+    pairs = _english_definitions(meanings)
+    translated = await atranslate_many([eng_def for _, eng_def in pairs], 'en', 'bg')
+    return _payload(display_translation, pairs, translated, answered)
+
+
+def cache_key(word):
+    # Entries are shared by all readers, so they are keyed on the word as
+    # written (case and punctuation folded), never on a lemma or stem. A
+    # lemma has an entry of its own only once a form falls back to it.
+    return text_normalization.fold(word)
+
+
+def lookup(word, src, dest):
+    # Cached entry for the word, fetching it on a miss. Entries that could
+    # not be cached come back unsaved.
+    key = cache_key(word)
+    entry = definition_cache.lookup(key, src, dest)
+    if entry is not None:
+        return entry
+
+    def compute():
+        payload, complete = fetch(word, src, dest)
+        if complete:
+            return definition_cache.store(key, src, dest, payload)
+        return DefinitionCache(payload=payload)
+
+    # Readers clicking the same word at once share one round of upstream calls.
+    return singleflight.do(
+        ('define', src, dest, key), compute, recheck=lambda: definition_cache.lookup(key, src, dest)
+    )
+
+
+async def alookup(word, src, dest):
+    key = cache_key(word)
+    entry = await sync_to_async(definition_cache.lookup)(key, src, dest)
+    if entry is not None:
+        return entry
+
+    async def compute():
+        payload, complete = await afetch(word, src, dest)
+        if complete:
+            return await sync_to_async(definition_cache.store)(key, src, dest, payload)
+        return DefinitionCache(payload=payload)
+
+    return await singleflight.ado(
+        ('define', src, dest, key), compute, recheck=lambda: sync_to_async(definition_cache.lookup)(key, src, dest)
+    )
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+TERM_RE = re.compile(r'(inauthor|subject):"?([^"]+?)"?(?:\s+OR\s+|$)')
+
+WORDS = (
+    "книга", "град", "море", "път", "нощ", "светлина", "спомен", "сянка",
+    "приятел", "война", "любов", "зима", "планина", "река", "тайна", "дом",
+)
+
+
+class FakeUpstreamConfig:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, items=10, definitions=3,
+                 description_size=300, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.items = items
+        self.definitions = definitions
+        self.description_size = description_size
+        self.seed = seed
+
+
+def _rng(config, *parts):
+    digest = hashlib.sha256(json.dumps([config.seed, *parts], ensure_ascii=False).encode('utf-8')).digest()
+    return random.Random(int.from_bytes(digest[:8], 'big'))
+
+
+def _text(rng, size):
+    words = []
+    while sum(len(w) + 1 for w in words) < size:
+        words.append(rng.choice(WORDS))
+    return ' '.join(words)[:size]
+
+
+def google_books_payload(config, query, max_results):
+    # Deterministic volumes for a query. inauthor:/subject: terms are echoed
+    # back as authors/categories so recommendation code can attribute results.
+    rng = _rng(config, 'books', query)
+    authors = [value for kind, value in TERM_RE.findall(query) if kind == 'inauthor'] or ["Иван Вазов"]
+    subjects = [value for kind, value in TERM_RE.findall(query) if kind == 'subject'] or ["Fiction"]
+    items = []
+    for index in range(min(max_results, config.items)):
+        items.append({
+            'id': f"fake-{rng.getrandbits(48):012x}",
+            'volumeInfo': {
+                'title': f"{_text(rng, 18).capitalize()} {index + 1}",
+                'authors': [authors[index % len(authors)]],
+                'categories': [subjects[index % len(subjects)]],
+                'description': _text(rng, config.description_size),
+                'imageLinks': {'thumbnail': ''},
+                'infoLink': f"https://books.example/{index}",
+            },
+        })
+    return {'kind': 'books#volumes', 'totalItems': len(items), 'items': items}
+
+
+def dictionary_payload(config, word):
+    rng = _rng(config, 'dictionary', word)
+    meanings = []
+    for part in ('noun', 'verb'):
+        meanings.append({
+            'partOfSpeech': part,
+            'definitions': [
+                {'definition': f"{part} sense {n + 1} of {word}: {_text(rng, 40)}"}
+                for n in range(config.definitions)
+            ],
+        })
+    return [{'word': word, 'meanings': meanings}]
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    server_version = 'FakeUpstream/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        config = self.server.config
+        self.server.record_hit(self.path)
+
+        delay = config.latency + random.uniform(-config.jitter, config.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if config.error_rate and random.random() < config.error_rate:
+            return self._send_json(503, {'error': 'injected failure'})
+
+        url = urlsplit(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+        if url.path == '/books/v1/volumes':
+            max_results = int(params.get('maxResults', 10))
+            return self._send_json(200, google_books_payload(config, params.get('q', ''), max_results))
+
+        if url.path.startswith('/api/v2/entries/en/'):
+            word = unquote(url.path.rsplit('/', 1)[-1])
+            if not word.isalpha():
+                return self._send_json(404, {'title': 'No Definitions Found'})
+            return self._send_json(200, dictionary_payload(config, word))
+
+        if url.path == '/translate':
+            # Tags every line, leaving punctuation-only lines alone like a
+            # real translator would, so batched requests split back cleanly.
+            dest = params.get('dest', '')
+            lines = params.get('q', '').split('\n')
+            text = '\n'.join(f"{line} [{dest}]" if any(c.isalnum() for c in line) else line for line in lines)
+            return self._send_json(200, {'text': text})
+
+        return self._send_json(404, {'error': 'unknown endpoint'})
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, config=None):
+        super().__init__((host, port), FakeUpstreamHandler)
+        self.config = config or FakeUpstreamConfig()
+        self.hits = []
+        self._hits_lock = threading.Lock()
+        self._thread = None
+
+    def record_hit(self, path):
+        with self._hits_lock:
+            self.hits.append(path)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def upstream_settings(self):
+        return {
+            'GOOGLE_BOOKS_API_URL': f"{self.url}/books/v1/volumes",
+            'DICTIONARY_API_URL': f"{self.url}/api/v2/entries/en",
+            'TRANSLATOR_URL': f"{self.url}/translate",
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-upstreams', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
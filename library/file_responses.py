@@ -0,0 +1,183 @@
+import hashlib
+import mimetypes
+import re
+import uuid
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+CHUNK_SIZE = 64 * 1024
+MAX_RANGES = 20
+
+_RANGE_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+def validators(storage, name):
+    # Strong ETag from the stored name, size and modification time; the file
+    # is never rewritten in place, so these change whenever the bytes do.
+    size = storage.size(name)
+    modified = int(storage.get_modified_time(name).timestamp())
+    digest = hashlib.sha1(f"{name}:{size}:{modified}".encode('utf-8')).hexdigest()
+    return f'"{digest}"', modified, size
+
+
+def parse_ranges(header, size):
+    # Returns a sorted list of (start, end) inclusive byte ranges, [] when none
+    # of them can be satisfied, or None when the header should be ignored.
+    if not header or not header.startswith('bytes='):
+        return None
+
+    ranges = []
+    for spec in header[len('bytes='):].split(','):
+        match = _RANGE_RE.match(spec)
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+        if first == '':
+            length = int(last)
+            if length == 0:
+                continue
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+            if start >= size:
+                continue
+        ranges.append((start, end))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    # Overlapping or adjacent ranges are merged into one.
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _if_range_matches(request, etag, modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return not if_range.startswith('W/') and etag in parse_etags(if_range)
+    return parse_http_date_safe(if_range) == modified
+
+
+def _read_range(handle, start, end):
+    handle.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = handle.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+def _single_range(handle, start, end):
+    try:
+        yield from _read_range(handle, start, end)
+    finally:
+        handle.close()
+
+
+def _multipart(handle, ranges, size, content_type, boundary):
+    try:
+        for start, end in ranges:
+            yield (
+                f"\r\n--{boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+            ).encode('ascii')
+            yield from _read_range(handle, start, end)
+        yield f"\r\n--{boundary}--\r\n".encode('ascii')
+    finally:
+        handle.close()
+
+
+def _multipart_length(ranges, size, content_type, boundary):
+    length = len(f"\r\n--{boundary}--\r\n")
+    for start, end in ranges:
+        length += len(
+            f"\r\n--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        )
+        length += end - start + 1
+    return length
+
+
+def _add_validators(response, etag, modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified)
+    response['Accept-Ranges'] = 'bytes'
+    # Private because access is checked per user; revalidated on every visit,
+    # which costs a 304 when nothing changed.
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def serve_file(request, storage, name, content_type):
+    etag, modified, size = validators(storage, name)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=modified)
+    if not_modified is not None:
+        return _add_validators(not_modified, etag, modified)
+
+    ranges = None
+    if request.method in ('GET', 'HEAD') and _if_range_matches(request, etag, modified):
+        ranges = parse_ranges(request.headers.get('Range'), size)
+
+    if ranges == []:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+        return _add_validators(response, etag, modified)
+
+    handle = storage.open(name, 'rb')
+    if not ranges:
+        response = FileResponse(handle, content_type=content_type)
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(_single_range(handle, start, end), status=206, content_type=content_type)
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        boundary = uuid.uuid4().hex
+        response = StreamingHttpResponse(
+            _multipart(handle, ranges, size, content_type, boundary),
+            status=206,
+            content_type=f"multipart/byteranges; boundary={boundary}",
+        )
+        response['Content-Length'] = str(_multipart_length(ranges, size, content_type, boundary))
+    return _add_validators(response, etag, modified)
+
+
+def deliver(request, storage, name, content_type=None):
+    # Access has been checked by the caller. With a proxy backend Django only
+    # names the file and nginx (X-Accel-Redirect) or Apache (X-Sendfile)
+    # streams it, ranges and validators included; 'django' streams it here.
+    content_type = content_type or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    backend = settings.FILE_DELIVERY_BACKEND
+
+    if backend == 'django':
+        return serve_file(request, storage, name, content_type)
+
+    response = HttpResponse(content_type=content_type)
+    if backend == 'nginx':
+        response['X-Accel-Redirect'] = settings.FILE_DELIVERY_INTERNAL_URL + quote(name)
+    elif backend == 'apache':
+        response['X-Sendfile'] = storage.path(name)
+    else:
+        raise ImproperlyConfigured(f"Unknown FILE_DELIVERY_BACKEND {backend!r}")
+    response['Cache-Control'] = 'private, no-cache'
+    return response
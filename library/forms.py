@@ -1,5 +1,5 @@
 from django import forms
-from .models import Book, EbookFile, Chapter
+from .models import Book, ChunkedUpload, EbookFile, Chapter
 
 class BookForm(forms.ModelForm):
     PREDEFINED_GENRES = [
@@ -135,6 +135,10 @@ class BookForm(forms.ModelForm):
         return ', '.join(genres)  
 
 class EbookFileForm(forms.ModelForm):
+    # The PDF either comes with the form or, for the chunked uploader, was
+    # sent beforehand and is referred to by upload_id.
+    upload_id = forms.UUIDField(required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = EbookFile
         fields = ['file']
@@ -142,13 +146,32 @@ class EbookFileForm(forms.ModelForm):
             'file': 'Файл с книгата (PDF):',
         }
 
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+        self.fields['file'].required = False
+
     def clean_file(self):
         file = self.cleaned_data['file']
         allowed_extensions = ['.pdf']
-        if not any(file.name.lower().endswith(ext) for ext in allowed_extensions):
+        if file and not any(file.name.lower().endswith(ext) for ext in allowed_extensions):
             raise forms.ValidationError("Позволени са само PDF файлове.")
         return file
 
+    def clean(self):
+        cleaned_data = super().clean()
+        upload_id = cleaned_data.get('upload_id')
+        if upload_id:
+            upload = ChunkedUpload.objects.filter(id=upload_id, user=self.user, status='complete').first()
+            if upload is None:
+                self.add_error('upload_id', "Каченият файл не е намерен. Опитай отново.")
+            else:
+                # Opened by the view once both forms are valid.
+                cleaned_data['upload'] = upload
+        elif not cleaned_data.get('file') and 'file' not in self.errors:
+            self.add_error('file', self.fields['file'].error_messages['required'])
+        return cleaned_data
+
 class ChapterForm(forms.ModelForm):
     class Meta:
         model = Chapter
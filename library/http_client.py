@@ -0,0 +1,378 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import upstream_fixtures
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# httpx 0.13 (pinned by googletrans) raises its transport errors as httpcore
+# exceptions outside httpx.HTTPError, so they are listed one by one.
+HTTPX_TIMEOUTS = (httpx.ConnectTimeout, httpx.ReadTimeout, httpx.WriteTimeout, httpx.PoolTimeout)
+HTTPX_ERRORS = HTTPX_TIMEOUTS + (httpx.NetworkError, httpx.ProtocolError, httpx.ProxyError, httpx.HTTPError)
+
+DEFAULT_POLICY = {
+    'timeout': (3.05, 10),
+    'retries': 2,
+    'backoff': 0.3,
+    'rate': 10,
+    'burst': 20,
+    'rate_limit_wait': 1.0,
+    'failure_threshold': 5,
+    'reset_timeout': 30,
+}
+
+
+class UpstreamUnavailable(requests.RequestException):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _take(self):
+        # Returns 0 when a token was taken, otherwise how long to wait for one.
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, timeout=0):
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if not wait:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout=0):
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if not wait:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        # While open every call fails fast. After reset_timeout a single trial
+        # call is let through; its outcome closes or re-opens the circuit.
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def rejecting(self):
+        # Whether allow() would fail, without starting a trial.
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at < self.reset_timeout
+            return self.state == self.HALF_OPEN
+
+    def end_trial(self):
+        # A trial that ended without an outcome (cancelled, interrupted) lets
+        # the next call try again instead of leaving the circuit half open.
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Circuit opened after %s failures", self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class Upstream:
+    def __init__(self, host, policy):
+        self.host = host
+        self.bucket = TokenBucket(policy['rate'], policy['burst'])
+        self.breaker = CircuitBreaker(policy['failure_threshold'], policy['reset_timeout'])
+
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+_session = None
+_session_lock = threading.Lock()
+_async_loop = None
+_async_client = None
+_async_lock = threading.Lock()
+
+
+def get_policy(host):
+    configured = getattr(settings, 'OUTBOUND_HTTP', {})
+    return {**DEFAULT_POLICY, **configured.get('default', {}), **configured.get(host, {})}
+
+
+def _get_upstream(host):
+    with _upstreams_lock:
+        if host not in _upstreams:
+            _upstreams[host] = Upstream(host, get_policy(host))
+        return _upstreams[host]
+
+
+def get_session():
+    # One keep-alive session for the whole process; urllib3 keeps a pool of
+    # connections per host. Retries are handled here, not by the adapter.
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=settings.OUTBOUND_HTTP_POOL_HOSTS,
+                pool_maxsize=settings.OUTBOUND_HTTP_POOL_SIZE,
+                max_retries=0,
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+def get_async_client():
+    # httpx clients are bound to the event loop they were created on, and
+    # under WSGI every async view runs on a fresh loop. So the process keeps
+    # one client on a loop of its own, running in a daemon thread, and async
+    # callers hand their requests to it (see _arequest_raw). No thread waits
+    # on a request: the callers await it.
+    global _async_loop, _async_client
+    with _async_lock:
+        if _async_client is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='http-client-loop', daemon=True).start()
+
+            async def create():
+                return httpx.AsyncClient(pool_limits=httpx.PoolLimits(
+                    max_keepalive=settings.OUTBOUND_HTTP_POOL_SIZE,
+                    max_connections=settings.OUTBOUND_HTTP_POOL_SIZE,
+                ))
+
+            _async_client = asyncio.run_coroutine_threadsafe(create(), loop).result()
+            _async_loop = loop
+        return _async_loop, _async_client
+
+
+async def _arequest_raw(method, url, **kwargs):
+    loop, client = get_async_client()
+    if asyncio.get_running_loop() is loop:
+        return await client.request(method, url, **kwargs)
+    future = asyncio.run_coroutine_threadsafe(client.request(method, url, **kwargs), loop)
+    return await asyncio.wrap_future(future)
+
+
+def _admit(upstream, policy):
+    # The token is taken before the breaker is asked, so a call turned away by
+    # the rate limit never starts a half-open trial that nobody finishes.
+    if upstream.breaker.rejecting():
+        raise UpstreamUnavailable(f"{upstream.host} is temporarily unavailable")
+    if not upstream.bucket.acquire(policy['rate_limit_wait']):
+        raise UpstreamUnavailable(f"Rate limit for {upstream.host} exceeded")
+    if not upstream.breaker.allow():
+        raise UpstreamUnavailable(f"{upstream.host} is temporarily unavailable")
+
+
+async def _admit_async(upstream, policy):
+    if upstream.breaker.rejecting():
+        raise UpstreamUnavailable(f"{upstream.host} is temporarily unavailable")
+    if not await upstream.bucket.acquire_async(policy['rate_limit_wait']):
+        raise UpstreamUnavailable(f"Rate limit for {upstream.host} exceeded")
+    if not upstream.breaker.allow():
+        raise UpstreamUnavailable(f"{upstream.host} is temporarily unavailable")
+
+
+def _backoff(policy, attempt, response=None):
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), policy['backoff'] * 2 ** (attempt + 2))
+    return policy['backoff'] * 2 ** attempt * random.uniform(0.5, 1.5)
+
+
+def request(method, url, timeout=None, **kwargs):
+    fixtures_mode = upstream_fixtures.mode()
+    if fixtures_mode == 'replay':
+        return upstream_fixtures.replay_response(method, url, kwargs.get('params'))
+
+    response = _send(method, url, timeout, **kwargs)
+    if fixtures_mode == 'record':
+        upstream_fixtures.record_response(method, url, kwargs.get('params'), response)
+    return response
+
+
+def _send(method, url, timeout=None, **kwargs):
+    host = urlsplit(url).hostname or ''
+    policy = get_policy(host)
+    upstream = _get_upstream(host)
+    timeout = timeout if timeout is not None else policy['timeout']
+
+    for attempt in range(policy['retries'] + 1):
+        _admit(upstream, policy)
+        response = None
+        try:
+            response = get_session().request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            upstream.breaker.record_failure()
+            if attempt == policy['retries']:
+                raise
+        except Exception:
+            upstream.breaker.record_failure()
+            raise
+        else:
+            if response.status_code not in RETRY_STATUSES:
+                upstream.breaker.record_success()
+                return response
+            upstream.breaker.record_failure()
+            if attempt == policy['retries']:
+                return response
+        finally:
+            upstream.breaker.end_trial()
+        time.sleep(_backoff(policy, attempt, response))
+
+
+def get(url, params=None, timeout=None, **kwargs):
+    return request('GET', url, params=params, timeout=timeout, **kwargs)
+
+
+def _httpx_timeout(timeout):
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect_timeout=connect)
+    return httpx.Timeout(timeout)
+
+
+def _to_requests_response(response):
+    # Async callers get the same response type and exceptions as sync ones.
+    converted = requests.Response()
+    converted.status_code = response.status_code
+    converted.headers.update(response.headers)
+    converted._content = response.content
+    # Only a declared charset; requests detects JSON encodings itself.
+    converted.encoding = response.charset_encoding
+    converted.url = str(response.url)
+    return converted
+
+
+async def arequest(method, url, timeout=None, **kwargs):
+    fixtures_mode = upstream_fixtures.mode()
+    if fixtures_mode == 'replay':
+        return upstream_fixtures.replay_response(method, url, kwargs.get('params'))
+
+    response = await _asend(method, url, timeout, **kwargs)
+    if fixtures_mode == 'record':
+        upstream_fixtures.record_response(method, url, kwargs.get('params'), response)
+    return response
+
+
+async def _asend(method, url, timeout=None, **kwargs):
+    # Same policy as _send, without blocking the event loop or a thread.
+    host = urlsplit(url).hostname or ''
+    policy = get_policy(host)
+    upstream = _get_upstream(host)
+    timeout = _httpx_timeout(timeout if timeout is not None else policy['timeout'])
+
+    for attempt in range(policy['retries'] + 1):
+        await _admit_async(upstream, policy)
+        response = None
+        try:
+            raw = await _arequest_raw(method, url, timeout=timeout, **kwargs)
+        except HTTPX_TIMEOUTS as exc:
+            upstream.breaker.record_failure()
+            if attempt == policy['retries']:
+                raise requests.Timeout(str(exc)) from exc
+        except HTTPX_ERRORS as exc:
+            upstream.breaker.record_failure()
+            if attempt == policy['retries']:
+                raise requests.ConnectionError(str(exc)) from exc
+        except Exception:
+            upstream.breaker.record_failure()
+            raise
+        else:
+            response = _to_requests_response(raw)
+            if response.status_code not in RETRY_STATUSES:
+                upstream.breaker.record_success()
+                return response
+            upstream.breaker.record_failure()
+            if attempt == policy['retries']:
+                return response
+        finally:
+            upstream.breaker.end_trial()
+        await asyncio.sleep(_backoff(policy, attempt, response))
+
+
+async def aget(url, params=None, timeout=None, **kwargs):
+    return await arequest('GET', url, params=params, timeout=timeout, **kwargs)
+
+
+@contextmanager
+def guard(host, failures=(requests.RequestException,)):
+    # For clients that manage their own connections (e.g. googletrans): the
+    # call still goes through the host's circuit breaker and rate limit.
+    # Only the client's transport and HTTP errors, given as failures, count
+    # against the host; anything else is a bug here, not an outage there.
+    policy = get_policy(host)
+    upstream = _get_upstream(host)
+    _admit(upstream, policy)
+    try:
+        yield
+    except UpstreamUnavailable:
+        raise
+    except failures:
+        upstream.breaker.record_failure()
+        raise
+    else:
+        upstream.breaker.record_success()
+    finally:
+        upstream.breaker.end_trial()
+
+
+def reset():
+    with _upstreams_lock:
+        _upstreams.clear()
@@ -0,0 +1,125 @@
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+from pypdf import PdfReader
+from pypdf.errors import PyPdfError
+
+from . import jobs, renditions, search
+from .models import Book, EbookFile, PageText
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+METADATA_FIELDS = ('title', 'author', 'subject', 'creator', 'producer')
+
+
+def _clean(text):
+    return ' '.join((text or '').split())
+
+
+def _outline(reader, items=None, level=0):
+    # Flattened table of contents: [{"title", "page", "level"}].
+    entries = []
+    for item in reader.outline if items is None else items:
+        if isinstance(item, list):
+            entries.extend(_outline(reader, item, level + 1))
+            continue
+        try:
+            page = reader.get_destination_page_number(item) + 1
+        except Exception:
+            page = None
+        entries.append({'title': _clean(item.title), 'page': page, 'level': level})
+    return entries
+
+
+def _metadata(reader):
+    info = reader.metadata or {}
+    metadata = {}
+    for field in METADATA_FIELDS:
+        value = getattr(info, field, None)
+        if value:
+            metadata[field] = _clean(str(value))
+    try:
+        metadata['outline'] = _outline(reader)
+    except Exception:
+        metadata['outline'] = []
+    return metadata
+
+
+def _reuse(source):
+    # Another upload of the same blob was already ingested: copy its results
+    # instead of parsing the PDF again.
+    pages = list(source.pages.order_by('page_number').values_list('page_number', 'text'))
+    return source.page_count, source.metadata, pages
+
+
+def _extract(ebook):
+    with ebook.file.open('rb') as handle:
+        reader = PdfReader(handle)
+        metadata = _metadata(reader)
+        pages = []
+        for number, page in enumerate(reader.pages, start=1):
+            try:
+                text = _clean(page.extract_text())
+            except Exception:
+                text = ''
+            pages.append((number, text))
+    return len(pages), metadata, pages
+
+
+def ingest_ebook(ebook_id, file_name=None):
+    # Reads the PDF once: page count, text per page and embedded metadata.
+    # Parsing happens outside any transaction; the pages are swapped in with
+    # one short one at the end, so the database is not locked while a large
+    # book is read. A copy of an already ingested blob reuses that ebook's
+    # results. The results are dropped if the file was replaced meanwhile,
+    # since the new file has a job of its own. Only one worker gets to claim
+    # a pending or failed ebook; the others return straight away.
+    ebook = EbookFile.objects.select_related('book').filter(id=ebook_id).first()
+    if ebook is None:
+        return None
+    file_name = ebook.file.name if file_name is None else file_name
+    current = EbookFile.objects.filter(id=ebook.id, file=file_name)
+    claimed = current.filter(ingest_status__in=['pending', 'failed']).update(
+        ingest_status='processing', ingest_error='',
+    )
+    if not claimed:
+        return None
+
+    source = None
+    if ebook.blob_id:
+        source = EbookFile.objects.filter(blob_id=ebook.blob_id, ingest_status='done').exclude(id=ebook.id).first()
+    try:
+        page_count, metadata, pages = _reuse(source) if source else _extract(ebook)
+    except Exception as exc:
+        if isinstance(exc, (OSError, PyPdfError, ValueError)):
+            logger.warning("Could not ingest ebook %s: %s", ebook.id, exc)
+        else:
+            logger.exception("Unexpected error while ingesting ebook %s", ebook.id)
+        current.update(ingest_status='failed', ingest_error=str(exc)[:1000])
+        return None
+
+    with transaction.atomic():
+        done = current.update(
+            page_count=page_count,
+            metadata=metadata,
+            ingest_status='done',
+            ingested_at=timezone.now(),
+        )
+        if not done:
+            return None
+        PageText.objects.filter(ebook=ebook).delete()
+        PageText.objects.bulk_create(
+            [PageText(ebook=ebook, page_number=number, text=text) for number, text in pages], batch_size=BATCH_SIZE,
+        )
+    Book.objects.filter(id=ebook.book_id, total_pages=0).update(total_pages=page_count)
+    search.index_pages(ebook)
+    renditions.render_first_page(ebook)
+    return page_count
+
+
+def schedule_ingest(ebook):
+    # Keyed on the file as well, so a file replaced while its predecessor is
+    # still being ingested gets a job of its own.
+    jobs.enqueue(ingest_ebook, ebook.id, ebook.file.name, dedupe_key=('ingest', ebook.id, ebook.file.name))
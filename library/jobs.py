@@ -0,0 +1,54 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_active_keys = set()
+_active_keys_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BACKGROUND_JOB_WORKERS,
+            thread_name_prefix='library-jobs',
+        )
+    return _executor
+
+
+def _run(func, args, kwargs, dedupe_key):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception("Background job %s failed", getattr(func, '__name__', func))
+    finally:
+        if dedupe_key is not None:
+            with _active_keys_lock:
+                _active_keys.discard(dedupe_key)
+        close_old_connections()
+
+
+def enqueue(func, *args, dedupe_key=None, **kwargs):
+    # Jobs are handed to the worker pool only once the surrounding transaction
+    # commits, so they never see rows that could still be rolled back. A job
+    # with a dedupe_key is dropped while another job with the same key is
+    # still queued or running.
+    def submit():
+        if dedupe_key is not None:
+            with _active_keys_lock:
+                if dedupe_key in _active_keys:
+                    return
+                _active_keys.add(dedupe_key)
+
+        if settings.BACKGROUND_JOBS_INLINE:
+            _run(func, args, kwargs, dedupe_key)
+        else:
+            _get_executor().submit(_run, func, args, kwargs, dedupe_key)
+
+    transaction.on_commit(submit)
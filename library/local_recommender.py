@@ -0,0 +1,304 @@
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.urls import reverse
+
+from .models import Book
+
+TOKEN_RE = re.compile(r"[^\W\d_]{3,}")
+
+FIELD_WEIGHTS = {
+    'genre': 1.0,
+    'mood': 0.8,
+    'author': 1.2,
+    'language': 0.4,
+    'description': 1.0,
+}
+
+BOOK_FIELDS = ('id', 'added_by_id', 'normalized_title', 'author', 'genre', 'mood', 'language', 'description')
+
+
+def _split(value):
+    return [part.strip().casefold() for part in (value or '').split(',') if part.strip()]
+
+
+def extract_features(book):
+    # Categorical fields become one-hot features, the description becomes a
+    # bag of words with sublinear term frequency. Values are pre-IDF weights.
+    features = {}
+    for genre in _split(book['genre']):
+        features[f'genre:{genre}'] = FIELD_WEIGHTS['genre']
+    for mood in _split(book['mood']):
+        features[f'mood:{mood}'] = FIELD_WEIGHTS['mood']
+    if book['author'].strip():
+        features[f"author:{' '.join(book['author'].split()).casefold()}"] = FIELD_WEIGHTS['author']
+    if book['language'].strip():
+        features[f"language:{book['language'].strip().casefold()}"] = FIELD_WEIGHTS['language']
+
+    counts = Counter(TOKEN_RE.findall((book['description'] or '').casefold()))
+    for token, count in counts.items():
+        features[f'desc:{token}'] = FIELD_WEIGHTS['description'] * (1 + math.log(count))
+    return features
+
+
+def _grow(array, needed):
+    # Room for at least `needed` items, doubling so appends stay amortised O(1).
+    if needed <= len(array):
+        return array
+    grown = np.zeros(max(needed, 2 * len(array), 64), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class ContentModel:
+    # Rows are sparse: each book only has a few dozen non-zero features out of
+    # up to LOCAL_RECOMMENDER_MAX_TERMS columns, so the matrix is kept as
+    # (row, column, value) entries in arrays that grow in place. A row's
+    # entries are contiguous; an edited row gets new entries at the end and its
+    # old ones are zeroed until the next refit compacts them away.
+    def __init__(self):
+        self.vocabulary = {}
+        self.idf = np.zeros(0, dtype=np.float32)
+        self._entry_rows = np.zeros(0, dtype=np.int32)
+        self._entry_columns = np.zeros(0, dtype=np.int32)
+        self._entry_values = np.zeros(0, dtype=np.float32)
+        self.entries = 0
+        self._starts = np.zeros(0, dtype=np.int64)
+        self._ends = np.zeros(0, dtype=np.int64)
+        self._book_ids = np.zeros(0, dtype=np.int64)
+        self._owner_ids = np.zeros(0, dtype=np.int64)
+        self.size = 0
+        self.titles = []
+        self.rows = {}
+        self.fitted_size = 0
+        self.fitted_at = 0.0
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def book_ids(self):
+        return self._book_ids[:self.size]
+
+    @property
+    def owner_ids(self):
+        return self._owner_ids[:self.size]
+
+    def fit(self, books):
+        features = [extract_features(book) for book in books]
+
+        document_frequency = Counter()
+        for book_features in features:
+            document_frequency.update(book_features.keys())
+
+        # Categorical features are always kept, description terms are capped
+        # to the most common ones so the matrix width stays bounded.
+        terms = [f for f in document_frequency if f.startswith('desc:')]
+        terms.sort(key=lambda f: (-document_frequency[f], f))
+        kept = [f for f in document_frequency if not f.startswith('desc:')]
+        kept += terms[:settings.LOCAL_RECOMMENDER_MAX_TERMS]
+
+        self.vocabulary = {feature: column for column, feature in enumerate(kept)}
+        total = len(books)
+        self.idf = np.array(
+            [math.log((1 + total) / (1 + document_frequency[f])) + 1 for f in kept],
+            dtype=np.float32,
+        )
+        self.entries = 0
+        self.size = 0
+        self.titles = []
+        self.rows = {}
+        self._append(books, features)
+        self.fitted_size = total
+        self.fitted_at = time.monotonic()
+
+    def _vectorize(self, features):
+        # Returns the row's non-zero (columns, values), IDF-weighted and
+        # L2-normalised.
+        pairs = [(self.vocabulary[f], weight) for f, weight in features.items() if f in self.vocabulary]
+        columns = np.array([column for column, _ in pairs], dtype=np.int32)
+        values = np.array([weight for _, weight in pairs], dtype=np.float32) * self.idf[columns]
+        norm = np.linalg.norm(values)
+        return columns, (values / norm if norm else values)
+
+    def _write_row(self, row, features):
+        columns, values = self._vectorize(features)
+        start, end = self.entries, self.entries + len(columns)
+        self._entry_rows = _grow(self._entry_rows, end)
+        self._entry_columns = _grow(self._entry_columns, end)
+        self._entry_values = _grow(self._entry_values, end)
+        self._entry_rows[start:end] = row
+        self._entry_columns[start:end] = columns
+        self._entry_values[start:end] = values
+        self._starts[row], self._ends[row] = start, end
+        self.entries = end
+
+    def _append(self, books, features=None):
+        if not books:
+            return
+        features = features or [extract_features(book) for book in books]
+        offset = self.size
+        self.size += len(books)
+        self._starts = _grow(self._starts, self.size)
+        self._ends = _grow(self._ends, self.size)
+        self._book_ids = _grow(self._book_ids, self.size)
+        self._owner_ids = _grow(self._owner_ids, self.size)
+        for index, (book, book_features) in enumerate(zip(books, features)):
+            row = offset + index
+            self._write_row(row, book_features)
+            self._book_ids[row] = book['id']
+            self._owner_ids[row] = book['added_by_id']
+            self.titles.append(book['normalized_title'])
+            self.rows[book['id']] = row
+
+    def add(self, books):
+        fresh = []
+        for book in books:
+            if book['id'] in self.rows:
+                self.replace(book)
+            else:
+                fresh.append(book)
+        self._append(fresh)
+
+    def _clear_row(self, row):
+        self._entry_values[self._starts[row]:self._ends[row]] = 0
+
+    def replace(self, book):
+        row = self.rows.get(book['id'])
+        if row is None:
+            self._append([book])
+            return
+        self._clear_row(row)
+        self._write_row(row, extract_features(book))
+        self._owner_ids[row] = book['added_by_id']
+        self.titles[row] = book['normalized_title']
+
+    def remove(self, book_id):
+        row = self.rows.pop(book_id, None)
+        if row is not None:
+            self._clear_row(row)
+            self._owner_ids[row] = -1
+
+    def needs_refit(self):
+        if not self.fitted_size:
+            return True
+        grown = len(self.rows) - self.fitted_size
+        if grown > max(10, self.fitted_size * settings.LOCAL_RECOMMENDER_REFIT_GROWTH):
+            return True
+        return time.monotonic() - self.fitted_at > settings.LOCAL_RECOMMENDER_REFIT_INTERVAL
+
+    def score(self, user_id, read_book_ids, limit, exclude_titles=()):
+        rows = [self.rows[book_id] for book_id in read_book_ids if book_id in self.rows]
+        if not rows or not len(self.book_ids):
+            return []
+
+        entries = np.concatenate([np.arange(self._starts[row], self._ends[row]) for row in rows])
+        profile = np.bincount(
+            self._entry_columns[entries], weights=self._entry_values[entries], minlength=len(self.idf),
+        )
+        columns = self._entry_columns[:self.entries]
+        scores = np.bincount(
+            self._entry_rows[:self.entries],
+            weights=self._entry_values[:self.entries] * profile[columns],
+            minlength=self.size,
+        )
+        scores[self.owner_ids == user_id] = 0
+        scores[self.owner_ids == -1] = 0
+
+        candidates = np.flatnonzero(scores > 0)
+        if not len(candidates):
+            return []
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+
+        seen = set(exclude_titles)
+        picked = []
+        for row in candidates:
+            title = self.titles[row]
+            if title in seen:
+                continue
+            seen.add(title)
+            picked.append(int(self.book_ids[row]))
+            if len(picked) >= limit:
+                break
+        return picked
+
+
+_model = ContentModel()
+_version = None
+_deleted = set()
+_lock = threading.Lock()
+
+
+def _changed_books(since):
+    books = Book.objects.all() if since is None else Book.objects.filter(updated_at__gte=since)
+    return list(books.values(*BOOK_FIELDS, 'updated_at'))
+
+
+def _sync():
+    # Brings the in-process model up to date: books saved since the last sync
+    # (by any worker; rows at exactly _version are read again, as a save in
+    # the same instant may have committed later) are appended or
+    # re-vectorized, and a full refit happens when the catalog has drifted
+    # too far from the fitted vocabulary. Deletions in this process drop
+    # their rows at once; rows of books deleted elsewhere are skipped when
+    # recommendations are built and go away with the next refit.
+    global _version
+    if _model.needs_refit():
+        books = _changed_books(None)
+        _model.fit(books)
+        _deleted.clear()
+    else:
+        books = _changed_books(_version)
+        _model.add(books)
+        for book_id in _deleted:
+            _model.remove(book_id)
+        _deleted.clear()
+    for book in books:
+        if _version is None or book['updated_at'] > _version:
+            _version = book['updated_at']
+
+
+def mark_deleted(book_id):
+    with _lock:
+        _deleted.add(book_id)
+
+
+def reset():
+    global _model, _version
+    with _lock:
+        _model = ContentModel()
+        _version = None
+        _deleted.clear()
+
+
+def recommend(read_books, limit):
+    read_books = list(read_books)
+    if not read_books:
+        return []
+    user_id = read_books[0].added_by_id
+    owned_titles = set(Book.objects.filter(added_by_id=user_id).values_list('normalized_title', flat=True))
+
+    with _lock:
+        _sync()
+        book_ids = _model.score(user_id, [book.id for book in read_books], limit, owned_titles)
+
+    books = Book.objects.in_bulk(book_ids)
+    recommendations = []
+    for book_id in book_ids:
+        book = books.get(book_id)
+        if book is None:
+            continue
+        recommendations.append({
+            'title': book.title,
+            'authors': book.author,
+            'description': book.description[:300],
+            'thumbnail': book.cover_image.url if book.cover_image else '',
+            'link': reverse('book_detail', args=[book.id]),
+            'source': 'local',
+        })
+    return recommendations
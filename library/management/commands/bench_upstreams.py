@@ -0,0 +1,91 @@
+import statistics
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from library import query_cache
+from library.fake_upstreams import FakeUpstreamServer
+from library.models import Book, ExternalQueryCache
+from library.recommendations import refresh_user_recommendations
+
+from .run_fake_upstreams import add_config_arguments, config_from_options
+
+WORDS = ["house", "river", "light", "shadow", "winter", "mountain", "secret", "friend", "road", "memory"]
+
+LIBRARY = [
+    ("Под игото", "Иван Вазов", "Historical Fiction, Classic", "Nostalgic"),
+    ("Тютюн", "Димитър Димов", "Literary Fiction", "Gritty, Tragic"),
+    ("Железният светилник", "Димитър Талев", "Historical Fiction", "Reflective"),
+    ("Старопланински легенди", "Йордан Йовков", "Short Stories, Classic", "Melancholic"),
+    ("Бай Ганьо", "Алеко Константинов", "Satire, Humor", "Satirical, Funny"),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Times recommendation refreshes, main_page and translate_and_define against the "
+        "local upstream stand-ins. Everything it writes is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--url', help="Use an already running run_fake_upstreams instance.")
+        add_config_arguments(parser)
+
+    def handle(self, *args, **options):
+        server = None
+        if options['url']:
+            base = options['url'].rstrip('/')
+            upstream = {
+                'GOOGLE_BOOKS_API_URL': f"{base}/books/v1/volumes",
+                'DICTIONARY_API_URL': f"{base}/api/v2/entries/en",
+                'TRANSLATOR_URL': f"{base}/translate",
+            }
+        else:
+            server = FakeUpstreamServer(config=config_from_options(options)).start()
+            upstream = server.upstream_settings()
+
+        try:
+            with override_settings(**upstream), transaction.atomic():
+                results = self.run(options['iterations'])
+                transaction.set_rollback(True)
+        finally:
+            if server is not None:
+                server.stop()
+
+        self.stdout.write(f"{'scenario':<28}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+        for name, samples in results.items():
+            samples = sorted(samples)
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            self.stdout.write(
+                f"{name:<28}{statistics.median(samples) * 1000:>10.1f}{p95 * 1000:>10.1f}{samples[-1] * 1000:>10.1f}"
+            )
+
+    def run(self, iterations):
+        user = User.objects.create_user(username=f"bench-{uuid.uuid4().hex[:8]}")
+        for title, author, genre, mood in LIBRARY:
+            Book.objects.create(title=title, author=author, genre=genre, mood=mood, status='read', added_by=user)
+
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+
+        results = {name: [] for name in ("refresh (cold cache)", "refresh (warm cache)", "main_page", "translate_and_define")}
+        for i in range(iterations):
+            query_cache.clear_memory()
+            ExternalQueryCache.objects.all().delete()
+            results["refresh (cold cache)"].append(self.timed(refresh_user_recommendations, user))
+            results["refresh (warm cache)"].append(self.timed(refresh_user_recommendations, user))
+            results["main_page"].append(self.timed(client.get, reverse('main')))
+            word = WORDS[i % len(WORDS)]
+            results["translate_and_define"].append(self.timed(client.get, reverse('translate_define'), {'word': word}))
+        return results
+
+    def timed(self, func, *args):
+        started = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - started
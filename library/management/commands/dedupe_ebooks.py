@@ -0,0 +1,25 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from library import blobs
+from library.models import EbookFile
+
+
+class Command(BaseCommand):
+    help = "Moves ebooks uploaded before the blob store into it, keeping one copy per content."
+
+    def handle(self, *args, **options):
+        moved = missing = 0
+        for ebook in EbookFile.objects.filter(blob__isnull=True).exclude(file=''):
+            old_name = ebook.file.name
+            if not default_storage.exists(old_name):
+                missing += 1
+                continue
+            with blobs.discard_on_rollback(), transaction.atomic(), default_storage.open(old_name, 'rb') as handle:
+                blob = blobs.acquire(handle)
+                # update() keeps the save signals from treating this as a new upload.
+                EbookFile.objects.filter(id=ebook.id).update(blob=blob, file=blob.file.name)
+            default_storage.delete(old_name)
+            moved += 1
+        self.stdout.write(f"Moved {moved} ebook(s) into the blob store, {missing} file(s) missing.")
@@ -0,0 +1,80 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from library.offline_dictionary import normalize_key, write_bundle
+
+
+def _read_jsonl(handle):
+    # Accepts Wiktionary extracts ({"word", "pos", "senses": [{"glosses"}]})
+    # and dictionaryapi.dev entries ({"word", "meanings"}), one per line.
+    for line in handle:
+        line = line.strip()
+        if not line:
+            continue
+        entry = json.loads(line)
+        word = entry.get('word', '')
+        if 'meanings' in entry:
+            for meaning in entry['meanings']:
+                for d in meaning.get('definitions', []):
+                    yield word, meaning.get('partOfSpeech', ''), d.get('definition', '')
+        else:
+            for sense in entry.get('senses', []):
+                for gloss in sense.get('glosses', [])[:1]:
+                    yield word, entry.get('pos', ''), gloss
+
+
+def _read_tsv(handle):
+    # word <tab> part of speech <tab> definition
+    for row in csv.reader(handle, delimiter='\t'):
+        if len(row) >= 3:
+            yield row[0], row[1], row[2]
+
+
+class Command(BaseCommand):
+    help = "Builds the offline dictionary bundle from a JSON Lines or TSV dump."
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help="Path to the dictionary dump.")
+        parser.add_argument('--format', choices=['jsonl', 'tsv'], help="Defaults to the file extension.")
+        parser.add_argument('--output', help="Bundle path (defaults to OFFLINE_DICTIONARY_PATH).")
+        parser.add_argument(
+            '--max-definitions', type=int, default=10,
+            help="Definitions kept per part of speech.",
+        )
+
+    def handle(self, *args, **options):
+        source = options['source']
+        output = options['output'] or settings.OFFLINE_DICTIONARY_PATH
+        if not output:
+            raise CommandError("Set OFFLINE_DICTIONARY_PATH or pass --output.")
+
+        file_format = options['format'] or ('tsv' if source.endswith('.tsv') else 'jsonl')
+        reader = _read_tsv if file_format == 'tsv' else _read_jsonl
+
+        words = {}
+        try:
+            with open(source, encoding='utf-8') as handle:
+                for word, part, definition in reader(handle):
+                    key = normalize_key(word)
+                    definition = definition.strip()
+                    if not key or not definition:
+                        continue
+                    parts = words.setdefault(key, {})
+                    definitions = parts.setdefault(part.strip().lower(), [])
+                    if len(definitions) < options['max_definitions'] and definition not in definitions:
+                        definitions.append(definition)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Could not read {source}: {exc}")
+
+        entries = {
+            key: [
+                {'partOfSpeech': part, 'definitions': [{'definition': d} for d in definitions]}
+                for part, definitions in parts.items()
+            ]
+            for key, parts in words.items()
+        }
+        count = write_bundle(output, entries)
+        self.stdout.write(f"Wrote {count} word(s) to {output}.")
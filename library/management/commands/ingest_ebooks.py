@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from library.ingestion import ingest_ebook
+from library.models import EbookFile
+
+
+class Command(BaseCommand):
+    help = "Extracts page count, page text and metadata from uploaded ebooks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Ingest every ebook again.")
+        parser.add_argument('--book', type=int, help="Ingest the ebook of a single book by id.")
+
+    def handle(self, *args, **options):
+        ebooks = EbookFile.objects.all()
+        if options['book']:
+            ebooks = ebooks.filter(book_id=options['book'])
+        elif not options['all']:
+            ebooks = ebooks.exclude(ingest_status='done')
+        # Ebooks a worker is processing right now are left to it.
+        ebooks = ebooks.exclude(ingest_status='processing')
+        ebooks.update(ingest_status='pending')
+
+        done = failed = 0
+        for ebook_id in ebooks.values_list('id', flat=True):
+            if ingest_ebook(ebook_id) is None:
+                failed += 1
+            else:
+                done += 1
+        self.stdout.write(f"Ingested {done} ebook(s), {failed} failed.")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from library import search
+from library.models import Book, Chapter, EbookFile, JournalEntry, SavedQuote, SearchDocument
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search documents from books, pages, quotes, notes and chapters."
+
+    def handle(self, *args, **options):
+        SearchDocument.objects.all().delete()
+        for book in Book.objects.exclude(description='').iterator():
+            search.index_book(book)
+        for ebook in EbookFile.objects.filter(ingest_status='done').select_related('book').iterator():
+            search.index_pages(ebook)
+        for quote in SavedQuote.objects.select_related('book').iterator():
+            search.index_quote(quote)
+        for note in JournalEntry.objects.select_related('book').iterator():
+            search.index_note(note)
+        for chapter in Chapter.objects.select_related('mybook').iterator():
+            search.index_chapter(chapter)
+        self.stdout.write(f"Indexed {SearchDocument.objects.count()} document(s).")
@@ -0,0 +1,49 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from library.recommendations import refresh_user_recommendations
+
+
+class Command(BaseCommand):
+    help = "Rebuilds precomputed recommendations that are missing, stale or too old."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Refresh every user with read books.")
+        parser.add_argument('--user', help="Refresh a single user by username.")
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help="Keep running and check again every N seconds.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            refreshed = 0
+            for user in self.users_to_refresh(options):
+                refresh_user_recommendations(user)
+                refreshed += 1
+            self.stdout.write(f"Refreshed recommendations for {refreshed} user(s).")
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def users_to_refresh(self, options):
+        users = User.objects.filter(book__status='read').distinct()
+
+        if options['user']:
+            return users.filter(username=options['user'])
+        if options['all']:
+            return users
+
+        cutoff = timezone.now() - timedelta(seconds=settings.RECOMMENDATIONS_MAX_AGE)
+        return users.filter(
+            Q(recommendation__isnull=True)
+            | Q(recommendation__is_stale=True)
+            | Q(recommendation__refreshed_at__lt=cutoff)
+        )
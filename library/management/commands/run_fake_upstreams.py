@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from library.fake_upstreams import FakeUpstreamConfig, FakeUpstreamServer
+
+
+def add_config_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0.1, help="Mean response delay in seconds.")
+    parser.add_argument('--jitter', type=float, default=0.03, help="Random +/- delay in seconds.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with 503.")
+    parser.add_argument('--items', type=int, default=10, help="Volumes returned per Google Books query.")
+    parser.add_argument('--definitions', type=int, default=3, help="Definitions per part of speech.")
+    parser.add_argument('--description-size', type=int, default=300, help="Characters per volume description.")
+
+
+def config_from_options(options):
+    return FakeUpstreamConfig(
+        latency=options['latency'],
+        jitter=options['jitter'],
+        error_rate=options['error_rate'],
+        items=options['items'],
+        definitions=options['definitions'],
+        description_size=options['description_size'],
+    )
+
+
+class Command(BaseCommand):
+    help = "Serves stand-ins for the Google Books, dictionaryapi.dev and translation APIs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        add_config_arguments(parser)
+
+    def handle(self, *args, **options):
+        server = FakeUpstreamServer(options['host'], options['port'], config_from_options(options))
+        self.stdout.write("Fake upstreams listening. Use these settings:")
+        for name, value in server.upstream_settings().items():
+            self.stdout.write(f"    {name} = {value!r}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
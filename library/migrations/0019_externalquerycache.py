@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0018_alter_book_pdf_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExternalQueryCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('url', models.CharField(max_length=500)),
+                ('params', models.JSONField(default=dict)),
+                ('payload', models.JSONField(default=list)),
+                ('fetched_at', models.DateTimeField()),
+                ('last_accessed', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
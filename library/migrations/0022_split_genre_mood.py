@@ -0,0 +1,51 @@
+from django.db import migrations
+
+
+def split(value):
+    names = []
+    for part in (value or '').split(','):
+        name = part.strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def split_genre_and_mood(apps, schema_editor):
+    Book = apps.get_model('library', 'Book')
+    Genre = apps.get_model('library', 'Genre')
+    Mood = apps.get_model('library', 'Mood')
+
+    genres = {}
+    moods = {}
+    genre_links = []
+    mood_links = []
+
+    for book in Book.objects.only('id', 'genre', 'mood').iterator():
+        for name in split(book.genre):
+            if name not in genres:
+                genres[name] = Genre.objects.get_or_create(name=name)[0]
+            genre_links.append(Book.genres.through(book_id=book.id, genre_id=genres[name].id))
+        for name in split(book.mood):
+            if name not in moods:
+                moods[name] = Mood.objects.get_or_create(name=name)[0]
+            mood_links.append(Book.moods.through(book_id=book.id, mood_id=moods[name].id))
+
+    Book.genres.through.objects.bulk_create(genre_links, batch_size=500, ignore_conflicts=True)
+    Book.moods.through.objects.bulk_create(mood_links, batch_size=500, ignore_conflicts=True)
+
+
+def clear_links(apps, schema_editor):
+    Book = apps.get_model('library', 'Book')
+    Book.genres.through.objects.all().delete()
+    Book.moods.through.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0021_genre_mood'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_genre_and_mood, clear_links),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0022_split_genre_mood'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='normalized_title',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+    ]
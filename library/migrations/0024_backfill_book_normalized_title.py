@@ -0,0 +1,32 @@
+import unicodedata
+
+from django.db import migrations
+
+
+def normalize_title(title):
+    folded = unicodedata.normalize('NFKC', title or '').casefold()
+    return ''.join(ch for ch in folded if ch.isalnum())
+
+
+def backfill_normalized_title(apps, schema_editor):
+    Book = apps.get_model('library', 'Book')
+    batch = []
+    for book in Book.objects.only('id', 'title').iterator():
+        book.normalized_title = normalize_title(book.title)
+        batch.append(book)
+        if len(batch) >= 500:
+            Book.objects.bulk_update(batch, ['normalized_title'])
+            batch = []
+    if batch:
+        Book.objects.bulk_update(batch, ['normalized_title'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0023_book_normalized_title'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_normalized_title, migrations.RunPython.noop),
+    ]
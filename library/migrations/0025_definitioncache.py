@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0024_backfill_book_normalized_title'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DefinitionCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('word', models.CharField(max_length=100)),
+                ('source_lang', models.CharField(max_length=10)),
+                ('target_lang', models.CharField(max_length=10)),
+                ('payload', models.JSONField(default=dict)),
+                ('fetched_at', models.DateTimeField()),
+                ('last_accessed', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'unique_together': {('word', 'source_lang', 'target_lang')},
+            },
+        ),
+        migrations.AddField(
+            model_name='wordlookup',
+            name='entry',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lookups', to='library.definitioncache'),
+        ),
+    ]
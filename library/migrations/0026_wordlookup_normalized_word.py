@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0025_definitioncache'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wordlookup',
+            name='normalized_word',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='wordlookup',
+            index=models.Index(fields=['user', 'normalized_word'], name='library_wor_user_id_578346_idx'),
+        ),
+    ]
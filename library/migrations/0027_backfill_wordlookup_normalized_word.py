@@ -0,0 +1,156 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+# A frozen copy of library.text_normalization.word_key, so that later changes
+# to the live normaliser do not change what this migration writes. Rows saved
+# afterwards get their key from WordLookup.save().
+
+# Inner hyphens and apostrophes are kept ("well-known", "don't"); anything
+# else that is not a letter or digit is dropped.
+_STRIP_RE = re.compile(r"[^\w'\-]+|_")
+_EDGE_CHARS = "'-"
+
+ENGLISH_IRREGULAR = {
+    'am': 'be', 'is': 'be', 'are': 'be', 'was': 'be', 'were': 'be', 'been': 'be', 'being': 'be',
+    'has': 'have', 'had': 'have', 'having': 'have',
+    'does': 'do', 'did': 'do', 'done': 'do', 'doing': 'do',
+    'goes': 'go', 'went': 'go', 'gone': 'go', 'going': 'go',
+    'ran': 'run', 'runs': 'run', 'running': 'run',
+    'came': 'come', 'coming': 'come', 'seen': 'see', 'seeing': 'see',
+    'took': 'take', 'taken': 'take', 'gave': 'give', 'given': 'give', 'giving': 'give',
+    'made': 'make', 'knew': 'know', 'known': 'know', 'thought': 'think',
+    'told': 'tell', 'said': 'say', 'says': 'say', 'found': 'find', 'got': 'get', 'gotten': 'get',
+    'wrote': 'write', 'written': 'write', 'writing': 'write', 'spoke': 'speak', 'spoken': 'speak',
+    'ate': 'eat', 'eaten': 'eat', 'began': 'begin', 'begun': 'begin', 'brought': 'bring',
+    'bought': 'buy', 'caught': 'catch', 'taught': 'teach', 'felt': 'feel', 'kept': 'keep',
+    'lost': 'lose', 'meant': 'mean', 'met': 'meet', 'paid': 'pay',
+    'sat': 'sit', 'slept': 'sleep', 'stood': 'stand', 'understood': 'understand',
+    'won': 'win', 'wore': 'wear', 'worn': 'wear', 'drove': 'drive', 'driven': 'drive',
+    'fell': 'fall', 'fallen': 'fall', 'flew': 'fly', 'flown': 'fly', 'grew': 'grow', 'grown': 'grow',
+    'rose': 'rise', 'risen': 'rise', 'sang': 'sing', 'sung': 'sing', 'swam': 'swim',
+    'threw': 'throw', 'thrown': 'throw', 'broke': 'break', 'broken': 'break',
+    'chose': 'choose', 'chosen': 'choose', 'forgot': 'forget', 'forgotten': 'forget',
+    'hid': 'hide', 'hidden': 'hide', 'lay': 'lie', 'lain': 'lie', 'led': 'lead', 'heard': 'hear',
+    'held': 'hold', 'built': 'build', 'sent': 'send', 'spent': 'spend', 'fought': 'fight',
+    'children': 'child', 'men': 'man', 'women': 'woman', 'people': 'person', 'feet': 'foot',
+    'teeth': 'tooth', 'mice': 'mouse', 'geese': 'goose', 'lives': 'life', 'wives': 'wife',
+    'knives': 'knife', 'leaves': 'leaf', 'wolves': 'wolf', 'halves': 'half', 'shelves': 'shelf',
+    'better': 'good', 'best': 'good', 'worse': 'bad', 'worst': 'bad',
+}
+
+# Words the suffix rules would mangle ("evening" -> "even", "news" -> "new").
+# Lemmas are only a fallback for lookups, but these should not even get one.
+ENGLISH_UNINFLECTED = {
+    'always', 'anything', 'ceiling', 'during', 'evening', 'everything', 'king', 'morning',
+    'news', 'nothing', 'perhaps', 'series', 'something', 'species', 'spring', 'string',
+    'thing', 'towards', 'wedding', 'wicked', 'sometimes', 'nowadays', 'afterwards',
+    'building', 'feeling', 'meaning', 'painting', 'learning', 'ring', 'sibling', 'pudding',
+}
+
+_VOWELS = set('aeiou')
+_KEEP_DOUBLE = set('lsz')
+
+# Definite articles first, then plural and gender endings; one of each is
+# stripped so "котката", "котки" and "котките" all become "котк".
+BULGARIAN_ARTICLES = ('ът', 'ят', 'та', 'то', 'те', 'ия')
+BULGARIAN_ENDINGS = ('ища', 'ове', 'еве', 'и', 'а', 'я', 'о', 'е')
+
+
+def fold(text):
+    text = unicodedata.normalize('NFKC', text).casefold()
+    words = (_STRIP_RE.sub('', part).strip(_EDGE_CHARS) for part in text.split())
+    return ' '.join(word for word in words if word)
+
+
+def _is_cvc(stem):
+    return (
+        len(stem) == 3
+        and stem[0] not in _VOWELS
+        and stem[1] in _VOWELS
+        and stem[2] not in _VOWELS | set('wxy')
+    )
+
+
+def _undo_suffix(stem):
+    # "running" -> "run", "hoped" -> "hope", "walked" -> "walk".
+    if len(stem) > 2 and stem[-1] == stem[-2] and stem[-1] not in _VOWELS | _KEEP_DOUBLE:
+        return stem[:-1]
+    if _is_cvc(stem):
+        return stem + 'e'
+    return stem
+
+
+def lemmatize_en(word):
+    if word in ENGLISH_IRREGULAR:
+        return ENGLISH_IRREGULAR[word]
+    if len(word) < 4 or not word.isalpha() or word in ENGLISH_UNINFLECTED:
+        return word
+
+    if word.endswith('ies') or word.endswith('ied'):
+        return word[:-3] + 'y'
+    if word.endswith('ing') and len(word) > 5:
+        return _undo_suffix(word[:-3])
+    if word.endswith('ed') and len(word) > 4:
+        return _undo_suffix(word[:-2])
+    if word.endswith(('sses', 'xes', 'ches', 'shes', 'zes')):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def stem_bg(word):
+    if ' ' in word:
+        return word
+    for suffixes in (BULGARIAN_ARTICLES, BULGARIAN_ENDINGS):
+        for suffix in suffixes:
+            if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+                word = word[:-len(suffix)]
+                break
+    return word
+
+
+def detect_language(word):
+    is_cyrillic = all('а' <= c.lower() <= 'я' for c in word if c.isalpha())
+    return 'bg' if is_cyrillic else 'en'
+
+
+def normalize(word, lang):
+    # Groups inflected forms of a word (a reader's lookup history, lemma
+    # fallbacks). Too aggressive to identify a word on its own.
+    folded = fold(word)
+    if lang == 'bg':
+        return stem_bg(folded)
+    if lang == 'en' and ' ' not in folded:
+        return lemmatize_en(folded)
+    return folded
+
+
+def word_key(word):
+    return normalize(word, detect_language(word))
+
+
+def backfill_normalized_word(apps, schema_editor):
+    WordLookup = apps.get_model('library', 'WordLookup')
+    batch = []
+    for lookup in WordLookup.objects.only('id', 'word').iterator():
+        lookup.normalized_word = word_key(lookup.word)[:100]
+        batch.append(lookup)
+        if len(batch) >= 500:
+            WordLookup.objects.bulk_update(batch, ['normalized_word'])
+            batch = []
+    if batch:
+        WordLookup.objects.bulk_update(batch, ['normalized_word'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0026_wordlookup_normalized_word'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_normalized_word, migrations.RunPython.noop),
+    ]
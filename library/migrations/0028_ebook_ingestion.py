@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0027_backfill_wordlookup_normalized_word'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ebookfile',
+            name='ingest_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='ebookfile',
+            name='ingest_status',
+            field=models.CharField(choices=[('pending', 'Чака обработка'), ('processing', 'Обработва се'), ('done', 'Обработена'), ('failed', 'Грешка при обработка')], db_index=True, default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='ebookfile',
+            name='ingested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ebookfile',
+            name='metadata',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='ebookfile',
+            name='page_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='PageText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.PositiveIntegerField()),
+                ('text', models.TextField(blank=True)),
+                ('ebook', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='library.ebookfile')),
+            ],
+            options={
+                'unique_together': {('ebook', 'page_number')},
+            },
+        ),
+    ]
@@ -0,0 +1,78 @@
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE library_searchdocument_fts USING fts5(
+        title, body,
+        content='library_searchdocument', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER library_searchdocument_ai AFTER INSERT ON library_searchdocument BEGIN
+        INSERT INTO library_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    """CREATE TRIGGER library_searchdocument_ad AFTER DELETE ON library_searchdocument BEGIN
+        INSERT INTO library_searchdocument_fts(library_searchdocument_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    """CREATE TRIGGER library_searchdocument_au AFTER UPDATE ON library_searchdocument BEGIN
+        INSERT INTO library_searchdocument_fts(library_searchdocument_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO library_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    "INSERT INTO library_searchdocument_fts(library_searchdocument_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS library_searchdocument_ai",
+    "DROP TRIGGER IF EXISTS library_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS library_searchdocument_au",
+    "DROP TABLE IF EXISTS library_searchdocument_fts",
+]
+
+POSTGRES_FORWARD = [
+    """CREATE INDEX library_searchdocument_tsv ON library_searchdocument
+       USING GIN (to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(body, '')))""",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS library_searchdocument_tsv",
+]
+
+
+def _run(schema_editor, statements):
+    with schema_editor.connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def create_index(apps, schema_editor):
+    # Other databases (or SQLite builds without FTS5) use the basic backend.
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            try:
+                cursor.execute("CREATE VIRTUAL TABLE temp.library_fts5_probe USING fts5(x)")
+            except Exception:
+                return
+            cursor.execute("DROP TABLE temp.library_fts5_probe")
+        _run(schema_editor, SQLITE_FORWARD)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_FORWARD)
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _run(schema_editor, SQLITE_BACKWARD)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_BACKWARD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0029_searchdocument'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
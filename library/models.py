@@ -1,8 +1,52 @@
-from django.db import models
+import unicodedata
+import uuid
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from .text_normalization import word_key
+
+def normalize_title(title):
+    # Case-folded, with whitespace and punctuation removed, so that
+    # "The Hobbit", "the  hobbit" and "The Hobbit." compare equal.
+    folded = unicodedata.normalize('NFKC', title or '').casefold()
+    return ''.join(ch for ch in folded if ch.isalnum())
+
+def split_tags(value):
+    names = []
+    for part in (value or '').split(','):
+        name = part.strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+class Tag(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        abstract = True
+        ordering = ['name']
+
+    @classmethod
+    def for_names(cls, names):
+        names = list(names)
+        existing = {tag.name: tag for tag in cls.objects.filter(name__in=names)}
+        missing = [cls(name=name) for name in names if name not in existing]
+        if missing:
+            cls.objects.bulk_create(missing, ignore_conflicts=True)
+            existing = {tag.name: tag for tag in cls.objects.filter(name__in=names)}
+        return [existing[name] for name in names]
+
+    def __str__(self):
+        return self.name
+
+class Genre(Tag):
+    pass
+
+class Mood(Tag):
+    pass
 
 class Book(models.Model):
     title = models.CharField(max_length=255)
+    normalized_title = models.CharField(max_length=255, blank=True, editable=False, db_index=True)
     author = models.CharField(max_length=255)
     genre = models.CharField(max_length=100, blank=True)
     mood = models.CharField(max_length=255, blank=True)
@@ -19,6 +63,35 @@ class Book(models.Model):
     cover_image = models.ImageField(upload_to='book_covers/', blank=True, null=True)
     description = models.TextField(blank=True)
     pdf_file = models.FileField(upload_to="ebooks/", blank=True, null=True)
+    genres = models.ManyToManyField(Genre, blank=True, related_name='books')
+    moods = models.ManyToManyField(Mood, blank=True, related_name='books')
+    # Tells other processes which books changed (see title_index and
+    # local_recommender).
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_genre = instance.__dict__.get('genre')
+        instance._loaded_mood = instance.__dict__.get('mood')
+        instance._loaded_searchable = (instance.__dict__.get('title'), instance.__dict__.get('description'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # genre/mood keep the comma-joined display value; the Genre/Mood
+        # relations are the indexed copy used for filtering and facets.
+        self.normalized_title = normalize_title(self.title)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'title' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'normalized_title', 'updated_at'}
+        super().save(*args, **kwargs)
+        if (getattr(self, '_loaded_genre', None) or '') != self.genre and (update_fields is None or 'genre' in update_fields):
+            self.genres.set(Genre.for_names(split_tags(self.genre)))
+            self._loaded_genre = self.genre
+        if (getattr(self, '_loaded_mood', None) or '') != self.mood and (update_fields is None or 'mood' in update_fields):
+            self.moods.set(Mood.for_names(split_tags(self.mood)))
+            self._loaded_mood = self.mood
 
     def __str__(self):
         return self.title
@@ -58,15 +131,90 @@ class SavedQuote(models.Model):
     def __str__(self):
         return f'"{self.quote_text[:30]}..." (p.{self.page})'
 
+class EbookBlob(models.Model):
+    # One stored copy of an uploaded PDF, named by the SHA-256 of its bytes.
+    # ref_count is the number of EbookFile rows pointing at it; the file is
+    # deleted when the last one goes.
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='blobs/')
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
 class EbookFile(models.Model):
+    INGEST_STATUSES = [
+        ('pending', 'Чака обработка'),
+        ('processing', 'Обработва се'),
+        ('done', 'Обработена'),
+        ('failed', 'Грешка при обработка'),
+    ]
+
     book = models.OneToOneField(Book, on_delete=models.CASCADE, related_name='ebookfile')
 
     file = models.FileField(upload_to='ebooks/')
+    blob = models.ForeignKey(EbookBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='ebooks')
     last_page_read = models.TextField(default="", blank=True)
+    page_count = models.PositiveIntegerField(default=0)
+    metadata = models.JSONField(default=dict, blank=True)
+    ingest_status = models.CharField(max_length=20, choices=INGEST_STATUSES, default='pending', db_index=True)
+    ingest_error = models.TextField(blank=True)
+    ingested_at = models.DateTimeField(blank=True, null=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_file = instance.__dict__.get('file')
+        return instance
+
+    def file_changed(self):
+        return getattr(self, '_loaded_file', None) != self.file.name
+
+    def save(self, *args, **kwargs):
+        # The blob reference taken in pre_save only counts if the row is saved,
+        # and a blob file written for it is deleted if it is not.
+        from .blobs import discard_on_rollback
+        with discard_on_rollback(), transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Ebook for {self.book.title}"
 
+class ChunkedUpload(models.Model):
+    # A PDF sent in chunks to the upload endpoints. The bytes collect in a
+    # temporary file until add_book turns the finished upload into an ebook.
+    STATUSES = [
+        ('uploading', 'Качва се'),
+        ('complete', 'Качен'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chunked_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=20, choices=STATUSES, default='uploading')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+class PageText(models.Model):
+    # Text of one PDF page, extracted once at upload by the ingestion job.
+    ebook = models.ForeignKey(EbookFile, on_delete=models.CASCADE, related_name='pages')
+    page_number = models.PositiveIntegerField()
+    text = models.TextField(blank=True)
+
+    class Meta:
+        unique_together = ('ebook', 'page_number')
+
+    def __str__(self):
+        return f"{self.ebook} p. {self.page_number}"
+
 class MyBook(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=255)
@@ -83,14 +231,41 @@ class Chapter(models.Model):
     def __str__(self):
         return self.title
 
+class DefinitionCache(models.Model):
+    # Translated dictionary payload shared by all users, keyed on the
+    # normalized word and the language pair it was translated with.
+    word = models.CharField(max_length=100)
+    source_lang = models.CharField(max_length=10)
+    target_lang = models.CharField(max_length=10)
+    payload = models.JSONField(default=dict)
+    fetched_at = models.DateTimeField()
+    last_accessed = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('word', 'source_lang', 'target_lang')
+
+    def __str__(self):
+        return f"{self.word} ({self.source_lang}->{self.target_lang})"
+
 class WordLookup(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     word = models.CharField(max_length=100)
     definition = models.TextField()
+    entry = models.ForeignKey(DefinitionCache, on_delete=models.SET_NULL, blank=True, null=True, related_name='lookups')
+    normalized_word = models.CharField(max_length=100, blank=True, editable=False, db_index=True)
 
     class Meta:
         unique_together = ('user', 'word')  
+        indexes = [models.Index(fields=['user', 'normalized_word'])]
+
+    def save(self, *args, **kwargs):
+        # Groups inflected forms, so a search for any of them finds the lookup.
+        self.normalized_word = word_key(self.word)[:100]
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'word' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'normalized_word'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.word
@@ -110,5 +285,50 @@ class ReadingSession(models.Model):
     def __str__(self):
         return f"{self.user.username} – {self.book.title} ({self.start_time.strftime('%Y-%m-%d')})"
 
+class ExternalQueryCache(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    url = models.CharField(max_length=500)
+    params = models.JSONField(default=dict)
+    payload = models.JSONField(default=list)
+    fetched_at = models.DateTimeField()
+    last_accessed = models.DateTimeField(db_index=True)
 
+    def __str__(self):
+        return f"{self.url} {self.params}"
+
+class UserRecommendation(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='recommendation')
+    items = models.JSONField(default=list)
+    refreshed_at = models.DateTimeField(blank=True, null=True)
+    is_stale = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f"Recommendations for {self.user.username}"
 
+class SearchDocument(models.Model):
+    # One searchable piece of text a user owns: a PDF page, a quote, a note,
+    # a MyBook chapter or a book description. The full-text index is built
+    # over title and body (see library/search.py).
+    KINDS = [
+        ('page', 'Страница'),
+        ('quote', 'Цитат'),
+        ('note', 'Бележка'),
+        ('chapter', 'Глава'),
+        ('book', 'Книга'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.PositiveIntegerField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_documents')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, blank=True, null=True)
+    mybook = models.ForeignKey(MyBook, on_delete=models.CASCADE, blank=True, null=True)
+    page = models.PositiveIntegerField(blank=True, null=True)
+    title = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}: {self.title}"
@@ -0,0 +1,109 @@
+import json
+import mmap
+import os
+import struct
+import threading
+
+from django.conf import settings
+
+# Bundle layout: header, fixed-size index records sorted by key, the keys,
+# then one JSON payload (a list of meanings in the dictionaryapi.dev shape)
+# per word. Lookups binary-search the index straight from the mapping, so
+# every process reading the bundle shares it through the page cache.
+MAGIC = b'DLDICT01'
+HEADER = struct.Struct('<8sI')
+RECORD = struct.Struct('<QIQI')  # key offset, key length, payload offset, payload length
+
+
+def normalize_key(word):
+    return ' '.join(word.split()).casefold()
+
+
+def write_bundle(path, entries):
+    # entries: {word: meanings}. Written to a temporary file and moved into
+    # place, so processes that still map the old bundle are not disturbed.
+    items = sorted((normalize_key(word).encode('utf-8'), meanings) for word, meanings in entries.items())
+    keys_start = HEADER.size + RECORD.size * len(items)
+    payloads_start = keys_start + sum(len(key) for key, _ in items)
+
+    records, key_offset, payload_offset, payloads = [], keys_start, payloads_start, []
+    for key, meanings in items:
+        payload = json.dumps(meanings, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        records.append(RECORD.pack(key_offset, len(key), payload_offset, len(payload)))
+        payloads.append(payload)
+        key_offset += len(key)
+        payload_offset += len(payload)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as handle:
+        handle.write(HEADER.pack(MAGIC, len(items)))
+        handle.writelines(records)
+        handle.writelines(key for key, _ in items)
+        handle.writelines(payloads)
+    os.replace(tmp_path, path)
+    return len(items)
+
+
+class OfflineDictionary:
+    def __init__(self, path):
+        with open(path, 'rb') as handle:
+            self.mtime = os.fstat(handle.fileno()).st_mtime
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a dictionary bundle")
+
+    def _record(self, index):
+        return RECORD.unpack_from(self._map, HEADER.size + index * RECORD.size)
+
+    def get(self, word):
+        key = normalize_key(word).encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            key_offset, key_length, payload_offset, payload_length = self._record(middle)
+            current = self._map[key_offset:key_offset + key_length]
+            if current == key:
+                return json.loads(self._map[payload_offset:payload_offset + payload_length])
+            if current < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._map.close()
+
+
+_dictionary = None
+_lock = threading.Lock()
+
+
+def get_dictionary():
+    # Opens the configured bundle once per process and reopens it after
+    # import_dictionary has replaced the file.
+    global _dictionary
+    path = settings.OFFLINE_DICTIONARY_PATH
+    if not path or not os.path.exists(path):
+        return None
+
+    with _lock:
+        if _dictionary is None or os.path.getmtime(path) != _dictionary.mtime:
+            _dictionary = OfflineDictionary(path)
+        return _dictionary
+
+
+def lookup(word):
+    # Meanings for an English word, or None when it is not in the bundle.
+    dictionary = get_dictionary()
+    return dictionary.get(word) if dictionary is not None else None
+
+
+def reset():
+    global _dictionary
+    with _lock:
+        _dictionary = None
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import jobs
+from .models import ExternalQueryCache
+
+
+class LRUCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CacheEntry(namedtuple('CacheEntry', ['payload', 'fetched_at', 'touched_at'], defaults=(None,))):
+    # touched_at is when this process last bumped the row's last_accessed.
+    def age(self):
+        return (timezone.now() - self.fetched_at).total_seconds()
+
+    def is_fresh(self):
+        return self.age() < settings.QUERY_CACHE_TTL
+
+    def is_usable(self):
+        return self.age() < settings.QUERY_CACHE_TTL + settings.QUERY_CACHE_STALE_TTL
+
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+def _get_memory():
+    # Created on first use, so QUERY_CACHE_MEMORY_SIZE is read from the
+    # settings in effect then rather than at import time.
+    global _memory
+    with _memory_lock:
+        if _memory is None:
+            _memory = LRUCache(settings.QUERY_CACHE_MEMORY_SIZE)
+        return _memory
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return ' '.join(value.split()).casefold()
+    return value
+
+
+def normalize_params(params):
+    return {name: _normalize(value) for name, value in sorted(params.items())}
+
+
+def make_key(url, params):
+    raw = json.dumps([url, normalize_params(params)], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def lookup_many(url, param_sets):
+    # Memory first, then a single query for everything the LRU did not have.
+    # An entry that is stale in memory is read again too, since another
+    # process may have refreshed the row; it is kept only if the row is not
+    # newer. Memory hits bump the row's last_accessed too, at most once per
+    # QUERY_CACHE_TOUCH_INTERVAL, so entries hot in memory are not the first
+    # to be evicted from the table.
+    memory = _get_memory()
+    keys = [make_key(url, params) for params in param_sets]
+    now = timezone.now()
+    found = {}
+    missing = []
+    touched = []
+    for key in keys:
+        entry = memory.get(key)
+        if entry is None or not entry.is_fresh():
+            missing.append(key)
+            if entry is not None:
+                found[key] = entry
+            continue
+        if entry.touched_at is None or (now - entry.touched_at).total_seconds() >= settings.QUERY_CACHE_TOUCH_INTERVAL:
+            entry = entry._replace(touched_at=now)
+            memory.set(key, entry)
+            touched.append(key)
+        found[key] = entry
+
+    if missing:
+        rows = list(ExternalQueryCache.objects.filter(key__in=missing))
+        for row in rows:
+            if row.key in found and found[row.key].fetched_at >= row.fetched_at:
+                continue
+            entry = CacheEntry(row.payload, row.fetched_at, now)
+            memory.set(row.key, entry)
+            found[row.key] = entry
+        touched += [row.key for row in rows]
+    if touched:
+        ExternalQueryCache.objects.filter(key__in=touched).update(last_accessed=now)
+
+    return found
+
+
+def lookup(url, params):
+    return lookup_many(url, [params]).get(make_key(url, params))
+
+
+def store(url, params, payload):
+    key = make_key(url, params)
+    now = timezone.now()
+    _get_memory().set(key, CacheEntry(payload, now, now))
+    ExternalQueryCache.objects.update_or_create(
+        key=key,
+        defaults={
+            'url': url,
+            'params': normalize_params(params),
+            'payload': payload,
+            'fetched_at': now,
+            'last_accessed': now,
+        },
+    )
+    if _evict_due():
+        _evict()
+
+
+_last_evict = None
+_evict_lock = threading.Lock()
+
+
+def _evict_due():
+    # Counting the table on every store is wasted work; each process trims it
+    # at most once per QUERY_CACHE_EVICT_INTERVAL and lets it run a little
+    # over QUERY_CACHE_DB_SIZE in between.
+    global _last_evict
+    now = time.monotonic()
+    with _evict_lock:
+        if _last_evict is not None and now - _last_evict < settings.QUERY_CACHE_EVICT_INTERVAL:
+            return False
+        _last_evict = now
+        return True
+
+
+def _evict():
+    excess = ExternalQueryCache.objects.count() - settings.QUERY_CACHE_DB_SIZE
+    if excess > 0:
+        oldest = ExternalQueryCache.objects.order_by('last_accessed').values_list('id', flat=True)[:excess]
+        ExternalQueryCache.objects.filter(id__in=list(oldest)).delete()
+
+
+def revalidate(url, params, fetch):
+    # Stale-while-revalidate: the caller keeps serving the stale payload and a
+    # background job refreshes the entry, at most one per key at a time.
+    def refresh():
+        store(url, params, fetch())
+
+    jobs.enqueue(refresh, dedupe_key=('query_cache', make_key(url, params)))
+
+
+def clear_memory():
+    # Dropped rather than emptied, so the next use picks up the current size.
+    global _memory
+    with _memory_lock:
+        _memory = None
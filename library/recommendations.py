@@ -0,0 +1,345 @@
+import time
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import timedelta
+from functools import partial
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from . import http_client, jobs, local_recommender, query_cache, singleflight, title_index
+from .models import Book, UserRecommendation, normalize_title
+
+RECOMMENDATIONS_LIMIT = 10
+
+# Floor for a request's timeout when the batch deadline is (nearly) spent.
+MIN_REQUEST_TIMEOUT = 0.1
+
+
+def _fetch_google_books(params, timeout=None):
+    response = http_client.get(settings.GOOGLE_BOOKS_API_URL, params=params, timeout=timeout)
+    response.raise_for_status()
+    return response.json().get('items', [])
+
+
+def _timeout_until(deadline):
+    # The host's usual (connect, read) timeout, cut down to what is left of
+    # the batch's deadline.
+    policy = http_client.get_policy(urlsplit(settings.GOOGLE_BOOKS_API_URL).hostname or '')
+    timeout = policy['timeout'] if isinstance(policy['timeout'], tuple) else (policy['timeout'],) * 2
+    remaining = max(deadline - time.monotonic(), MIN_REQUEST_TIMEOUT)
+    return tuple(min(part, remaining) for part in timeout)
+
+
+def _fetch_google_books_shared(params, deadline):
+    # Concurrent refreshes asking the same query share one request. A process
+    # that had to wait for another one reads its result from the query cache.
+    url = settings.GOOGLE_BOOKS_API_URL
+
+    def recheck():
+        try:
+            entry = query_cache.lookup(url, params)
+        finally:
+            connection.close()
+        return entry.payload if entry is not None and entry.is_fresh() else None
+
+    key = ('google_books', query_cache.make_key(url, params))
+    fetch = partial(_fetch_google_books, params, timeout=_timeout_until(deadline))
+    return singleflight.do(key, fetch, recheck=recheck)
+
+
+def _store_late_answer(params, future):
+    # Runs on the worker thread once a request the batch gave up on finishes,
+    # so its answer still warms the cache for the next refresh.
+    if future.cancelled() or future.exception() is not None:
+        return
+    try:
+        query_cache.store(settings.GOOGLE_BOOKS_API_URL, params, future.result())
+    finally:
+        connection.close()
+
+
+def _fan_out_google_books(param_sets, on_items, deadline):
+    # Runs the queries on a bounded pool and hands each result to on_items as
+    # soon as it arrives. Stops when on_items returns True or the deadline
+    # passes; whatever is still queued is cancelled, and requests already in
+    # flight were given a timeout no longer than the time left.
+    if not param_sets:
+        return
+
+    executor = ThreadPoolExecutor(max_workers=min(settings.GOOGLE_BOOKS_MAX_WORKERS, len(param_sets)))
+    pending = {executor.submit(_fetch_google_books_shared, params, deadline): params for params in param_sets}
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                params = pending.pop(future)
+                try:
+                    items = future.result()
+                except (requests.RequestException, ValueError):
+                    continue
+                query_cache.store(settings.GOOGLE_BOOKS_API_URL, params, items)
+                if on_items(params, items):
+                    return
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        for future, params in pending.items():
+            future.add_done_callback(partial(_store_late_answer, params))
+
+
+def _query_google_books(param_sets, on_items, deadline):
+    # Cached answers are served straight away (stale ones are refreshed in the
+    # background); only the misses go out to the network.
+    cached = query_cache.lookup_many(settings.GOOGLE_BOOKS_API_URL, param_sets)
+    misses = []
+    for params in param_sets:
+        entry = cached.get(query_cache.make_key(settings.GOOGLE_BOOKS_API_URL, params))
+        if entry is None or not entry.is_usable():
+            misses.append(params)
+            continue
+        if not entry.is_fresh():
+            query_cache.revalidate(settings.GOOGLE_BOOKS_API_URL, params, partial(_fetch_google_books, params))
+        if on_items(params, entry.payload):
+            return
+
+    _fan_out_google_books(misses, on_items, deadline)
+
+
+Signal = namedtuple('Signal', ['kind', 'value', 'weight'])
+
+QUERY_PREFIXES = {'author': 'inauthor:', 'genre': 'subject:', 'mood': ''}
+
+# Books with no reading sessions vote as if last read two half-lives ago.
+UNDATED_VOTE = 0.25
+
+
+def weigh_signals(read_books):
+    # Every read book votes for its author, genres and moods. A vote halves
+    # every RECOMMENDATION_RECENCY_HALF_LIFE days since the book was last read,
+    # so frequent and recent tastes float to the top.
+    books = (
+        Book.objects.filter(id__in=read_books.values('id'))
+        .annotate(last_read=Max('readingsession__start_time'))
+        .prefetch_related('genres', 'moods')
+    )
+    now = timezone.now()
+    half_life = settings.RECOMMENDATION_RECENCY_HALF_LIFE * 24 * 60 * 60
+    votes = {kind: Counter() for kind in QUERY_PREFIXES}
+
+    for book in books:
+        if book.last_read:
+            vote = 0.5 ** (max((now - book.last_read).total_seconds(), 0) / half_life)
+        else:
+            vote = UNDATED_VOTE
+        if book.author.strip():
+            votes['author'][book.author.strip()] += vote
+        for genre in book.genres.all():
+            votes['genre'][genre.name] += vote
+        for mood in book.moods.all():
+            votes['mood'][mood.name] += vote
+
+    signals = {}
+    for kind, counter in votes.items():
+        ranked = sorted(counter.items(), key=lambda pair: (-pair[1], pair[0]))
+        signals[kind] = [Signal(kind, value, weight) for value, weight in ranked[:settings.RECOMMENDATION_SIGNAL_LIMITS[kind]]]
+    return signals
+
+
+def plan_queries(signals):
+    # One combined OR query per signal kind, so a refresh never makes more
+    # than three calls (plus the fallback) however large the library is.
+    plans = []
+    for kind, prefix in QUERY_PREFIXES.items():
+        group = signals.get(kind)
+        if not group:
+            continue
+        terms = [f'{prefix}"{signal.value}"' if prefix else signal.value for signal in group]
+        params = {
+            'q': ' OR '.join(terms),
+            'maxResults': settings.GOOGLE_BOOKS_PLANNED_MAX_RESULTS,
+            'printType': 'books',
+            'langRestrict': 'bg',
+        }
+        plans.append((params, group))
+    return plans
+
+
+def match_signal(volume_info, group):
+    # Works out which of the merged signals a result belongs to. When nothing
+    # matches explicitly the query's strongest signal gets the credit.
+    kind = group[0].kind
+    if kind == 'author':
+        haystack = [author.casefold() for author in volume_info.get('authors', [])]
+    elif kind == 'genre':
+        haystack = [' '.join(volume_info.get('categories', [])).casefold()]
+    else:
+        haystack = [f"{volume_info.get('title', '')} {volume_info.get('description', '')}".casefold()]
+
+    for signal in group:
+        value = signal.value.casefold()
+        if any(value in text for text in haystack):
+            return signal
+    return group[0]
+
+
+def interleave(buckets, limit):
+    # Weighted round-robin: each pick goes to the signal with the highest
+    # weight / (1 + items already taken from it).
+    taken = {signal: 0 for signal in buckets}
+    picked = []
+    while len(picked) < limit:
+        available = [signal for signal, items in buckets.items() if taken[signal] < len(items)]
+        if not available:
+            break
+        signal = max(available, key=lambda s: (s.weight / (1 + taken[s]), s.weight))
+        picked.append(buckets[signal][taken[signal]])
+        taken[signal] += 1
+    return picked
+
+
+def has_enough(buckets, open_signals, limit):
+    # True once answers to the queries still open could not change what
+    # interleave picks: every open signal already holds as many results as it
+    # would be given if its query came back with plenty.
+    virtual = OrderedDict(
+        (signal, [signal] * (limit if signal in open_signals else len(buckets.get(signal, []))))
+        for signal in list(buckets) + [signal for signal in open_signals if signal not in buckets]
+    )
+    wanted = Counter(interleave(virtual, limit))
+    return all(len(buckets.get(signal, [])) >= wanted[signal] for signal in open_signals)
+
+
+def _to_recommendation(volume_info):
+    return {
+        'title': volume_info.get('title'),
+        'authors': ', '.join(volume_info.get('authors', [])),
+        'description': volume_info.get('description', '')[:300],
+        'thumbnail': volume_info.get('imageLinks', {}).get('thumbnail', ''),
+        'link': volume_info.get('infoLink', '#')
+    }
+
+
+def get_google_books_recommendations(read_books):
+    # Books from the local catalog come first; Google Books only fills the
+    # slots the local engine could not.
+    recommendations = local_recommender.recommend(read_books, RECOMMENDATIONS_LIMIT)
+    needed = RECOMMENDATIONS_LIMIT - len(recommendations)
+    if needed <= 0:
+        return recommendations
+    seen_titles = {normalize_title(item['title']) for item in recommendations}
+
+    plans = plan_queries(weigh_signals(read_books))
+    groups = {params['q']: group for params, group in plans}
+    buckets = OrderedDict()
+
+    def fresh_volumes(items):
+        in_catalog = title_index.existing_titles(
+            item.get('volumeInfo', {}).get('title') for item in items
+        )
+        for item in items:
+            volume_info = item.get('volumeInfo', {})
+            key = normalize_title(volume_info.get('title'))
+            if key and key not in seen_titles and key not in in_catalog:
+                seen_titles.add(key)
+                yield volume_info
+
+    open_queries = set(groups)
+
+    def collect(params, items):
+        group = groups[params['q']]
+        open_queries.discard(params['q'])
+        for volume_info in fresh_volumes(items):
+            buckets.setdefault(match_signal(volume_info, group), []).append(_to_recommendation(volume_info))
+        open_signals = {signal for q in open_queries for signal in groups[q]}
+        return has_enough(buckets, open_signals, needed)
+
+    deadline = time.monotonic() + settings.GOOGLE_BOOKS_DEADLINE
+    _query_google_books([params for params, _ in plans], collect, deadline)
+    recommendations += interleave(buckets, needed)
+
+    if not recommendations:
+        fallback_params = {
+            'q': 'books',  
+            'maxResults': 10,
+            'printType': 'books',
+            'langRestrict': 'bg',
+        }
+
+        def collect_fallback(params, items):
+            recommendations.extend(_to_recommendation(v) for v in fresh_volumes(items))
+            return len(recommendations) >= RECOMMENDATIONS_LIMIT
+
+        _query_google_books([fallback_params], collect_fallback, deadline)
+
+    return recommendations[:RECOMMENDATIONS_LIMIT]
+
+
+def refresh_user_recommendations(user):
+    def rebuild():
+        read_books = Book.objects.filter(added_by=user, status='read')
+        items = get_google_books_recommendations(read_books) if read_books.exists() else []
+
+        recommendation, _ = UserRecommendation.objects.update_or_create(
+            user=user,
+            defaults={
+                'items': items,
+                'refreshed_at': timezone.now(),
+                'is_stale': False,
+            },
+        )
+        return recommendation
+
+    def recheck():
+        # Another process (the cron command or a worker) may have just done it.
+        recommendation = UserRecommendation.objects.filter(user=user).first()
+        if recommendation is not None and not needs_refresh(recommendation):
+            return recommendation
+        return None
+
+    return singleflight.do(('recommendations', user.id), rebuild, recheck=recheck)
+
+
+def _refresh_in_background(user_id):
+    user = User.objects.filter(id=user_id).first()
+    if user is not None:
+        refresh_user_recommendations(user)
+
+
+def schedule_refresh(user_id):
+    jobs.enqueue(_refresh_in_background, user_id, dedupe_key=('recommendations', user_id))
+
+
+def needs_refresh(recommendation):
+    if recommendation.is_stale or recommendation.refreshed_at is None:
+        return True
+    max_age = timedelta(seconds=settings.RECOMMENDATIONS_MAX_AGE)
+    return recommendation.refreshed_at < timezone.now() - max_age
+
+
+def get_user_recommendations(user):
+    # One indexed read on the request path. Missing or outdated entries are
+    # rebuilt by a background job; the page never waits for the network.
+    recommendation = UserRecommendation.objects.filter(user=user).first()
+
+    if recommendation is None:
+        if Book.objects.filter(added_by=user, status='read').exists():
+            schedule_refresh(user.id)
+            return [], True
+        return [], False
+
+    if needs_refresh(recommendation):
+        schedule_refresh(user.id)
+    return recommendation.items, False
+
+
+def mark_stale(user_id):
+    UserRecommendation.objects.filter(user_id=user_id).update(is_stale=True)
+    schedule_refresh(user_id)
@@ -0,0 +1,274 @@
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from . import file_responses, jobs, singleflight
+from .models import EbookFile
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever rasterizing or encoding changes, so old files are not reused.
+FORMAT_VERSION = 1
+FIRST_PAGE_SIZES = ('thumb', 'cover', 'page')
+
+
+class RenditionError(Exception):
+    pass
+
+
+class RasterizerUnavailable(RenditionError):
+    pass
+
+
+# Rasterizers. Each turns one page of a local PDF into a PIL image of the
+# requested width; PyMuPDF is used when installed, poppler's pdftoppm otherwise.
+
+def _rasterize_pymupdf(path, page, width):
+    import fitz
+
+    with fitz.open(path) as document:
+        if not 1 <= page <= document.page_count:
+            raise RenditionError(f"Page {page} is out of range")
+        pdf_page = document[page - 1]
+        zoom = width / pdf_page.rect.width
+        pixmap = pdf_page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+
+
+def _rasterize_pdftoppm(path, page, width):
+    command = [
+        settings.RENDITION_PDFTOPPM, '-f', str(page), '-l', str(page),
+        '-scale-to-x', str(width), '-scale-to-y', '-1', '-singlefile', '-png', path,
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, timeout=settings.RENDITION_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        raise RenditionError(f"pdftoppm timed out on page {page}")
+    if result.returncode != 0 or not result.stdout:
+        raise RenditionError(result.stderr.decode('utf-8', 'replace').strip() or f"pdftoppm failed on page {page}")
+    return Image.open(BytesIO(result.stdout))
+
+
+def _pymupdf_installed():
+    try:
+        import fitz  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_rasterizer():
+    name = settings.RENDITION_RASTERIZER
+    if name == 'auto':
+        if _pymupdf_installed():
+            name = 'pymupdf'
+        elif shutil.which(settings.RENDITION_PDFTOPPM):
+            name = 'pdftoppm'
+        else:
+            raise RasterizerUnavailable("Neither PyMuPDF nor pdftoppm is installed")
+    try:
+        return {'pymupdf': _rasterize_pymupdf, 'pdftoppm': _rasterize_pdftoppm}[name]
+    except KeyError:
+        raise RasterizerUnavailable(f"Unknown RENDITION_RASTERIZER {name!r}")
+
+
+# Cache. Files are named by a hash of the source file's validators, the page
+# and the width, so an edited ebook never hits its old renditions; those age
+# out through the LRU instead. A hit bumps the file's mtime, and eviction
+# removes the oldest files once the directory grows past the byte budget.
+# Each process keeps a running total of the cache size from its last walk
+# plus what it wrote since, and only walks the tree again once that total
+# passes the budget or RENDITION_EVICT_INTERVAL has gone by.
+
+_cache_bytes = None
+_last_evict = 0.0
+_evict_lock = threading.Lock()
+
+def cache_name(storage, source, page, size):
+    etag, _, _ = file_responses.validators(storage, source)
+    raw = f"{etag}:{page}:{settings.RENDITION_SIZES[size]}:{FORMAT_VERSION}"
+    key = hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    return f"{settings.RENDITION_CACHE_DIR}{key[:2]}/{key}.jpg"
+
+
+def _cache_root():
+    return default_storage.path(settings.RENDITION_CACHE_DIR)
+
+
+@contextmanager
+def _local_copy(storage, name):
+    # The rasterizers need a path; remote storages are copied to a temp file.
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        path = None
+    if path is not None:
+        yield path
+        return
+    with tempfile.NamedTemporaryFile(suffix='.pdf') as copy, storage.open(name, 'rb') as source:
+        shutil.copyfileobj(source, copy)
+        copy.flush()
+        yield copy.name
+
+
+def _encode(image, width):
+    image = image.convert('RGB')
+    if image.width != width:
+        image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+    output = BytesIO()
+    image.save(output, 'JPEG', quality=settings.RENDITION_JPEG_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def _write(name, data):
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(handle, 'wb') as output:
+        output.write(data)
+    os.replace(temp_path, path)
+
+
+def _touch(name):
+    try:
+        os.utime(default_storage.path(name))
+    except OSError:
+        pass
+
+
+def evict(max_bytes=None):
+    global _cache_bytes, _last_evict
+    max_bytes = settings.RENDITION_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    files = []
+    total = 0
+    for directory, _, names in os.walk(_cache_root()):
+        for file_name in names:
+            path = os.path.join(directory, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    _cache_bytes, _last_evict = total, time.monotonic()
+    return removed
+
+
+def _note_written(size):
+    global _cache_bytes
+    with _evict_lock:
+        if _cache_bytes is not None:
+            _cache_bytes += size
+        due = (
+            _cache_bytes is None
+            or _cache_bytes > settings.RENDITION_CACHE_MAX_BYTES
+            or time.monotonic() - _last_evict >= settings.RENDITION_EVICT_INTERVAL
+        )
+        if due:
+            evict()
+
+
+def _check(ebook, page, size):
+    if size not in settings.RENDITION_SIZES:
+        raise RenditionError(f"Unknown rendition size {size!r}")
+    if page < 1 or (ebook.page_count and page > ebook.page_count):
+        raise RenditionError(f"Page {page} is out of range")
+
+
+def cached(ebook, page, size):
+    # Cache name of the JPEG if it has been rendered, else None. Raises
+    # RenditionError for pages and sizes that can never be rendered.
+    _check(ebook, page, size)
+    name = cache_name(ebook.file.storage, ebook.file.name, page, size)
+    if default_storage.exists(name):
+        _touch(name)
+        return name
+    return None
+
+
+def schedule(ebook, page, size):
+    # Requests never rasterize: a miss is rendered by a background job, one
+    # per file at a time.
+    name = cache_name(ebook.file.storage, ebook.file.name, page, size)
+    jobs.enqueue(_render_job, ebook.id, page, size, dedupe_key=('rendition', name))
+
+
+def _render_job(ebook_id, page, size):
+    ebook = EbookFile.objects.filter(id=ebook_id).first()
+    if ebook is None or not ebook.file:
+        return
+    try:
+        render(ebook, page, size)
+    except RasterizerUnavailable:
+        return
+    except (RenditionError, OSError) as exc:
+        logger.warning("Could not render page %s of ebook %s: %s", page, ebook_id, exc)
+
+
+def render(ebook, page, size):
+    # Returns the cache name of the JPEG for this page and size, rasterizing
+    # it first when needed. Concurrent requests for the same file share one
+    # rasterization.
+    name = cached(ebook, page, size)
+    if name is not None:
+        return name
+    storage, source = ebook.file.storage, ebook.file.name
+    name = cache_name(storage, source, page, size)
+
+    def rasterize():
+        if default_storage.exists(name):
+            return name
+        rasterizer = get_rasterizer()
+        width = settings.RENDITION_SIZES[size]
+        with _local_copy(storage, source) as path:
+            try:
+                data = _encode(rasterizer(path, page, width), width)
+            except (RenditionError, OSError):
+                raise
+            except Exception as exc:
+                # PyMuPDF and PIL raise their own errors on damaged files.
+                raise RenditionError(f"Could not rasterize page {page}: {exc}") from exc
+        _write(name, data)
+        _note_written(len(data))
+        return name
+
+    return singleflight.do(('rendition', name), rasterize)
+
+
+def reset():
+    global _cache_bytes, _last_evict
+    with _evict_lock:
+        _cache_bytes, _last_evict = None, 0.0
+
+
+def render_first_page(ebook):
+    # Run after ingestion so covers and the reader's first page are ready.
+    for size in FIRST_PAGE_SIZES:
+        try:
+            render(ebook, 1, size)
+        except RasterizerUnavailable:
+            return
+        except (RenditionError, OSError) as exc:
+            logger.warning("Could not render page 1 of ebook %s: %s", ebook.id, exc)
+            return
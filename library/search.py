@@ -0,0 +1,197 @@
+import re
+from collections import namedtuple
+
+from bs4 import BeautifulSoup
+from django.conf import settings
+from django.db import connection
+from django.utils.html import escape
+
+from .models import SearchDocument
+
+SearchResult = namedtuple('SearchResult', ['document', 'snippet', 'rank'])
+
+FTS_TABLE = 'library_searchdocument_fts'
+SNIPPET_WORDS = 12
+# Control characters cannot occur in indexed text, so they are safe to mark
+# matches with until highlight() turns them into <mark>.
+MARK_START, MARK_END = '\x02', '\x03'
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+# Indexing. Each source object owns at most one SearchDocument (pages are
+# written in bulk by the ingestion job); the database keeps the full-text
+# index in step with the table.
+
+def _page_number(value):
+    value = str(value or '').strip()
+    match = re.match(r"\d+", value)
+    return int(match.group()) if match else None
+
+
+def _upsert(kind, object_id, **fields):
+    SearchDocument.objects.update_or_create(kind=kind, object_id=object_id, defaults=fields)
+
+
+def remove(kind, object_id):
+    SearchDocument.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def index_quote(quote):
+    _upsert('quote', quote.id, user_id=quote.user_id, book_id=quote.book_id, page=quote.page,
+            title=quote.book.title, body=quote.quote_text)
+
+
+def index_note(note):
+    _upsert('note', note.id, user_id=note.user_id, book_id=note.book_id, page=_page_number(note.page),
+            title=note.book.title, body=note.content)
+
+
+def index_chapter(chapter):
+    body = ' '.join(BeautifulSoup(chapter.content or '', 'html.parser').get_text(' ').split())
+    _upsert('chapter', chapter.id, user_id=chapter.mybook.user_id, mybook_id=chapter.mybook_id,
+            title=chapter.title, body=body)
+
+
+def index_book(book):
+    if not book.description:
+        remove('book', book.id)
+        return
+    _upsert('book', book.id, user_id=book.added_by_id, book_id=book.id,
+            title=book.title, body=book.description)
+
+
+def index_pages(ebook):
+    # Replaces the page documents of an ebook with its current PageText rows.
+    book = ebook.book
+    SearchDocument.objects.filter(kind='page', book=book).delete()
+    batch = []
+    for page in ebook.pages.order_by('page_number').only('id', 'page_number', 'text').iterator():
+        if page.text:
+            batch.append(SearchDocument(
+                kind='page', object_id=page.id, user_id=book.added_by_id, book=book,
+                page=page.page_number, title=book.title, body=page.text,
+            ))
+        if len(batch) >= 500:
+            SearchDocument.objects.bulk_create(batch)
+            batch = []
+    SearchDocument.objects.bulk_create(batch)
+
+
+# Backends.
+
+def _match_terms(query):
+    return _TOKEN_RE.findall(query.casefold())
+
+
+class SQLiteFTSBackend:
+    # FTS5 table over title and body, ranked with bm25 (title weighted up).
+
+    def search(self, user, query, limit):
+        terms = _match_terms(query)
+        if not terms:
+            return []
+        match = ' '.join(f'"{term}"*' for term in terms)
+        sql = f"""
+            SELECT d.id,
+                   bm25({FTS_TABLE}, 5.0, 1.0) AS rank,
+                   snippet({FTS_TABLE}, 1, '{MARK_START}', '{MARK_END}', '…', {SNIPPET_WORDS}) AS snippet
+            FROM {FTS_TABLE}
+            JOIN library_searchdocument d ON d.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s AND d.user_id = %s
+            ORDER BY rank
+            LIMIT %s
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match, user.id, limit])
+            rows = cursor.fetchall()
+        return _results(rows, score=lambda rank: -rank)
+
+
+class PostgresBackend:
+    # Same expression as the GIN index created in migration 0030.
+    VECTOR = "to_tsvector('simple', coalesce(d.title, '') || ' ' || coalesce(d.body, ''))"
+
+    def search(self, user, query, limit):
+        terms = _match_terms(query)
+        if not terms:
+            return []
+        tsquery = ' & '.join(f"{term}:*" for term in terms)
+        sql = f"""
+            SELECT d.id,
+                   ts_rank({self.VECTOR}, to_tsquery('simple', %s)) AS rank,
+                   ts_headline('simple', d.body, to_tsquery('simple', %s),
+                               'StartSel={MARK_START}, StopSel={MARK_END}, MaxWords={SNIPPET_WORDS * 2}, MinWords={SNIPPET_WORDS}')
+            FROM library_searchdocument d
+            WHERE {self.VECTOR} @@ to_tsquery('simple', %s) AND d.user_id = %s
+            ORDER BY rank DESC
+            LIMIT %s
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [tsquery, tsquery, tsquery, user.id, limit])
+            rows = cursor.fetchall()
+        return _results(rows, score=lambda rank: rank)
+
+
+class BasicBackend:
+    # Fallback without a full-text index: every term must appear somewhere.
+    # Matching is done in Python because SQLite's LIKE only folds ASCII.
+
+    def search(self, user, query, limit):
+        terms = _match_terms(query)
+        if not terms:
+            return []
+        results = []
+        for document in SearchDocument.objects.filter(user=user).select_related('book', 'mybook').iterator():
+            text, title = document.body.casefold(), document.title.casefold()
+            if not all(term in text or term in title for term in terms):
+                continue
+            rank = sum(text.count(term) for term in terms) + 5 * sum(term in title for term in terms)
+            results.append(SearchResult(document, _basic_snippet(document.body, terms), rank))
+        results.sort(key=lambda result: result.rank, reverse=True)
+        return results[:limit]
+
+
+def _basic_snippet(body, terms):
+    words = body.split()
+    for index, word in enumerate(words):
+        if any(term in word.casefold() for term in terms):
+            start = max(index - SNIPPET_WORDS // 2, 0)
+            selected = words[start:start + SNIPPET_WORDS]
+            marked = [f"{MARK_START}{w}{MARK_END}" if any(term in w.casefold() for term in terms) else w for w in selected]
+            return ('…' if start else '') + ' '.join(marked) + ('…' if start + SNIPPET_WORDS < len(words) else '')
+    return ' '.join(words[:SNIPPET_WORDS])
+
+
+def _results(rows, score):
+    documents = SearchDocument.objects.select_related('book', 'mybook').in_bulk([row[0] for row in rows])
+    return [
+        SearchResult(documents[row_id], snippet, score(rank))
+        for row_id, rank, snippet in rows
+        if row_id in documents
+    ]
+
+
+def _fts_available():
+    with connection.cursor() as cursor:
+        return FTS_TABLE in connection.introspection.table_names(cursor)
+
+
+def get_backend():
+    name = settings.SEARCH_BACKEND
+    if name == 'auto':
+        if connection.vendor == 'sqlite' and _fts_available():
+            name = 'sqlite'
+        elif connection.vendor == 'postgresql':
+            name = 'postgres'
+        else:
+            name = 'basic'
+    return {'sqlite': SQLiteFTSBackend, 'postgres': PostgresBackend, 'basic': BasicBackend}[name]()
+
+
+def search(user, query, limit=None):
+    return get_backend().search(user, query, limit or settings.SEARCH_RESULTS_LIMIT)
+
+
+def highlight(snippet):
+    return escape(snippet).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
@@ -0,0 +1,86 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Book, Chapter, EbookFile, JournalEntry, SavedQuote
+from . import blobs, ingestion, local_recommender, search, title_index
+from .recommendations import mark_stale
+
+
+@receiver(post_save, sender=Book)
+def refresh_recommendations_on_read(sender, instance, created, **kwargs):
+    if instance.status == 'read' and getattr(instance, '_loaded_status', None) != 'read':
+        mark_stale(instance.added_by_id)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_save, sender=Book)
+def remember_title_on_save(sender, instance, created, **kwargs):
+    # New and edited books reach the local model through updated_at.
+    title_index.remember(instance.title)
+
+
+@receiver(post_delete, sender=Book)
+def update_local_model_on_delete(sender, instance, **kwargs):
+    local_recommender.mark_deleted(instance.id)
+
+
+@receiver(pre_save, sender=EbookFile)
+def store_ebook_blob(sender, instance, **kwargs):
+    # A new upload is kept in the blob store, where identical PDFs share one
+    # file; the field then names the blob's file.
+    if instance.file and not instance.file._committed:
+        instance._released_blob = instance.blob_id
+        instance.blob = blobs.acquire(instance.file.file)
+        instance.file.name = instance.blob.file.name
+        instance.file._committed = True
+
+
+@receiver(post_save, sender=EbookFile)
+def release_replaced_blob(sender, instance, **kwargs):
+    blobs.release(instance.__dict__.pop('_released_blob', None))
+
+
+@receiver(post_delete, sender=EbookFile)
+def release_deleted_blob(sender, instance, **kwargs):
+    blobs.release(instance.blob_id)
+
+
+@receiver(post_save, sender=EbookFile)
+def ingest_uploaded_ebook(sender, instance, created, **kwargs):
+    # Progress saves touch the row constantly; only a new file is ingested.
+    if instance.file and instance.file_changed():
+        if not created:
+            EbookFile.objects.filter(id=instance.id).update(ingest_status='pending')
+        ingestion.schedule_ingest(instance)
+    instance._loaded_file = instance.file.name
+
+
+@receiver(post_save, sender=SavedQuote)
+def index_quote(sender, instance, **kwargs):
+    search.index_quote(instance)
+
+
+@receiver(post_save, sender=JournalEntry)
+def index_note(sender, instance, **kwargs):
+    search.index_note(instance)
+
+
+@receiver(post_save, sender=Chapter)
+def index_chapter(sender, instance, **kwargs):
+    search.index_chapter(instance)
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, created, **kwargs):
+    searchable = (instance.title, instance.description)
+    if created or getattr(instance, '_loaded_searchable', None) != searchable:
+        search.index_book(instance)
+    instance._loaded_searchable = searchable
+
+
+@receiver(post_delete, sender=SavedQuote)
+@receiver(post_delete, sender=JournalEntry)
+@receiver(post_delete, sender=Chapter)
+def remove_from_search(sender, instance, **kwargs):
+    kind = {SavedQuote: 'quote', JournalEntry: 'note', Chapter: 'chapter'}[sender]
+    search.remove(kind, instance.id)
@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process part applies.
+    fcntl = None
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_calls_lock = threading.Lock()
+_async_calls = weakref.WeakKeyDictionary()
+
+
+def _lock_path(key):
+    # Keys are spread over a fixed number of lock files so the directory does
+    # not grow with the number of distinct keys.
+    digest = hashlib.sha256(repr(key).encode('utf-8')).digest()
+    stripe = int.from_bytes(digest[:4], 'big') % settings.SINGLEFLIGHT_LOCK_STRIPES
+    directory = Path(settings.SINGLEFLIGHT_LOCK_DIR or Path(tempfile.gettempdir()) / 'digital-library-locks')
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f"{stripe:04d}.lock"
+
+
+def _try_lock(handle):
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+@contextmanager
+def _process_lock(key, wait):
+    # Yields (acquired, contended). contended is True when another process
+    # held the lock when we first asked for it.
+    if fcntl is None:
+        yield True, False
+        return
+
+    with open(_lock_path(key), 'a+') as handle:
+        contended = False
+        deadline = time.monotonic() + (settings.SINGLEFLIGHT_WAIT_TIMEOUT if wait else 0)
+        while not (acquired := _try_lock(handle)):
+            contended = True
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)
+        try:
+            yield acquired, contended
+        finally:
+            if acquired:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+@asynccontextmanager
+async def _aprocess_lock(key):
+    # _process_lock for coroutines: the lock file is polled without blocking,
+    # so other coroutines on the loop keep running while we wait.
+    if fcntl is None:
+        yield True, False
+        return
+
+    with open(_lock_path(key), 'a+') as handle:
+        contended = False
+        deadline = time.monotonic() + settings.SINGLEFLIGHT_WAIT_TIMEOUT
+        while not (acquired := _try_lock(handle)):
+            contended = True
+            if time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(0.05)
+        try:
+            yield acquired, contended
+        finally:
+            if acquired:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def do(key, func, recheck=None, stale=None):
+    """Run func at most once at a time per key, across threads and processes.
+
+    Threads that arrive while the value is being computed wait for it and get
+    the same result, or return ``stale`` straight away when one is given.
+    Across processes a lock file serialises the work; a process that had to
+    wait calls ``recheck`` first so it can pick up what the other one stored.
+    """
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        if stale is not None:
+            return stale
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        with _process_lock(key, wait=stale is None) as (acquired, contended):
+            if not acquired and stale is not None:
+                call.result = stale
+            else:
+                value = recheck() if contended and recheck is not None else None
+                call.result = value if value is not None else func()
+        return call.result
+    except Exception as exc:
+        call.error = exc
+        raise
+    finally:
+        with _calls_lock:
+            _calls.pop(key, None)
+        call.done.set()
+
+
+async def ado(key, func, recheck=None):
+    """Await func() at most once at a time per key, like do().
+
+    Coroutines on the running event loop that ask for the same key meanwhile
+    get the same result. Across processes the same lock file is used, polled
+    so the loop is never blocked; a coroutine that had to wait awaits
+    ``recheck()`` first so it can pick up what the other process stored.
+    """
+    calls = _async_calls.setdefault(asyncio.get_running_loop(), {})
+    future = calls.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+
+    future = calls[key] = asyncio.get_running_loop().create_future()
+    try:
+        async with _aprocess_lock(key) as (acquired, contended):
+            value = await recheck() if contended and recheck is not None else None
+            result = value if value is not None else await func()
+    except Exception as exc:
+        future.set_exception(exc)
+        future.exception()  # Mark as retrieved when nobody else was waiting.
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        if not future.done():
+            future.cancel()
+        calls.pop(key, None)
@@ -0,0 +1,153 @@
+import hashlib
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import StopFutureHandlers
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import blobs
+from ..models import Book, EbookBlob, EbookFile, PageText
+from ..upload_handlers import HashingMemoryFileUploadHandler, HashingTemporaryFileUploadHandler
+from .utils import TempMediaRootMixin, create_book, create_user, login, make_text_pdf, upload_pdf
+
+
+@override_settings(BACKGROUND_JOBS_INLINE=True)
+class BlobStoreTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        self.user, self.pw = create_user()
+        self.content = make_text_pdf(["Shared first page", "Shared second page"])
+
+    def _upload(self, title, content=None, name="book.pdf"):
+        book = create_book(self.user, title=title, create_ebook=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            return EbookFile.objects.create(book=book, file=upload_pdf(name, content or self.content))
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self._upload("First", name="a.pdf")
+        second = self._upload("Second", name="b.pdf")
+
+        blob = EbookBlob.objects.get()
+        self.assertEqual(blob.sha256, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(blob.size, len(self.content))
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertFalse(default_storage.exists('ebooks/a.pdf'))
+        with second.file.open('rb') as handle:
+            self.assertEqual(handle.read(), self.content)
+
+    def test_duplicate_reuses_ingestion(self):
+        first = self._upload("First")
+        with patch('library.ingestion.PdfReader', side_effect=AssertionError("PDF parsed again")):
+            second = self._upload("Second")
+
+        second.refresh_from_db()
+        self.assertEqual(second.ingest_status, 'done')
+        self.assertEqual(second.page_count, 2)
+        self.assertEqual(
+            list(second.pages.order_by('page_number').values_list('text', flat=True)),
+            list(first.pages.order_by('page_number').values_list('text', flat=True)),
+        )
+        self.assertEqual(PageText.objects.count(), 4)
+
+    def test_last_reference_deletes_file(self):
+        first = self._upload("First")
+        second = self._upload("Second")
+        name = first.file.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.book.delete()
+        self.assertEqual(EbookBlob.objects.get().ref_count, 1)
+        self.assertTrue(default_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(EbookBlob.objects.exists())
+        self.assertFalse(default_storage.exists(name))
+
+    def test_replacing_file_releases_old_blob(self):
+        ebook = self._upload("First")
+        old_name = ebook.file.name
+        ebook.file = upload_pdf("new.pdf", make_text_pdf(["Another edition"]))
+        with self.captureOnCommitCallbacks(execute=True):
+            ebook.save()
+
+        self.assertEqual(EbookBlob.objects.get().id, ebook.blob_id)
+        self.assertFalse(default_storage.exists(old_name))
+
+    def test_same_content_uploaded_again_keeps_blob(self):
+        ebook = self._upload("First")
+        ebook.file = upload_pdf("again.pdf", self.content)
+        with self.captureOnCommitCallbacks(execute=True):
+            ebook.save()
+        blob = EbookBlob.objects.get()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(default_storage.exists(blob.file.name))
+
+    def test_failed_save_takes_no_reference(self):
+        first = self._upload("First")
+        with self.assertRaises(IntegrityError):
+            EbookFile.objects.create(book=first.book, file=upload_pdf("again.pdf", self.content))
+        self.assertEqual(EbookBlob.objects.get().ref_count, 1)
+
+    def test_failed_save_leaves_no_new_file(self):
+        first = self._upload("First")
+        content = make_text_pdf(["Never saved"])
+        with self.assertRaises(IntegrityError):
+            EbookFile.objects.create(book=first.book, file=upload_pdf("other.pdf", content))
+        self.assertEqual(EbookBlob.objects.count(), 1)
+        self.assertFalse(default_storage.exists(blobs.blob_name(hashlib.sha256(content).hexdigest())))
+        self.assertTrue(default_storage.exists(first.file.name))
+
+    def test_add_book_stores_blob(self):
+        login(self.client, self.user, self.pw)
+        data = {
+            'title': 'Uploaded', 'author': 'Me', 'genre': ['Fantasy'], 'mood': ['Funny'],
+            'isbn': '1', 'description': '', 'language': 'English', 'status': 'to_read',
+            'file': upload_pdf('upload.pdf', self.content),
+        }
+        self.client.post(reverse('add_book'), data)
+        ebook = EbookFile.objects.get(book__title='Uploaded')
+        self.assertEqual(ebook.blob.sha256, hashlib.sha256(self.content).hexdigest())
+
+    def test_dedupe_command_moves_legacy_files(self):
+        default_storage.save('ebooks/legacy.pdf', ContentFile(self.content))
+        book = create_book(self.user, title="Legacy", create_ebook=False)
+        EbookFile.objects.bulk_create([EbookFile(book=book, file='ebooks/legacy.pdf')])
+        self._upload("Current")
+
+        call_command('dedupe_ebooks', stdout=StringIO())
+
+        legacy = EbookFile.objects.get(book=book)
+        blob = EbookBlob.objects.get()
+        self.assertEqual(legacy.blob, blob)
+        self.assertEqual(blob.ref_count, 2)
+        self.assertFalse(default_storage.exists('ebooks/legacy.pdf'))
+        self.assertEqual(Book.objects.get(id=book.id).ebookfile.file.name, blob.file.name)
+
+
+class HashingUploadHandlerTests(TestCase):
+    def _upload(self, handler_class, chunks):
+        handler = handler_class()
+        if handler_class is HashingMemoryFileUploadHandler:
+            handler.handle_raw_input(None, {}, sum(map(len, chunks)), 'boundary')
+        try:
+            handler.new_file('file', 'book.pdf', 'application/pdf', None)
+        except StopFutureHandlers:
+            pass
+        start = 0
+        for chunk in chunks:
+            handler.receive_data_chunk(chunk, start)
+            start += len(chunk)
+        return handler.file_complete(start)
+
+    def test_digest_is_computed_while_streaming(self):
+        chunks = [b'%PDF-1.4\n', b'x' * 1000, b'%%EOF']
+        expected = hashlib.sha256(b''.join(chunks)).hexdigest()
+        for handler_class in (HashingMemoryFileUploadHandler, HashingTemporaryFileUploadHandler):
+            with self.subTest(handler=handler_class.__name__):
+                self.assertEqual(self._upload(handler_class, chunks).sha256, expected)
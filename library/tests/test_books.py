@@ -1,12 +1,11 @@
-from django.test import TestCase, override_settings
+from django.test import TestCase
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from ..models import Book, Review, EbookFile
-from .utils import create_user, login, upload_pdf, create_book, make_image_file 
+from .utils import TempMediaRootMixin, create_user, login, upload_pdf, create_book, make_image_file
 
 
-@override_settings(MEDIA_ROOT="/tmp/dl_media")
-class BookViewsTests(TestCase):
+class BookViewsTests(TempMediaRootMixin, TestCase):
     def setUp(self):
         self.user, self.pw = create_user()
         login(self.client, self.user, self.pw)
@@ -55,6 +54,28 @@ class BookViewsTests(TestCase):
         )
         self.assertEqual(titles, sorted(titles))
 
+    def test_genre_filter_matches_whole_values(self):
+        create_book(self.user, title="Alpha", genre="Historical Fiction")
+        create_book(self.user, title="Beta", genre="Fiction, Drama")
+
+        res = self.client.get(reverse('my_added_books'), {'genre': 'Fiction'})
+        self.assertNotContains(res, "Alpha")
+        self.assertContains(res, "Beta")
+
+    def test_genre_relations_follow_the_display_value(self):
+        b = create_book(self.user, genre="Fantasy, Drama", mood="Funny")
+        self.assertEqual(sorted(b.genres.values_list('name', flat=True)), ['Drama', 'Fantasy'])
+
+        b.genre = "Drama"
+        b.mood = ""
+        b.save()
+        self.assertEqual(list(b.genres.values_list('name', flat=True)), ['Drama'])
+        self.assertFalse(b.moods.exists())
+
+        res = self.client.get(reverse('my_added_books'))
+        self.assertIn(('Drama', 'Драма', 1), res.context['genres'])
+        self.assertIn(('Fantasy', 'Фентъзи', 0), res.context['genres'])
+
     def test_book_detail_reviews(self):
         b = create_book(self.user)
         url = reverse('book_detail', args=[b.id])
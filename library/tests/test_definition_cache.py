@@ -0,0 +1,136 @@
+from datetime import timedelta
+from unittest.mock import AsyncMock, patch, MagicMock
+
+import requests
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import definition_cache, translation
+from ..models import DefinitionCache, WordLookup
+from .utils import create_user, login
+
+
+def _dictionary_response(status_code=200):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = [{
+        "meanings": [{"partOfSpeech": "noun", "definitions": [{"definition": "a small animal"}]}]
+    }]
+    return response
+
+
+@patch('library.translation.Translator')
+@patch('library.http_client.aget', new_callable=AsyncMock)
+class DefinitionCacheTests(TestCase):
+    def setUp(self):
+        translation.reset_pool()
+        self.user, self.pw = create_user()
+        login(self.client, self.user, self.pw)
+
+    def _translator(self, mock_translator_cls):
+        translator = MagicMock()
+        translator.translate.side_effect = lambda text, src, dest: MagicMock(text=f"bg:{text}")
+        mock_translator_cls.return_value = translator
+        return translator
+
+    def test_hit_from_another_user_makes_no_network_calls(self, mock_get, mock_translator_cls):
+        self._translator(mock_translator_cls)
+        mock_get.return_value = _dictionary_response()
+        first = self.client.get(reverse('translate_define'), {'word': 'Cat'}).json()
+
+        other, pw = create_user("other")
+        login(self.client, other, pw)
+        mock_get.reset_mock()
+        mock_translator_cls.reset_mock()
+        second = self.client.get(reverse('translate_define'), {'word': ' cat '}).json()
+
+        mock_get.assert_not_called()
+        mock_translator_cls.assert_not_called()
+        self.assertEqual(second['definitions'], first['definitions'])
+        self.assertEqual(DefinitionCache.objects.count(), 1)
+        entry = DefinitionCache.objects.get()
+        self.assertEqual((entry.word, entry.source_lang, entry.target_lang), ('cat', 'en', 'bg'))
+        self.assertEqual(WordLookup.objects.get(user=other).entry, entry)
+
+    def test_language_pairs_are_cached_separately(self, mock_get, mock_translator_cls):
+        self._translator(mock_translator_cls)
+        mock_get.return_value = _dictionary_response()
+        self.client.get(reverse('translate_define'), {'word': 'cat'})
+        res = self.client.get(reverse('translate_define'), {'word': 'котка'}).json()
+
+        self.assertEqual(res['translated'], 'котка')
+        self.assertEqual(
+            set(DefinitionCache.objects.values_list('source_lang', 'target_lang')),
+            {('en', 'bg'), ('bg', 'en')},
+        )
+
+    def test_failed_dictionary_request_is_not_cached(self, mock_get, mock_translator_cls):
+        self._translator(mock_translator_cls)
+        mock_get.side_effect = requests.ConnectionError("down")
+        res = self.client.get(reverse('translate_define'), {'word': 'cat'}).json()
+
+        self.assertEqual(res['definitions'], {})
+        self.assertFalse(DefinitionCache.objects.exists())
+        self.assertIsNone(WordLookup.objects.get(user=self.user).entry)
+
+    def test_expired_entries_are_fetched_again(self, mock_get, mock_translator_cls):
+        self._translator(mock_translator_cls)
+        mock_get.return_value = _dictionary_response()
+        self.client.get(reverse('translate_define'), {'word': 'cat'})
+        DefinitionCache.objects.update(fetched_at=timezone.now() - timedelta(days=365))
+
+        mock_get.reset_mock()
+        self.client.get(reverse('translate_define'), {'word': 'cat'})
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(DefinitionCache.objects.count(), 1)
+
+    @override_settings(DEFINITION_CACHE_SIZE=2, DEFINITION_CACHE_EVICT_INTERVAL=0)
+    def test_least_recently_used_entries_are_evicted(self, mock_get, mock_translator_cls):
+        for word in ("one", "two"):
+            definition_cache.store(word, 'en', 'bg', {"translated": word, "definitions": {}})
+        DefinitionCache.objects.filter(word="one").update(last_accessed=timezone.now() - timedelta(hours=1))
+        definition_cache.store("three", 'en', 'bg', {"translated": "three", "definitions": {}})
+
+        self.assertEqual(set(DefinitionCache.objects.values_list('word', flat=True)), {"two", "three"})
+
+    @override_settings(DEFINITION_CACHE_SIZE=1, DEFINITION_CACHE_EVICT_INTERVAL=60)
+    def test_table_is_trimmed_once_per_interval(self, mock_get, mock_translator_cls):
+        with patch('library.definition_cache._last_evict', None):
+            for word in ("one", "two", "three"):
+                definition_cache.store(word, 'en', 'bg', {"translated": word, "definitions": {}})
+            self.assertEqual(DefinitionCache.objects.count(), 3)
+
+    def test_hits_touch_the_row_once_per_interval(self, mock_get, mock_translator_cls):
+        definition_cache.store("cat", 'en', 'bg', {"translated": "котка", "definitions": {}})
+        recently = timezone.now() - timedelta(seconds=30)
+        DefinitionCache.objects.update(last_accessed=recently)
+
+        with self.assertNumQueries(1):
+            definition_cache.lookup("cat", 'en', 'bg')
+        self.assertEqual(DefinitionCache.objects.get().last_accessed, recently)
+
+        with self.settings(DEFINITION_CACHE_TOUCH_INTERVAL=0), self.assertNumQueries(2):
+            definition_cache.lookup("cat", 'en', 'bg')
+        self.assertGreater(DefinitionCache.objects.get().last_accessed, recently)
+
+    def test_entries_are_keyed_on_the_word_as_written(self, mock_get, mock_translator_cls):
+        self._translator(mock_translator_cls)
+        mock_get.return_value = _dictionary_response()
+        for word in ("Running,", "running", "runs"):
+            self.client.get(reverse('translate_define'), {'word': word})
+
+        self.assertEqual([c.args[0].rsplit('/', 1)[-1] for c in mock_get.call_args_list], ["running", "runs"])
+        self.assertEqual(set(DefinitionCache.objects.values_list('word', flat=True)), {"running", "runs"})
+        self.assertEqual(WordLookup.objects.filter(entry__word="running").count(), 2)
+
+    def test_lemma_is_tried_when_word_as_written_is_unknown(self, mock_get, mock_translator_cls):
+        self._translator(mock_translator_cls)
+        mock_get.side_effect = lambda url, **kwargs: _dictionary_response(200 if url.endswith("/thing") else 404)
+        res = self.client.get(reverse('translate_define'), {'word': 'thing'}).json()
+        self.assertEqual(res['definitions'], {'noun': ['bg:a small animal']})
+
+        mock_get.side_effect = lambda url, **kwargs: _dictionary_response(200 if url.endswith("/speed") else 404)
+        res = self.client.get(reverse('translate_define'), {'word': 'speeding'}).json()
+        self.assertEqual(res['definitions'], {'noun': ['bg:a small animal']})
+        self.assertEqual([c.args[0].rsplit('/', 1)[-1] for c in mock_get.call_args_list][-2:], ["speeding", "speed"])
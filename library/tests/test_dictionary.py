@@ -1,16 +1,19 @@
-from unittest.mock import patch, MagicMock
+import asyncio
+from unittest.mock import AsyncMock, patch, MagicMock
 from django.test import TestCase
 from django.urls import reverse
 from .utils import create_user, login
-from ..models import WordLookup
+from .. import translation
+from ..models import DefinitionCache, WordLookup
 
 class DictionaryTests(TestCase):
     def setUp(self):
+        translation.reset_pool()
         self.user, self.pw = create_user()
         login(self.client, self.user, self.pw)
 
-    @patch('library.views.requests.get')
-    @patch('library.views.Translator')
+    @patch('library.http_client.aget', new_callable=AsyncMock)
+    @patch('library.translation.Translator')
     def test_translate_and_define_en_word(self, mock_translator_cls, mock_requests_get):
         mock_translator = MagicMock()
         mock_translator.translate.side_effect = lambda text, src, dest: MagicMock(text="котка")
@@ -36,8 +39,126 @@ class DictionaryTests(TestCase):
 
         self.assertTrue(WordLookup.objects.filter(user=self.user, word='cat').exists())
 
-    @patch('library.views.Translator')
+    @patch('library.http_client.aget', new_callable=AsyncMock)
+    @patch('library.translation.Translator')
+    def test_word_as_written_is_defined_before_its_lemma(self, mock_translator_cls, mock_aget):
+        mock_translator = MagicMock()
+        mock_translator.translate.side_effect = lambda text, src, dest: MagicMock(text=f"[{text}]")
+        mock_translator_cls.return_value = mock_translator
+
+        def fake_get(url, params=None, **kwargs):
+            word = url.rsplit('/', 1)[-1]
+            if word == "mornings":
+                return MagicMock(status_code=404)
+            response = MagicMock(status_code=200)
+            response.json.return_value = [{"meanings": [
+                {"partOfSpeech": "noun", "definitions": [{"definition": f"definition of {word}"}]}
+            ]}]
+            return response
+
+        mock_aget.side_effect = fake_get
+        looked_up = lambda: [call.args[0].rsplit('/', 1)[-1] for call in mock_aget.call_args_list]
+        data = self.client.get(reverse('translate_define'), {'word': 'Evening'}).json()
+        self.assertEqual(data['translated'], '[evening]')
+        self.assertEqual(data['definitions'], {'noun': ['[definition of evening]']})
+
+        # No entry for the inflected form: its lemma is defined instead.
+        data = self.client.get(reverse('translate_define'), {'word': 'mornings'}).json()
+        self.assertEqual(data['definitions'], {'noun': ['[definition of morning]']})
+        self.assertEqual(looked_up(), ['evening', 'mornings', 'morning'])
+
+        # The lemma got a shared entry of its own, so it is not fetched again.
+        data = self.client.get(reverse('translate_define'), {'word': 'morning'}).json()
+        self.assertEqual(data['definitions'], {'noun': ['[definition of morning]']})
+        self.assertEqual(looked_up(), ['evening', 'mornings', 'morning'])
+
+        self.assertEqual(
+            set(DefinitionCache.objects.values_list('word', flat=True)), {'evening', 'mornings', 'morning'}
+        )
+
+    @patch('library.translation.Translator')
     def test_translate_define_no_word(self, _):
         res = self.client.get(reverse('translate_define'), {})
         self.assertEqual(res.status_code, 200)
         self.assertIn('error', res.json())
+
+    @patch('library.http_client.aget', new_callable=AsyncMock)
+    @patch('library.translation.Translator')
+    def test_definitions_are_translated_in_one_batch(self, mock_translator_cls, mock_requests_get):
+        mock_translator = MagicMock()
+        mock_translator.translate.side_effect = lambda text, src, dest: MagicMock(text=text.upper())
+        mock_translator_cls.return_value = mock_translator
+
+        mock_dict_resp = MagicMock()
+        mock_dict_resp.status_code = 200
+        mock_dict_resp.json.return_value = [{
+            "meanings": [
+                {"partOfSpeech": "noun", "definitions": [{"definition": "first"}, {"definition": "second"}]},
+                {"partOfSpeech": "verb", "definitions": [{"definition": "third"}]}
+            ]
+        }]
+        mock_requests_get.return_value = mock_dict_resp
+
+        data = self.client.get(reverse('translate_define'), {'word': 'cat'}).json()
+        self.assertEqual(data['definitions'], {'noun': ['FIRST', 'SECOND'], 'verb': ['THIRD']})
+        # One call for the headword, one for all definitions.
+        self.assertEqual(mock_translator.translate.call_count, 2)
+
+    @patch('library.http_client.aget', new_callable=AsyncMock)
+    @patch('library.translation.Translator')
+    def test_falls_back_to_per_definition_translation(self, mock_translator_cls, mock_requests_get):
+        mock_translator = MagicMock()
+        # Loses the separators, so the batch cannot be split back.
+        mock_translator.translate.side_effect = lambda text, src, dest: MagicMock(text=text.replace('§', '') + '!')
+        mock_translator_cls.return_value = mock_translator
+
+        mock_dict_resp = MagicMock()
+        mock_dict_resp.status_code = 200
+        mock_dict_resp.json.return_value = [{
+            "meanings": [{"partOfSpeech": "noun", "definitions": [{"definition": "first"}, {"definition": "second"}]}]
+        }]
+        mock_requests_get.return_value = mock_dict_resp
+
+        data = self.client.get(reverse('translate_define'), {'word': 'cat'}).json()
+        self.assertEqual(data['definitions'], {'noun': ['first!', 'second!']})
+        self.assertEqual(mock_translator.translate.call_count, 4)
+
+    @patch('library.http_client.aget', new_callable=AsyncMock)
+    def test_dictionary_and_translation_are_fetched_concurrently(self, mock_aget):
+        in_flight = []
+        peak = []
+
+        async def fake_get(url, params=None, **kwargs):
+            in_flight.append(url)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.05)
+            in_flight.remove(url)
+            response = MagicMock(status_code=200)
+            if params is not None:
+                response.json.return_value = {"text": "котка"}
+            else:
+                response.json.return_value = [{"meanings": [
+                    {"partOfSpeech": "noun", "definitions": [{"definition": "an animal"}]}
+                ]}]
+            return response
+
+        mock_aget.side_effect = fake_get
+        with self.settings(TRANSLATOR_URL="http://translator.test/translate"):
+            data = self.client.get(reverse('translate_define'), {'word': 'cat'}).json()
+
+        self.assertEqual(data['translated'], 'котка')
+        self.assertEqual(data['definitions'], {'noun': ['котка']})
+        self.assertEqual(max(peak), 2)
+
+    def test_word_lookups_store_normalized_word(self):
+        lookup = WordLookup.objects.create(user=self.user, word="Running,", definition="бягане")
+        self.assertEqual(lookup.normalized_word, "run")
+
+        WordLookup.objects.update_or_create(user=self.user, word="Котките", defaults={"definition": "котки"})
+        self.assertEqual(WordLookup.objects.get(word="Котките").normalized_word, "котк")
+
+    def test_lookup_by_normalized_word_uses_index(self):
+        plan = WordLookup.objects.filter(user=self.user, normalized_word="run").explain()
+        self.assertIn("INDEX", plan.upper())
+        plan = WordLookup.objects.filter(normalized_word="run").explain()
+        self.assertIn("INDEX", plan.upper())
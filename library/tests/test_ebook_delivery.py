@@ -0,0 +1,135 @@
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..file_responses import parse_ranges
+from ..models import EbookFile
+from .utils import TempMediaRootMixin, create_book, create_user, login, make_image_file, upload_pdf
+
+CONTENT = bytes(range(256)) * 40
+
+
+class ReadEbookTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        self.user, self.pw = create_user()
+        login(self.client, self.user, self.pw)
+        self.book = create_book(self.user, create_ebook=False)
+        EbookFile.objects.create(book=self.book, file=upload_pdf("range.pdf", CONTENT))
+        self.url = reverse('read_ebook', args=[self.book.id])
+
+    def _body(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_full_download_has_validators(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self._body(res), CONTENT)
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertTrue(res['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', res)
+
+    def test_single_range(self):
+        res = self.client.get(self.url, HTTP_RANGE="bytes=100-199")
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(res['Content-Range'], f"bytes 100-199/{len(CONTENT)}")
+        self.assertEqual(res['Content-Length'], "100")
+        self.assertEqual(self._body(res), CONTENT[100:200])
+
+        res = self.client.get(self.url, HTTP_RANGE="bytes=-10")
+        self.assertEqual(self._body(res), CONTENT[-10:])
+
+    def test_multiple_ranges(self):
+        res = self.client.get(self.url, HTTP_RANGE="bytes=0-9, 500-509")
+        self.assertEqual(res.status_code, 206)
+        self.assertTrue(res['Content-Type'].startswith("multipart/byteranges; boundary="))
+        body = self._body(res)
+        self.assertEqual(int(res['Content-Length']), len(body))
+        self.assertIn(f"Content-Range: bytes 500-509/{len(CONTENT)}".encode(), body)
+        self.assertIn(CONTENT[0:10], body)
+        self.assertIn(CONTENT[500:510], body)
+
+    def test_unsatisfiable_range(self):
+        res = self.client.get(self.url, HTTP_RANGE=f"bytes={len(CONTENT)}-")
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res['Content-Range'], f"bytes */{len(CONTENT)}")
+
+    def test_conditional_get_returns_304(self):
+        first = self.client.get(self.url)
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(res.status_code, 304)
+        res = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(res.status_code, 304)
+
+    def test_stale_if_range_serves_whole_file(self):
+        res = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"other"')
+        self.assertEqual(res.status_code, 200)
+        etag = res['ETag']
+        res = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag)
+        self.assertEqual(res.status_code, 206)
+
+    def test_other_users_cannot_read(self):
+        other, pw = create_user("other")
+        self.client.logout()
+        login(self.client, other, pw)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.get(reverse('read_book', args=[self.book.id])).status_code, 404)
+
+    def test_parse_ranges(self):
+        self.assertEqual(parse_ranges("bytes=0-4,3-9,20-", 30), [(0, 9), (20, 29)])
+        self.assertEqual(parse_ranges("bytes=50-60", 30), [])
+        self.assertIsNone(parse_ranges("bytes=5-1", 30))
+        self.assertIsNone(parse_ranges("items=0-1", 30))
+
+    @override_settings(FILE_DELIVERY_BACKEND='nginx')
+    def test_nginx_backend_hands_file_to_proxy(self):
+        res = self.client.get(self.url)
+        name = EbookFile.objects.get(book=self.book).file.name
+        self.assertEqual(res['X-Accel-Redirect'], f"/protected-media/{name}")
+        self.assertEqual(res['Content-Type'], 'application/pdf')
+        self.assertEqual(res.content, b"")
+
+    @override_settings(FILE_DELIVERY_BACKEND='apache')
+    def test_apache_backend_hands_file_to_proxy(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res['X-Sendfile'], EbookFile.objects.get(book=self.book).file.path)
+
+
+class ServeMediaTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        self.user, self.pw = create_user()
+        self.book = create_book(self.user, create_ebook=False)
+        self.ebook = EbookFile.objects.create(book=self.book, file=upload_pdf("media.pdf", CONTENT))
+
+    def test_protected_media_needs_login(self):
+        url = reverse('serve_media', args=[self.ebook.file.name])
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        login(self.client, self.user, self.pw)
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b"".join(res.streaming_content), CONTENT)
+
+    def test_protected_media_is_only_served_to_owner(self):
+        other, pw = create_user("other")
+        login(self.client, other, pw)
+        url = reverse('serve_media', args=[self.ebook.file.name])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_renditions_are_not_served_directly(self):
+        default_storage.save('renditions/ab/cached.jpg', ContentFile(b'jpeg'))
+        self.addCleanup(default_storage.delete, 'renditions/ab/cached.jpg')
+        login(self.client, self.user, self.pw)
+        self.assertEqual(self.client.get('/media/renditions/ab/cached.jpg').status_code, 404)
+
+    def test_public_media_is_served(self):
+        self.book.cover_image = make_image_file()
+        self.book.save()
+        res = self.client.get(self.book.cover_image.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['Content-Type'], 'image/png')
+
+    def test_missing_and_outside_paths_are_404(self):
+        login(self.client, self.user, self.pw)
+        self.assertEqual(self.client.get("/media/ebooks/missing.pdf").status_code, 404)
+        self.assertEqual(self.client.get("/media/ebooks/../../settings.py").status_code, 404)
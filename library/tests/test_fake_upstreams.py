@@ -0,0 +1,56 @@
+import tempfile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from .. import http_client, local_recommender, query_cache, title_index
+from ..fake_upstreams import FakeUpstreamConfig, FakeUpstreamServer
+from ..models import Book
+from ..recommendations import get_google_books_recommendations
+from .utils import create_user, login, create_book
+
+
+class FakeUpstreamTests(TestCase):
+    def setUp(self):
+        query_cache.clear_memory()
+        local_recommender.reset()
+        title_index.reset()
+        http_client.reset()
+        self.user, self.pw = create_user()
+        login(self.client, self.user, self.pw)
+        create_book(self.user, title="Под игото", author="Иван Вазов", genre="Classic", status='read', create_ebook=False)
+
+        self.server = FakeUpstreamServer(config=FakeUpstreamConfig(items=6, definitions=2)).start()
+        self.addCleanup(self.server.stop)
+        overrides = override_settings(**self.server.upstream_settings())
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_recommendations_against_stand_in(self):
+        recs = get_google_books_recommendations(Book.objects.filter(added_by=self.user, status='read'))
+        self.assertEqual(len(recs), 10)
+        self.assertIn("Иван Вазов", {r['authors'] for r in recs})
+        self.assertEqual(len(self.server.hits), 2)
+
+    def test_translate_and_define_against_stand_in(self):
+        res = self.client.get(reverse('translate_define'), {'word': 'river'})
+        data = res.json()
+        self.assertEqual(data['translated'], 'river [bg]')
+        self.assertEqual(len(data['definitions']['noun']), 2)
+        self.assertTrue(all(d.endswith(' [bg]') for d in data['definitions']['noun']))
+        self.assertEqual(sum(hit.startswith('/translate') for hit in self.server.hits), 2)
+
+    def test_injected_errors_are_survived(self):
+        self.server.config.error_rate = 1.0
+        with self.settings(OUTBOUND_HTTP={'default': {'retries': 0}}):
+            recs = get_google_books_recommendations(Book.objects.filter(added_by=self.user, status='read'))
+        self.assertEqual(recs, [])
+
+    def test_record_then_replay_offline(self):
+        with tempfile.TemporaryDirectory() as fixtures_dir:
+            with self.settings(UPSTREAM_FIXTURES_MODE='record', UPSTREAM_FIXTURES_DIR=fixtures_dir):
+                recorded = self.client.get(reverse('translate_define'), {'word': 'river'}).json()
+
+            self.server.stop()
+            with self.settings(UPSTREAM_FIXTURES_MODE='replay', UPSTREAM_FIXTURES_DIR=fixtures_dir):
+                replayed = self.client.get(reverse('translate_define'), {'word': 'river'}).json()
+
+        self.assertEqual(replayed, recorded)
@@ -0,0 +1,164 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+import httpx
+import requests
+from django.test import SimpleTestCase, override_settings
+from .. import http_client
+
+URL = "https://upstream.test/api"
+
+FAST_POLICY = {
+    'default': {
+        'retries': 2,
+        'backoff': 0,
+        'rate': 1000,
+        'burst': 1000,
+        'failure_threshold': 3,
+        'reset_timeout': 60,
+    },
+}
+
+
+def _response(status):
+    response = MagicMock()
+    response.status_code = status
+    response.headers = {}
+    return response
+
+
+@override_settings(OUTBOUND_HTTP=FAST_POLICY)
+class HttpClientTests(SimpleTestCase):
+    def setUp(self):
+        http_client.reset()
+        patcher = patch.object(http_client.get_session(), 'request')
+        self.request = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_uses_one_pooled_session(self):
+        self.assertIs(http_client.get_session(), http_client.get_session())
+
+    def test_applies_host_timeout(self):
+        self.request.return_value = _response(200)
+        with self.settings(OUTBOUND_HTTP={**FAST_POLICY, 'upstream.test': {'timeout': (1, 2)}}):
+            http_client.get(URL, params={'q': 'x'})
+        self.request.assert_called_once_with('GET', URL, timeout=(1, 2), params={'q': 'x'})
+
+    def test_retries_server_errors(self):
+        self.request.side_effect = [_response(503), requests.ConnectionError(), _response(200)]
+        self.assertEqual(http_client.get(URL).status_code, 200)
+        self.assertEqual(self.request.call_count, 3)
+
+    def test_does_not_retry_client_errors(self):
+        self.request.return_value = _response(404)
+        self.assertEqual(http_client.get(URL).status_code, 404)
+        self.assertEqual(self.request.call_count, 1)
+
+    def test_circuit_opens_and_fails_fast(self):
+        self.request.side_effect = requests.Timeout()
+        with self.assertRaises(requests.Timeout):
+            http_client.get(URL)
+        self.assertEqual(self.request.call_count, 3)
+
+        with self.assertRaises(http_client.UpstreamUnavailable):
+            http_client.get(URL)
+        self.assertEqual(self.request.call_count, 3)
+
+    def test_half_open_trial_closes_circuit(self):
+        breaker = http_client.CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+
+    def test_rate_limited_call_does_not_start_trial(self):
+        self.request.side_effect = requests.Timeout()
+        with self.settings(OUTBOUND_HTTP={'default': {**FAST_POLICY['default'], 'reset_timeout': 0, 'retries': 0}}):
+            for _ in range(3):
+                with self.assertRaises(requests.Timeout):
+                    http_client.get(URL)
+            upstream = http_client._get_upstream('upstream.test')
+            upstream.bucket.tokens = 0
+            upstream.bucket.rate = 0.001
+            with self.assertRaises(http_client.UpstreamUnavailable):
+                http_client.get(URL)
+            self.assertEqual(upstream.breaker.state, http_client.CircuitBreaker.OPEN)
+
+            upstream.bucket.tokens = 1
+            self.request.side_effect = None
+            self.request.return_value = _response(200)
+            self.assertEqual(http_client.get(URL).status_code, 200)
+            self.assertEqual(upstream.breaker.state, http_client.CircuitBreaker.CLOSED)
+
+    def test_unexpected_error_ends_trial(self):
+        upstream = http_client._get_upstream('upstream.test')
+        upstream.breaker.reset_timeout = 0
+        upstream.breaker.record_failure()
+        upstream.breaker.state = http_client.CircuitBreaker.OPEN
+        self.request.side_effect = KeyboardInterrupt
+        with self.assertRaises(KeyboardInterrupt):
+            http_client.get(URL)
+        self.assertEqual(upstream.breaker.state, http_client.CircuitBreaker.OPEN)
+        self.assertTrue(upstream.breaker.allow())
+
+    def test_token_bucket_limits_rate(self):
+        bucket = http_client.TokenBucket(rate=1, burst=2)
+        self.assertTrue(bucket.acquire())
+        self.assertTrue(bucket.acquire())
+        self.assertFalse(bucket.acquire())
+
+    def test_guard_counts_failures_of_other_clients(self):
+        for _ in range(3):
+            with self.assertRaises(ConnectionError):
+                with http_client.guard('translate.test', failures=(ConnectionError,)):
+                    raise ConnectionError
+        with self.assertRaises(http_client.UpstreamUnavailable):
+            with http_client.guard('translate.test'):
+                pass
+
+    def test_guard_ignores_programming_errors(self):
+        for _ in range(3):
+            with self.assertRaises(TypeError):
+                with http_client.guard('translate.test'):
+                    raise TypeError
+        with http_client.guard('translate.test'):
+            pass
+        self.assertEqual(http_client._get_upstream('translate.test').breaker.failures, 0)
+
+
+@override_settings(OUTBOUND_HTTP=FAST_POLICY)
+class AsyncClientTests(SimpleTestCase):
+    def setUp(self):
+        http_client.reset()
+        _, client = http_client.get_async_client()
+        patcher = patch.object(client, 'request', new_callable=AsyncMock)
+        self.request = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_one_client_for_every_event_loop(self):
+        async def client():
+            return http_client.get_async_client()
+
+        first, second = asyncio.run(client()), asyncio.run(client())
+        self.assertEqual(first, second)
+        loop, _ = first
+        self.assertTrue(loop.is_running())
+
+    def test_aget_awaits_the_shared_client(self):
+        self.request.return_value = httpx.Response(
+            200, content='{"ok": "да"}'.encode(), request=httpx.Request('GET', URL),
+        )
+        with patch.object(http_client, 'get_session', side_effect=AssertionError("sync client used")):
+            response = asyncio.run(http_client.aget(URL, params={'q': 'x'}))
+        self.assertEqual(response.json(), {'ok': 'да'})
+        self.assertEqual(self.request.call_args.args, ('GET', URL))
+        self.assertEqual(self.request.call_args.kwargs['params'], {'q': 'x'})
+
+    def test_async_transport_errors_count_against_the_host(self):
+        self.request.side_effect = httpx.ConnectTimeout()
+        with self.assertRaises(requests.Timeout):
+            asyncio.run(http_client.aget(URL))
+        self.assertEqual(self.request.call_count, 3)
+        with self.assertRaises(http_client.UpstreamUnavailable):
+            asyncio.run(http_client.aget(URL))
+        self.assertEqual(self.request.call_count, 3)
@@ -0,0 +1,119 @@
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from reportlab.pdfgen import canvas
+
+from .. import ingestion
+from ..models import Book, EbookFile, PageText
+from .utils import TempMediaRootMixin, create_book, create_user, upload_pdf
+
+
+def make_book_pdf():
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer)
+    pdf.setTitle("Под игото")
+    pdf.setAuthor("Иван Вазов")
+    for number, heading in enumerate(["Chapter one", "Chapter two", "Chapter three"], start=1):
+        pdf.drawString(72, 720, f"{heading}   text on page {number}")
+        pdf.bookmarkPage(f"p{number}")
+        if number != 2:
+            pdf.addOutlineEntry(heading, f"p{number}", level=0)
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+@override_settings(BACKGROUND_JOBS_INLINE=True)
+class IngestionTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        self.user, _ = create_user()
+        self.book = create_book(self.user, create_ebook=False)
+
+    def _upload(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return EbookFile.objects.create(book=self.book, file=upload_pdf("book.pdf", content))
+
+    def test_upload_is_ingested_in_background(self):
+        ebook = self._upload(make_book_pdf())
+        ebook.refresh_from_db()
+
+        self.assertEqual(ebook.ingest_status, 'done')
+        self.assertEqual(ebook.page_count, 3)
+        self.assertEqual(Book.objects.get(id=self.book.id).total_pages, 3)
+        self.assertEqual(
+            list(PageText.objects.filter(ebook=ebook).values_list('page_number', 'text')),
+            [(1, "Chapter one text on page 1"), (2, "Chapter two text on page 2"), (3, "Chapter three text on page 3")],
+        )
+        self.assertEqual(ebook.metadata['title'], "Под игото")
+        self.assertEqual(ebook.metadata['author'], "Иван Вазов")
+        self.assertEqual(ebook.metadata['outline'], [
+            {'title': "Chapter one", 'page': 1, 'level': 0},
+            {'title': "Chapter three", 'page': 3, 'level': 0},
+        ])
+
+    def test_broken_pdf_is_marked_failed(self):
+        ebook = self._upload(b"%PDF-1.4\nnot really a pdf")
+        ebook.refresh_from_db()
+        self.assertEqual(ebook.ingest_status, 'failed')
+        self.assertTrue(ebook.ingest_error)
+        self.assertFalse(PageText.objects.filter(ebook=ebook).exists())
+
+    def test_unexpected_error_is_marked_failed(self):
+        with patch('library.ingestion._extract', side_effect=RuntimeError("boom")), \
+                self.assertLogs('library.ingestion', 'ERROR'):
+            ebook = self._upload(make_book_pdf())
+        ebook.refresh_from_db()
+        self.assertEqual(ebook.ingest_status, 'failed')
+        self.assertEqual(ebook.ingest_error, "boom")
+
+    def test_file_replaced_during_ingestion(self):
+        with patch('library.ingestion.schedule_ingest'):
+            ebook = EbookFile.objects.create(book=self.book, file=upload_pdf("book.pdf", make_book_pdf()))
+        old_name = ebook.file.name
+        extract = ingestion._extract
+
+        def replace_then_extract(ebook):
+            EbookFile.objects.filter(id=ebook.id).update(file='blobs/newer.pdf', ingest_status='pending')
+            return extract(ebook)
+
+        with patch('library.ingestion._extract', side_effect=replace_then_extract):
+            self.assertIsNone(ingestion.ingest_ebook(ebook.id, old_name))
+        ebook.refresh_from_db()
+        self.assertEqual(ebook.ingest_status, 'pending')
+        self.assertFalse(PageText.objects.filter(ebook=ebook).exists())
+
+    def test_ebook_is_claimed_by_one_worker(self):
+        with patch('library.ingestion.schedule_ingest'):
+            ebook = EbookFile.objects.create(book=self.book, file=upload_pdf("book.pdf", make_book_pdf()))
+        EbookFile.objects.filter(id=ebook.id).update(ingest_status='processing')
+        with patch('library.ingestion._extract') as mock_extract:
+            self.assertIsNone(ingestion.ingest_ebook(ebook.id))
+        mock_extract.assert_not_called()
+
+    def test_replaced_file_is_not_deduplicated(self):
+        ebook = self._upload(make_book_pdf())
+        with patch('library.jobs.enqueue') as enqueue:
+            ingestion.schedule_ingest(ebook)
+            ebook.file.name = 'blobs/newer.pdf'
+            ingestion.schedule_ingest(ebook)
+        first, second = (call.kwargs['dedupe_key'] for call in enqueue.call_args_list)
+        self.assertNotEqual(first, second)
+
+    def test_progress_saves_do_not_reingest(self):
+        ebook = self._upload(make_book_pdf())
+        ebook = EbookFile.objects.get(id=ebook.id)
+        with patch('library.ingestion.schedule_ingest') as mock_schedule:
+            ebook.last_page_read = "2"
+            ebook.save()
+        mock_schedule.assert_not_called()
+
+    def test_command_ingests_pending_ebooks(self):
+        with patch('library.ingestion.schedule_ingest'):
+            ebook = EbookFile.objects.create(book=self.book, file=upload_pdf("book.pdf", make_book_pdf()))
+
+        out = StringIO()
+        call_command('ingest_ebooks', stdout=out)
+        self.assertIn("Ingested 1 ebook(s), 0 failed.", out.getvalue())
+        self.assertEqual(PageText.objects.filter(ebook=ebook).count(), 3)
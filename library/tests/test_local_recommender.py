@@ -0,0 +1,93 @@
+from datetime import timedelta
+from unittest.mock import patch
+from django.test import TestCase
+from django.utils import timezone
+from .. import local_recommender, query_cache
+from ..models import Book
+from ..recommendations import get_google_books_recommendations
+from .utils import create_user, create_book
+
+
+class LocalRecommenderTests(TestCase):
+    def setUp(self):
+        local_recommender.reset()
+        query_cache.clear_memory()
+        self.reader, _ = create_user('reader')
+        self.other, _ = create_user('other')
+        create_book(self.reader, title="Hobbit", author="Tolkien", genre="Fantasy, Adventure",
+                    mood="Adventurous", status='read', create_ebook=False)
+
+    def read_books(self):
+        return Book.objects.filter(added_by=self.reader, status='read')
+
+    def test_ranks_similar_books_first(self):
+        create_book(self.other, title="Cookbook", author="Chef", genre="Cookbook", mood="Playful", create_ebook=False)
+        create_book(self.other, title="Silmarillion", author="Tolkien", genre="Fantasy", mood="Adventurous", create_ebook=False)
+        create_book(self.other, title="Dune", author="Herbert", genre="Science Fiction, Adventure", create_ebook=False)
+
+        titles = [r['title'] for r in local_recommender.recommend(self.read_books(), 10)]
+        self.assertEqual(titles, ["Silmarillion", "Dune"])
+
+    def test_skips_own_books_and_titles_already_owned(self):
+        create_book(self.reader, title="The Two Towers", author="Tolkien", genre="Fantasy", create_ebook=False)
+        create_book(self.other, title="the two  towers", author="Tolkien", genre="Fantasy", create_ebook=False)
+
+        self.assertEqual(local_recommender.recommend(self.read_books(), 10), [])
+
+    def test_new_and_edited_books_are_picked_up_incrementally(self):
+        create_book(self.other, title="Silmarillion", author="Tolkien", genre="Fantasy", create_ebook=False)
+        self.assertEqual(len(local_recommender.recommend(self.read_books(), 10)), 1)
+
+        cookbook = create_book(self.other, title="Cookbook", author="Chef", genre="Cookbook", create_ebook=False)
+        self.assertEqual(len(local_recommender.recommend(self.read_books(), 10)), 1)
+
+        cookbook.genre = "Fantasy"
+        cookbook.save()
+        titles = [r['title'] for r in local_recommender.recommend(self.read_books(), 10)]
+        self.assertEqual(titles, ["Silmarillion", "Cookbook"])
+
+    def test_books_edited_by_other_workers_are_revectorized(self):
+        cookbook = create_book(self.other, title="Cookbook", author="Chef", genre="Cookbook", create_ebook=False)
+        self.assertEqual(local_recommender.recommend(self.read_books(), 10), [])
+
+        # Another process: no save signal reaches this one.
+        Book.objects.filter(id=cookbook.id).update(genre="Fantasy", updated_at=timezone.now() + timedelta(seconds=1))
+        titles = [r['title'] for r in local_recommender.recommend(self.read_books(), 10)]
+        self.assertEqual(titles, ["Cookbook"])
+
+    def test_deleted_books_are_not_recommended(self):
+        silmarillion = create_book(self.other, title="Silmarillion", author="Tolkien", genre="Fantasy",
+                                   create_ebook=False)
+        self.assertEqual(len(local_recommender.recommend(self.read_books(), 10)), 1)
+        silmarillion.delete()
+        self.assertEqual(local_recommender.recommend(self.read_books(), 10), [])
+
+    @patch('library.http_client.get')
+    def test_external_api_only_fills_remaining_slots(self, mock_get):
+        for i in range(10):
+            create_book(self.other, title=f"Tale {i}", author="Tolkien", genre="Fantasy", create_ebook=False)
+
+        recs = get_google_books_recommendations(self.read_books())
+        self.assertEqual(len(recs), 10)
+        self.assertTrue(all(r['source'] == 'local' for r in recs))
+        mock_get.assert_not_called()
+
+    def test_rows_are_stored_sparsely_and_grow_in_place(self):
+        def book(book_id, genre, description=''):
+            return {'id': book_id, 'added_by_id': 2, 'normalized_title': f"book{book_id}", 'author': f"Author {book_id}",
+                    'genre': genre, 'mood': '', 'language': '', 'description': description}
+
+        model = local_recommender.ContentModel()
+        model.fit([book(1, "Fantasy", "dragons and rings"), book(2, "Cookbook", "soup")])
+        for book_id in range(3, 200):
+            model.add([book(book_id, "Fantasy" if book_id % 2 else "Cookbook")])
+        self.assertEqual(model.size, 199)
+        self.assertLess(model.entries, 199 * 4)
+        self.assertLess(len(model._entry_values), 2 * 199 * 4)
+
+        model.replace(book(4, "Fantasy"))
+        model.remove(6)
+        ranked = model.score(1, [1], 200)
+        self.assertIn(4, ranked)
+        self.assertNotIn(6, ranked)
+        self.assertTrue(all(book_id % 2 or book_id == 4 for book_id in ranked))
@@ -0,0 +1,84 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from .. import offline_dictionary, translation
+from .utils import create_user, login
+
+
+class OfflineDictionaryTests(TestCase):
+    def setUp(self):
+        offline_dictionary.reset()
+        translation.reset_pool()
+        self.addCleanup(offline_dictionary.reset)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'dictionary.bin')
+
+    def _source(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(content)
+        return path
+
+    def test_bundle_lookups(self):
+        words = {f"word{i}": [{"partOfSpeech": "noun", "definitions": [{"definition": f"def {i}"}]}] for i in range(100)}
+        words["Café"] = [{"partOfSpeech": "noun", "definitions": [{"definition": "a coffee house"}]}]
+        offline_dictionary.write_bundle(self.path, words)
+
+        bundle = offline_dictionary.OfflineDictionary(self.path)
+        self.addCleanup(bundle.close)
+        self.assertEqual(len(bundle), 101)
+        self.assertEqual(bundle.get("WORD42"), words["word42"])
+        self.assertEqual(bundle.get(" café "), words["Café"])
+        self.assertIsNone(bundle.get("missing"))
+        self.assertIsNone(bundle.get(""))
+
+    def test_import_jsonl_and_tsv(self):
+        jsonl = self._source('dump.jsonl', "\n".join([
+            json.dumps({"word": "river", "pos": "noun", "senses": [{"glosses": ["a large stream"]}, {"glosses": ["a flow"]}]}),
+            json.dumps({"word": "River", "meanings": [{"partOfSpeech": "verb", "definitions": [{"definition": "to flow"}]}]}),
+        ]))
+        out = StringIO()
+        call_command('import_dictionary', jsonl, output=self.path, stdout=out)
+        self.assertIn("1 word(s)", out.getvalue())
+
+        with self.settings(OFFLINE_DICTIONARY_PATH=self.path):
+            self.assertEqual(offline_dictionary.lookup("river"), [
+                {"partOfSpeech": "noun", "definitions": [{"definition": "a large stream"}, {"definition": "a flow"}]},
+                {"partOfSpeech": "verb", "definitions": [{"definition": "to flow"}]},
+            ])
+
+            tsv = self._source('dump.tsv', "lake\tnoun\ta body of water\n")
+            call_command('import_dictionary', tsv, output=self.path, stdout=StringIO())
+            offline_dictionary.reset()
+            self.assertIsNone(offline_dictionary.lookup("river"))
+            self.assertEqual(offline_dictionary.lookup("lake")[0]["definitions"], [{"definition": "a body of water"}])
+
+    def test_missing_bundle_is_ignored(self):
+        with self.settings(OFFLINE_DICTIONARY_PATH=self.path):
+            self.assertIsNone(offline_dictionary.lookup("river"))
+
+    @patch('library.http_client.aget', new_callable=AsyncMock)
+    @patch('library.translation.Translator')
+    def test_translate_and_define_uses_bundle_first(self, mock_translator_cls, mock_aget):
+        mock_translator = MagicMock()
+        mock_translator.translate.side_effect = lambda text, src, dest: MagicMock(text=f"bg:{text}")
+        mock_translator_cls.return_value = mock_translator
+        offline_dictionary.write_bundle(self.path, {
+            "river": [{"partOfSpeech": "noun", "definitions": [{"definition": "a large stream"}]}],
+        })
+
+        user, pw = create_user()
+        login(self.client, user, pw)
+        with self.settings(OFFLINE_DICTIONARY_PATH=self.path):
+            data = self.client.get(reverse('translate_define'), {'word': 'river'}).json()
+
+        mock_aget.assert_not_called()
+        self.assertEqual(data['definitions'], {'noun': ['bg:a large stream']})
@@ -0,0 +1,98 @@
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from .. import query_cache
+from ..models import ExternalQueryCache
+
+URL = "https://example.test/volumes"
+
+
+class LRUCacheTests(TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = query_cache.LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(len(cache), 2)
+
+
+class QueryCacheTests(TestCase):
+    def setUp(self):
+        query_cache.clear_memory()
+
+    def test_key_ignores_case_whitespace_and_param_order(self):
+        a = query_cache.make_key(URL, {'q': 'inauthor:Иван  Вазов', 'maxResults': 3})
+        b = query_cache.make_key(URL, {'maxResults': 3, 'q': ' INAUTHOR:иван вазов '})
+        self.assertEqual(a, b)
+
+    def test_store_is_visible_through_database_tier(self):
+        query_cache.store(URL, {'q': 'x'}, [{'id': 1}])
+        query_cache.clear_memory()
+        entry = query_cache.lookup(URL, {'q': 'x'})
+        self.assertEqual(entry.payload, [{'id': 1}])
+        self.assertTrue(entry.is_fresh())
+
+    def test_memory_hits_touch_the_row_once_per_interval(self):
+        query_cache.store(URL, {'q': 'hot'}, [])
+        long_ago = timezone.now() - timedelta(days=1)
+        ExternalQueryCache.objects.update(last_accessed=long_ago)
+
+        with self.assertNumQueries(0):
+            query_cache.lookup(URL, {'q': 'hot'})
+        self.assertEqual(ExternalQueryCache.objects.get().last_accessed, long_ago)
+
+        with self.settings(QUERY_CACHE_TOUCH_INTERVAL=0), self.assertNumQueries(1):
+            query_cache.lookup(URL, {'q': 'hot'})
+        self.assertGreater(ExternalQueryCache.objects.get().last_accessed, long_ago)
+
+    @override_settings(QUERY_CACHE_DB_SIZE=2, QUERY_CACHE_EVICT_INTERVAL=0)
+    def test_database_tier_is_capped(self):
+        for i in range(4):
+            query_cache.store(URL, {'q': str(i)}, [])
+        self.assertEqual(ExternalQueryCache.objects.count(), 2)
+
+    @override_settings(QUERY_CACHE_DB_SIZE=1, QUERY_CACHE_EVICT_INTERVAL=60)
+    def test_database_tier_is_trimmed_once_per_interval(self):
+        with patch('library.query_cache._last_evict', None):
+            for i in range(3):
+                query_cache.store(URL, {'q': str(i)}, [])
+            self.assertEqual(ExternalQueryCache.objects.count(), 3)
+
+    @override_settings(QUERY_CACHE_TTL=60, QUERY_CACHE_STALE_TTL=60, BACKGROUND_JOBS_INLINE=True)
+    def test_stale_entry_is_served_and_refreshed(self):
+        query_cache.store(URL, {'q': 'x'}, ['old'])
+        ExternalQueryCache.objects.update(fetched_at=timezone.now() - timedelta(seconds=90))
+        query_cache.clear_memory()
+
+        entry = query_cache.lookup(URL, {'q': 'x'})
+        self.assertFalse(entry.is_fresh())
+        self.assertTrue(entry.is_usable())
+
+        fetch = MagicMock(return_value=['new'])
+        with self.captureOnCommitCallbacks(execute=True):
+            query_cache.revalidate(URL, {'q': 'x'}, fetch)
+        fetch.assert_called_once()
+        self.assertEqual(query_cache.lookup(URL, {'q': 'x'}).payload, ['new'])
+
+    @override_settings(QUERY_CACHE_TTL=60, QUERY_CACHE_STALE_TTL=60)
+    def test_expired_memory_entry_falls_back_to_a_refreshed_row(self):
+        query_cache.store(URL, {'q': 'x'}, ['old'])
+        key = query_cache.make_key(URL, {'q': 'x'})
+        expired = query_cache._get_memory().get(key)._replace(fetched_at=timezone.now() - timedelta(seconds=300))
+        query_cache._get_memory().set(key, expired)
+        # Another process refreshed the row meanwhile.
+        ExternalQueryCache.objects.update(payload=['new'], fetched_at=timezone.now())
+
+        entry = query_cache.lookup(URL, {'q': 'x'})
+        self.assertEqual(entry.payload, ['new'])
+        self.assertTrue(entry.is_fresh())
+
+    @override_settings(QUERY_CACHE_MEMORY_SIZE=1)
+    def test_memory_size_is_read_when_the_cache_is_created(self):
+        query_cache.store(URL, {'q': 'a'}, [])
+        query_cache.store(URL, {'q': 'b'}, [])
+        self.assertEqual(len(query_cache._get_memory()), 1)
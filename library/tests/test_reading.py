@@ -4,9 +4,9 @@ from django.test import TestCase
 from django.urls import reverse
 from django.utils import timezone
 from ..models import ReadingSession, EbookFile
-from .utils import create_user, login, create_book
+from .utils import TempMediaRootMixin, create_user, login, create_book
 
-class ReadingEndpointsTests(TestCase):
+class ReadingEndpointsTests(TempMediaRootMixin, TestCase):
     def setUp(self):
         self.user, self.pw = create_user()
         login(self.client, self.user, self.pw)
@@ -1,17 +1,34 @@
+import threading
+from concurrent.futures import Future
+from datetime import timedelta
+from io import StringIO
+import time
 from unittest.mock import patch, MagicMock
-from django.test import TestCase
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from django.urls import reverse
-from .utils import create_user, login, create_book
+from .. import local_recommender, query_cache, title_index
+from ..models import Book, ReadingSession, UserRecommendation
+from ..recommendations import (RECOMMENDATIONS_LIMIT, Signal, _store_late_answer, get_google_books_recommendations,
+                               has_enough, interleave, match_signal, weigh_signals)
+from .utils import TempMediaRootMixin, create_user, login, create_book
 
-class RecommendationsTests(TestCase):
+@override_settings(BACKGROUND_JOBS_INLINE=True)
+class RecommendationsTests(TempMediaRootMixin, TestCase):
     def setUp(self):
+        query_cache.clear_memory()
+        local_recommender.reset()
+        title_index.reset()
         self.user, self.pw = create_user()
         login(self.client, self.user, self.pw)
         b = create_book(self.user, title="Read One", author="Some Author", genre="Fantasy", mood="Funny")
-        b.status = 'read'
-        b.save()
+        with self.captureOnCommitCallbacks(execute=False):
+            b.status = 'read'
+            b.save()
 
-    @patch('library.views.requests.get')  
+    @patch('library.http_client.get')  
     def test_external_recommendations_dedup_and_limit(self, mock_get):
         def mk_item(title, authors=None):
             return {
@@ -28,8 +45,224 @@ class RecommendationsTests(TestCase):
         mock_resp.json.return_value = {'items': [mk_item(f"Title {i}") for i in range(1, 8)]}
         mock_get.return_value = mock_resp
 
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.get(reverse('main'))
+        self.assertTrue(res.context['recommendations_pending'])
+        self.assertEqual(res.context['external_recommendations'], [])
+
         res = self.client.get(reverse('main'))
         self.assertEqual(res.status_code, 200)
         self.assertIn('external_recommendations', res.context)
         self.assertGreaterEqual(len(res.context['external_recommendations']), 1)
         self.assertLessEqual(len(res.context['external_recommendations']), 10)
+
+    @patch('library.http_client.get')
+    def test_main_page_never_fetches_inline(self, mock_get):
+        UserRecommendation.objects.create(
+            user=self.user, items=[{'title': 'Cached'}], refreshed_at=timezone.now(), is_stale=False
+        )
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            res = self.client.get(reverse('main'))
+        self.assertEqual(res.context['external_recommendations'], [{'title': 'Cached'}])
+        self.assertEqual(callbacks, [])
+        mock_get.assert_not_called()
+
+    @patch('library.http_client.get')
+    def test_finishing_a_book_marks_entry_stale(self, mock_get):
+        mock_get.return_value = _items_response(['Fresh'])
+        UserRecommendation.objects.create(user=self.user, items=[], refreshed_at=timezone.now(), is_stale=False)
+        book = create_book(self.user, title="Another", author="Other Author", create_ebook=False)
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            book.save()
+        self.assertEqual(callbacks, [])
+
+        book = Book.objects.get(id=book.id)
+        book.status = 'read'
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+
+        recommendation = UserRecommendation.objects.get(user=self.user)
+        self.assertFalse(recommendation.is_stale)
+        self.assertIn('Fresh', [item['title'] for item in recommendation.items])
+
+    @patch('library.http_client.get')
+    def test_refresh_command_fills_missing_entries(self, mock_get):
+        mock_get.return_value = _items_response(['From command'])
+        call_command('refresh_recommendations', stdout=StringIO())
+        recommendation = UserRecommendation.objects.get(user=self.user)
+        self.assertEqual(recommendation.items[0]['title'], 'From command')
+
+
+def _items_response(titles):
+    resp = MagicMock()
+    resp.status_code = 200
+    resp.json.return_value = {'items': [{'volumeInfo': {'title': t, 'authors': ['Anon']}} for t in titles]}
+    return resp
+
+
+class RecommendationsFanOutTests(TestCase):
+    def setUp(self):
+        query_cache.clear_memory()
+        local_recommender.reset()
+        title_index.reset()
+        # Late answers are stored from worker threads, outside the test's transaction.
+        self.store_late = patch('library.recommendations._store_late_answer').start()
+        self.addCleanup(patch.stopall)
+        self.user, _ = create_user()
+        for i in range(4):
+            create_book(self.user, title=f"Read {i}", author=f"Author {i}", genre="Fantasy" if i % 2 else "Drama",
+                        mood="Sad", status='read', create_ebook=False)
+
+    @override_settings(GOOGLE_BOOKS_DEADLINE=0.5)
+    @patch('library.http_client.get')
+    def test_slow_query_does_not_block_past_deadline(self, mock_get):
+        release = threading.Event()
+
+        def fake_get(url, params=None, timeout=None):
+            self.assertLessEqual(max(timeout), 0.5)
+            if params['q'].startswith('subject:'):
+                release.wait(5)
+            return _items_response([f"{params['q']} #{i}" for i in range(2)])
+        mock_get.side_effect = fake_get
+
+        started = time.monotonic()
+        recs = get_google_books_recommendations(Book.objects.filter(added_by=self.user, status='read'))
+        elapsed = time.monotonic() - started
+        release.set()
+
+        self.assertLess(elapsed, 2)
+        self.assertEqual(len(recs), 4)
+        self.assertFalse(any(r['title'].startswith('subject:') for r in recs))
+
+        # The abandoned request still hands its answer over to the cache.
+        for _ in range(50):
+            if self.store_late.call_count:
+                break
+            time.sleep(0.1)
+        params, future = self.store_late.call_args.args
+        self.assertTrue(params['q'].startswith('subject:'))
+        self.assertEqual(len(future.result(timeout=5)), 2)
+
+    def test_late_answer_is_cached(self):
+        params = {'q': 'subject:"Drama"'}
+        future = Future()
+        future.set_result(['Тютюн'])
+        _store_late_answer(params, future)
+        self.assertEqual(query_cache.lookup(settings.GOOGLE_BOOKS_API_URL, params).payload, ['Тютюн'])
+
+    @patch('library.http_client.get')
+    def test_stops_once_limit_is_reached(self, mock_get):
+        mock_get.side_effect = lambda url, params=None, timeout=None: _items_response(
+            [f"{params['q']} #{i}" for i in range(6)]
+        )
+
+        recs = get_google_books_recommendations(Book.objects.filter(added_by=self.user, status='read'))
+        self.assertEqual(len(recs), 10)
+        self.assertEqual(len({r['title'] for r in recs}), 10)
+
+    @patch('library.http_client.get')
+    def test_repeated_queries_are_served_from_cache(self, mock_get):
+        mock_get.side_effect = lambda url, params=None, timeout=None: _items_response([f"{params['q']} #1"])
+        read_books = Book.objects.filter(added_by=self.user, status='read')
+
+        first = get_google_books_recommendations(read_books)
+        calls = mock_get.call_count
+        query_cache.clear_memory()
+        local_recommender.reset()
+        title_index.reset()
+        second = get_google_books_recommendations(read_books)
+
+        self.assertEqual(calls, 3)
+        self.assertEqual(mock_get.call_count, calls)
+        self.assertEqual(sorted(r['title'] for r in first), sorted(r['title'] for r in second))
+
+    @patch('library.http_client.get')
+    def test_titles_already_in_catalog_are_skipped(self, mock_get):
+        other, _ = create_user('other')
+        create_book(other, title="Под игото", create_ebook=False)
+        mock_get.return_value = _items_response(["под  игото!", "Железният светилник"])
+
+        recs = get_google_books_recommendations(Book.objects.filter(added_by=self.user, status='read'))
+        self.assertEqual([r['title'] for r in recs], ["Железният светилник"])
+
+
+class QueryPlannerTests(TestCase):
+    def setUp(self):
+        query_cache.clear_memory()
+        local_recommender.reset()
+        title_index.reset()
+        # Late answers are stored from worker threads, outside the test's transaction.
+        self.store_late = patch('library.recommendations._store_late_answer').start()
+        self.addCleanup(patch.stopall)
+        self.user, _ = create_user()
+
+    def read_books(self):
+        return Book.objects.filter(added_by=self.user, status='read')
+
+    @patch('library.http_client.get')
+    def test_call_count_does_not_grow_with_library(self, mock_get):
+        mock_get.side_effect = lambda url, params=None, timeout=None: _items_response([f"{params['q']} #1"])
+        for i in range(30):
+            create_book(self.user, title=f"Read {i}", author=f"Author {i}", genre=f"Genre {i % 7}",
+                        mood=f"Mood {i % 5}", status='read', create_ebook=False)
+
+        get_google_books_recommendations(self.read_books())
+        self.assertEqual(mock_get.call_count, 3)
+        queries = [call.kwargs['params']['q'] for call in mock_get.call_args_list]
+        self.assertEqual(sum(q.count('inauthor:') for q in queries), 3)
+        self.assertEqual(sum(q.count('subject:') for q in queries), 3)
+
+    def test_signals_favour_frequent_and_recent_reading(self):
+        old = create_book(self.user, title="Old", author="Vazov", status='read', create_ebook=False)
+        recent = create_book(self.user, title="Recent", author="Yovkov", status='read', create_ebook=False)
+        create_book(self.user, title="Other", author="Vazov", status='read', create_ebook=False)
+        now = timezone.now()
+        for book, days in ((old, 400), (recent, 1)):
+            ReadingSession.objects.create(user=self.user, book=book, start_time=now - timedelta(days=days, hours=1),
+                                          end_time=now - timedelta(days=days), pages_read=10)
+
+        authors = [signal.value for signal in weigh_signals(self.read_books())['author']]
+        self.assertEqual(authors, ["Yovkov", "Vazov"])
+
+    def test_results_are_split_back_per_signal(self):
+        strong = Signal('author', 'Vazov', 2.0)
+        weak = Signal('author', 'Yovkov', 1.0)
+        self.assertEqual(match_signal({'authors': ['Йордан', 'Yovkov']}, [strong, weak]), weak)
+        self.assertEqual(match_signal({'authors': ['Unknown']}, [strong, weak]), strong)
+
+        picked = interleave({strong: ['s1', 's2', 's3'], weak: ['w1', 'w2']}, 4)
+        self.assertEqual(picked, ['s1', 's2', 'w1', 's3'])
+
+    def test_collection_stops_once_open_queries_cannot_change_the_pick(self):
+        strong = Signal('author', 'Vazov', 2.0)
+        weak = Signal('genre', 'Drama', 1.0)
+        # The weak signal still gets a slot, so its query is worth waiting for.
+        self.assertFalse(has_enough({strong: ['s1', 's2', 's3']}, {weak}, 3))
+        # With one slot left the strong signal takes it whatever else arrives.
+        self.assertTrue(has_enough({strong: ['s1']}, {weak}, 1))
+        # A short answer gives its slots to the signals still open.
+        self.assertFalse(has_enough({weak: ['w1']}, {strong}, 3))
+        self.assertTrue(has_enough({weak: ['w1'], strong: ['s1', 's2']}, {strong}, 3))
+
+    @override_settings(GOOGLE_BOOKS_DEADLINE=10)
+    @patch('library.recommendations.local_recommender.recommend')
+    @patch('library.http_client.get')
+    def test_fan_out_stops_once_enough_results_are_in(self, mock_get, mock_local):
+        mock_local.return_value = [{'title': f"Local {i}"} for i in range(RECOMMENDATIONS_LIMIT - 1)]
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def fake_get(url, params=None, timeout=None):
+            if not params['q'].startswith('inauthor:'):
+                release.wait(5)
+            return _items_response([f"{params['q']} #{i}" for i in range(3)])
+        mock_get.side_effect = fake_get
+        create_book(self.user, title="Read", author="Vazov", genre="Drama", mood="Sad", status='read',
+                    create_ebook=False)
+
+        started = time.monotonic()
+        recs = get_google_books_recommendations(self.read_books())
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(len(recs), RECOMMENDATIONS_LIMIT)
+        self.assertTrue(recs[-1]['title'].startswith('inauthor:'))
@@ -0,0 +1,206 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.templatetags.static import static
+from django.urls import reverse
+from PIL import Image
+
+from .. import renditions
+from ..models import EbookFile
+from .utils import TempMediaRootMixin, create_book, create_user, login, make_image_file, make_text_pdf, upload_pdf
+
+
+class FakeRasterizer:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, path, page, width):
+        self.calls.append((page, width))
+        return Image.new('RGB', (width * 2, width * 3), 'white')
+
+
+@override_settings(BACKGROUND_JOBS_INLINE=True)
+class RenditionTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        # The rendition cache is measured on disk, so each test starts empty.
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user, self.pw = create_user()
+        login(self.client, self.user, self.pw)
+        self.book = create_book(self.user)
+        self.ebook = self.book.ebookfile
+
+        renditions.reset()
+        self.rasterizer = FakeRasterizer()
+        patcher = patch('library.renditions.get_rasterizer', return_value=self.rasterizer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _image(self, response):
+        return Image.open(BytesIO(b''.join(response.streaming_content)))
+
+    def test_miss_is_rendered_in_the_background(self):
+        url = reverse('page_image', args=[self.book.id, 2, 'thumb'])
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.get(url)
+        self.assertRedirects(response, static('images/book_placeholder.jpg'), fetch_redirect_response=False)
+        self.assertEqual(self.rasterizer.calls, [])
+
+        callbacks[-1]()
+        self.assertEqual(self.rasterizer.calls, [(2, 160)])
+
+    def test_page_is_rasterized_once(self):
+        url = reverse('page_image', args=[self.book.id, 2, 'thumb'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.get(url).status_code, 302)
+
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Content-Type'], 'image/jpeg')
+        self.assertEqual(self._image(first).size, (160, 240))
+
+        second = self.client.get(url)
+        self.assertEqual(second.status_code, 200)
+        self._image(second)
+        self.assertEqual(self.rasterizer.calls, [(2, 160)])
+
+    def test_conditional_request(self):
+        url = reverse('page_image', args=[self.book.id, 1, 'cover'])
+        renditions.render(self.ebook, 1, 'cover')
+        response = self.client.get(url)
+        self._image(response)
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_invalid_requests(self):
+        EbookFile.objects.filter(id=self.ebook.id).update(page_count=3)
+        self.assertEqual(self.client.get(reverse('page_image', args=[self.book.id, 1, 'huge'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('page_image', args=[self.book.id, 4, 'thumb'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('page_image', args=[self.book.id, 0, 'thumb'])).status_code, 404)
+        self.assertEqual(self.rasterizer.calls, [])
+
+    def test_cache_name_follows_file_content(self):
+        before = renditions.cache_name(self.ebook.file.storage, self.ebook.file.name, 1, 'thumb')
+        self.ebook.file = upload_pdf('other.pdf', b'%PDF-1.4\n%other')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ebook.save()
+        after = renditions.cache_name(self.ebook.file.storage, self.ebook.file.name, 1, 'thumb')
+        self.assertNotEqual(before, after)
+        self.assertNotEqual(
+            renditions.cache_name(self.ebook.file.storage, self.ebook.file.name, 1, 'cover'), after
+        )
+
+    def test_least_recently_used_files_are_evicted(self):
+        names = [renditions.render(self.ebook, page, 'thumb') for page in (1, 2, 3)]
+        now = time.time()
+        for age, name in zip((300, 200, 100), names):
+            os.utime(default_storage.path(name), (now - age, now - age))
+        renditions.render(self.ebook, 1, 'thumb')  # a hit makes page 1 the newest
+
+        sizes = [default_storage.size(name) for name in names]
+        removed = renditions.evict(max_bytes=sizes[0] + sizes[2])
+        self.assertEqual(removed, 1)
+        self.assertEqual([default_storage.exists(name) for name in names], [True, False, True])
+
+    def test_cache_is_not_walked_on_every_miss(self):
+        with patch('library.renditions.os.walk', wraps=os.walk) as walk:
+            for page in (1, 2, 3):
+                renditions.render(self.ebook, page, 'thumb')
+        self.assertEqual(walk.call_count, 1)
+
+        with self.settings(RENDITION_CACHE_MAX_BYTES=1), \
+                patch('library.renditions.os.walk', wraps=os.walk) as walk:
+            renditions.render(self.ebook, 4, 'thumb')
+        self.assertEqual(walk.call_count, 1)
+
+    def test_broken_pdf_does_not_fail_pages(self):
+        def broken(path, page, width):
+            raise RuntimeError("damaged file")
+
+        with patch('library.renditions.get_rasterizer', return_value=broken), \
+                self.assertLogs('library.renditions', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('page_image', args=[self.book.id, 1, 'thumb']))
+            self.assertRedirects(response, static('images/book_placeholder.jpg'), fetch_redirect_response=False)
+            response = self.client.get(reverse('book_cover', args=[self.book.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].endswith('images/no_cover.png'))
+
+    def test_other_users_books_are_private(self):
+        other, pw = create_user("other")
+        self.client.logout()
+        login(self.client, other, pw)
+        self.assertEqual(self.client.get(reverse('page_image', args=[self.book.id, 1, 'thumb'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('book_cover', args=[self.book.id])).status_code, 404)
+        self.assertEqual(self.rasterizer.calls, [])
+
+    def test_library_page_does_not_query_per_book(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('my_added_books'))
+            return len(queries)
+
+        before = count_queries()
+        for number in range(3):
+            create_book(self.user, title=f"Extra {number}")
+        self.assertEqual(count_queries(), before)
+
+    def test_cover_falls_back_to_first_page(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('book_cover', args=[self.book.id]))
+        self.assertTrue(response['Location'].endswith('images/no_cover.png'))
+
+        response = self.client.get(reverse('book_cover', args=[self.book.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._image(response).width, 320)
+        self.assertEqual(self.rasterizer.calls, [(1, 320)])
+
+    def test_cover_uses_uploaded_image(self):
+        self.book.cover_image = make_image_file()
+        self.book.save()
+        response = self.client.get(reverse('book_cover', args=[self.book.id]))
+        self.assertRedirects(response, self.book.cover_image.url, fetch_redirect_response=False)
+
+    def test_cover_placeholder_without_rasterizer(self):
+        with patch('library.renditions.get_rasterizer', side_effect=renditions.RasterizerUnavailable):
+            response = self.client.get(reverse('book_cover', args=[self.book.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].endswith('images/no_cover.png'))
+
+    def test_library_shows_generated_cover(self):
+        response = self.client.get(reverse('my_added_books'))
+        self.assertContains(response, reverse('book_cover', args=[self.book.id]))
+
+    def test_ingestion_renders_first_page(self):
+        book = create_book(self.user, title="Scanned", create_ebook=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            EbookFile.objects.create(book=book, file=upload_pdf('scan.pdf', make_text_pdf(["one", "two"])))
+        widths = sorted(width for page, width in self.rasterizer.calls if page == 1)
+        self.assertEqual(widths, [160, 320, 1000])
+
+    def test_cache_is_not_public(self):
+        name = renditions.render(self.ebook, 1, 'thumb')
+        self.client.logout()
+        response = self.client.get('/' + 'media/' + name)
+        self.assertEqual(response.status_code, 302)
+
+
+@unittest.skipUnless(
+    renditions._pymupdf_installed() or shutil.which('pdftoppm'), "no PDF rasterizer installed"
+)
+class RasterizerTests(TestCase):
+    def test_real_rasterizer(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'book.pdf')
+        with open(path, 'wb') as handle:
+            handle.write(make_text_pdf(["first page"]))
+        image = renditions.get_rasterizer()(path, 1, 200)
+        self.assertEqual(image.width, 200)
@@ -0,0 +1,111 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import search
+from ..models import Chapter, EbookFile, JournalEntry, MyBook, SavedQuote, SearchDocument
+from .utils import TempMediaRootMixin, create_book, create_user, login, make_text_pdf, upload_pdf
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user, self.pw = create_user()
+        login(self.client, self.user, self.pw)
+        self.book = create_book(self.user, title="Под игото", create_ebook=False)
+
+    def _search(self, query):
+        res = self.client.get(reverse('search_library'), {'q': query})
+        self.assertEqual(res.status_code, 200)
+        return res.json()['results']
+
+    def test_quotes_and_notes_are_indexed(self):
+        SavedQuote.objects.create(book=self.book, user=self.user, quote_text="Свобода или смърт", page=12)
+        JournalEntry.objects.create(book=self.book, user=self.user, page="40-42", content="Бележка за свободата")
+
+        results = self._search("свобод")
+        self.assertEqual({r['kind'] for r in results}, {'quote', 'note'})
+        pages = {r['kind']: r['page'] for r in results}
+        self.assertEqual(pages, {'quote': 12, 'note': 40})
+        self.assertTrue(all('<mark>' in r['snippet'] for r in results))
+
+    def test_chapter_html_is_stripped(self):
+        mybook = MyBook.objects.create(user=self.user, title="Моя книга")
+        chapter = Chapter.objects.create(mybook=mybook, title="Начало", content="<p>Тиха <b>вечер</b></p>")
+        document = SearchDocument.objects.get(kind='chapter', object_id=chapter.id)
+        self.assertEqual(document.body, "Тиха вечер")
+
+        results = self._search("вечер")
+        self.assertEqual(results[0]['url'], reverse('view_mybook', args=[mybook.id]))
+
+    def test_description_follows_the_book(self):
+        self.book.description = "Роман за Априлското въстание"
+        self.book.save()
+        self.assertEqual(self._search("въстание")[0]['kind'], 'book')
+
+        self.book.description = ""
+        self.book.save()
+        self.assertEqual(self._search("въстание"), [])
+
+    def test_deleted_items_leave_the_index(self):
+        quote = SavedQuote.objects.create(book=self.book, user=self.user, quote_text="Чичовци", page=1)
+        quote.delete()
+        self.assertFalse(SearchDocument.objects.filter(kind='quote').exists())
+        self.assertEqual(self._search("чичовци"), [])
+
+    def test_results_are_limited_to_the_user(self):
+        other, _ = create_user("other")
+        other_book = create_book(other, title="Чужда", create_ebook=False)
+        SavedQuote.objects.create(book=other_book, user=other, quote_text="Тайна мисъл", page=3)
+        self.assertEqual(self._search("тайна"), [])
+
+    def test_title_matches_rank_higher(self):
+        SavedQuote.objects.create(book=self.book, user=self.user, quote_text="Игото тежи", page=1)
+        JournalEntry.objects.create(book=self.book, user=self.user, page="2", content="Нищо общо")
+        mybook = MyBook.objects.create(user=self.user, title="Игото")
+        Chapter.objects.create(mybook=mybook, title="Игото", content="игото игото")
+        results = self._search("игото")
+        self.assertEqual(results[0]['kind'], 'chapter')
+
+    def test_snippet_is_escaped(self):
+        SavedQuote.objects.create(book=self.book, user=self.user, quote_text="<script>поп</script> Ставри", page=1)
+        snippet = self._search("ставри")[0]['snippet']
+        self.assertNotIn('<script>', snippet)
+        self.assertIn('<mark>Ставри</mark>', snippet)
+
+    def test_empty_query(self):
+        self.assertEqual(self._search(""), [])
+        self.assertEqual(self._search("!!!"), [])
+
+    @override_settings(SEARCH_BACKEND='basic')
+    def test_basic_backend(self):
+        self.assertIsInstance(search.get_backend(), search.BasicBackend)
+        SavedQuote.objects.create(book=self.book, user=self.user, quote_text="Бай Марко пие кафе", page=5)
+        results = self._search("марко")
+        self.assertEqual(len(results), 1)
+        self.assertIn('<mark>Марко</mark>', results[0]['snippet'])
+
+    def test_rebuild_command(self):
+        SavedQuote.objects.create(book=self.book, user=self.user, quote_text="Кандов", page=1)
+        SearchDocument.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self._search("кандов")[0]['kind'], 'quote')
+
+
+@override_settings(BACKGROUND_JOBS_INLINE=True)
+class PageSearchTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        self.user, self.pw = create_user()
+        login(self.client, self.user, self.pw)
+        self.book = create_book(self.user, title="Travels", create_ebook=False)
+
+    def test_ingested_pages_are_searchable(self):
+        content = make_text_pdf(["The harbour at dawn", "Mountains in the distance", "Back to the harbour"])
+        with self.captureOnCommitCallbacks(execute=True):
+            EbookFile.objects.create(book=self.book, file=upload_pdf("travels.pdf", content))
+
+        results = self.client.get(reverse('search_library'), {'q': 'harb'}).json()['results']
+        self.assertEqual(sorted(r['page'] for r in results), [1, 3])
+        self.assertTrue(all(r['kind'] == 'page' for r in results))
+        self.assertEqual(results[0]['url'], reverse('read_book', args=[self.book.id]) + f"#page={results[0]['page']}")
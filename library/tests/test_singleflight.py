@@ -0,0 +1,127 @@
+import asyncio
+import tempfile
+import threading
+import time
+import unittest
+
+from django.test import SimpleTestCase, override_settings
+
+from .. import singleflight
+
+
+@override_settings(SINGLEFLIGHT_WAIT_TIMEOUT=2)
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        self.lock_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.lock_dir.cleanup)
+        settings_override = override_settings(SINGLEFLIGHT_LOCK_DIR=self.lock_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _run_concurrently(self, count, target):
+        results = [None] * count
+        threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, target())) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_callers_share_one_computation(self):
+        calls = []
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            release.wait(1)
+            return "value"
+
+        threading.Timer(0.2, release.set).start()
+        results = self._run_concurrently(5, lambda: singleflight.do("key", compute))
+
+        self.assertEqual(results, ["value"] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_followers_can_take_stale_value(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def compute():
+            started.set()
+            release.wait(1)
+            return "fresh"
+
+        leader = threading.Thread(target=lambda: singleflight.do("key", compute))
+        leader.start()
+        started.wait(1)
+        self.assertEqual(singleflight.do("key", compute, stale="old"), "old")
+        release.set()
+        leader.join()
+
+    def test_errors_reach_waiting_callers(self):
+        def compute():
+            time.sleep(0.2)
+            raise ValueError("boom")
+
+        def call():
+            try:
+                singleflight.do("key", compute)
+            except ValueError as exc:
+                return str(exc)
+
+        self.assertEqual(self._run_concurrently(3, call), ["boom"] * 3)
+
+    def test_key_is_free_again_after_completion(self):
+        self.assertEqual(singleflight.do("key", lambda: 1), 1)
+        self.assertEqual(singleflight.do("key", lambda: 2), 2)
+
+    @unittest.skipIf(singleflight.fcntl is None, "needs fcntl")
+    def test_waiting_on_another_process_rechecks_first(self):
+        fcntl = singleflight.fcntl
+        with open(singleflight._lock_path("key"), "a+") as other_process:
+            fcntl.flock(other_process.fileno(), fcntl.LOCK_EX)
+            self.assertEqual(singleflight.do("key", lambda: "fresh", stale="old"), "old")
+
+            threading.Timer(0.2, fcntl.flock, (other_process.fileno(), fcntl.LOCK_UN)).start()
+            result = singleflight.do("key", lambda: "fresh", recheck=lambda: "stored")
+
+        self.assertEqual(result, "stored")
+
+
+class AsyncSingleFlightTests(SimpleTestCase):
+    async def test_concurrent_coroutines_share_one_computation(self):
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "value"
+
+        results = await asyncio.gather(*(singleflight.ado("key", compute) for _ in range(5)))
+        self.assertEqual(results, ["value"] * 5)
+        self.assertEqual(len(calls), 1)
+
+    async def test_errors_reach_waiting_coroutines(self):
+        async def compute():
+            await asyncio.sleep(0.05)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(*(singleflight.ado("key", compute) for _ in range(3)), return_exceptions=True)
+        self.assertEqual([str(result) for result in results], ["boom"] * 3)
+
+    @unittest.skipIf(singleflight.fcntl is None, "needs fcntl")
+    async def test_waiting_on_another_process_rechecks_first(self):
+        fcntl = singleflight.fcntl
+
+        async def compute():
+            return "fresh"
+
+        async def recheck():
+            return "stored"
+
+        with open(singleflight._lock_path("key"), "a+") as other_process:
+            fcntl.flock(other_process.fileno(), fcntl.LOCK_EX)
+            asyncio.get_running_loop().call_later(0.2, fcntl.flock, other_process.fileno(), fcntl.LOCK_UN)
+            result = await singleflight.ado("key", compute, recheck=recheck)
+
+        self.assertEqual(result, "stored")
@@ -0,0 +1,32 @@
+from django.test import SimpleTestCase
+
+from ..text_normalization import fold, lemmatize_en, normalize, stem_bg
+
+
+class TextNormalizationTests(SimpleTestCase):
+    def test_fold_strips_case_and_punctuation(self):
+        self.assertEqual(fold('  "Running!" '), "running")
+        self.assertEqual(fold("Well-known,"), "well-known")
+        self.assertEqual(fold("(Don't)"), "don't")
+        self.assertEqual(fold("ＢＯＯＫ"), "book")
+
+    def test_english_forms_share_a_lemma(self):
+        for word in ("run", "runs", "ran", "running"):
+            self.assertEqual(lemmatize_en(word), "run")
+        self.assertEqual(lemmatize_en("hoped"), "hope")
+        self.assertEqual(lemmatize_en("walked"), "walk")
+        self.assertEqual(lemmatize_en("studies"), "study")
+        self.assertEqual(lemmatize_en("boxes"), "box")
+        self.assertEqual(lemmatize_en("children"), "child")
+
+    def test_english_words_that_only_look_inflected_are_kept(self):
+        for word in ("bus", "analysis", "glass", "sing", "red", "evening", "news", "during", "series", "left", "saw"):
+            self.assertEqual(lemmatize_en(word), word)
+
+    def test_bulgarian_forms_share_a_stem(self):
+        self.assertEqual({stem_bg(w) for w in ("котка", "котката", "котки", "котките")}, {"котк"})
+        self.assertEqual(stem_bg("мъжът"), "мъж")
+
+    def test_normalize_picks_rules_by_language(self):
+        self.assertEqual(normalize("Cats.", "en"), "cat")
+        self.assertEqual(normalize("Котките!", "bg"), "котк")
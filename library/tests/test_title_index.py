@@ -0,0 +1,67 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from .. import title_index
+from ..models import Book, normalize_title
+from .utils import create_user, create_book
+
+
+class TitleIndexTests(TestCase):
+    def setUp(self):
+        title_index.reset()
+        self.user, _ = create_user()
+
+    def test_normalized_title_ignores_case_spacing_and_punctuation(self):
+        self.assertEqual(normalize_title("  Под  игото: Роман! "), normalize_title("под игото роман"))
+        book = create_book(self.user, title="The Hobbit.", create_ebook=False)
+        self.assertEqual(Book.objects.get(id=book.id).normalized_title, "thehobbit")
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = title_index.BloomFilter(200)
+        for i in range(200):
+            bloom.add(f"title{i}")
+        self.assertTrue(all(f"title{i}" in bloom for i in range(200)))
+        self.assertLess(sum(f"other{i}" in bloom for i in range(1000)), 50)
+
+    def test_existing_titles_uses_one_query_per_batch(self):
+        create_book(self.user, title="The Hobbit", create_ebook=False)
+        create_book(self.user, title="Dune", create_ebook=False)
+        title_index.existing_titles(["warm up"])
+
+        with self.assertNumQueries(1):
+            found = title_index.existing_titles(["the hobbit!", "DUNE", "Nope"])
+        self.assertEqual(found, {"thehobbit", "dune"})
+
+    def test_books_added_after_build_are_seen(self):
+        title_index.existing_titles(["warm up"])
+        create_book(self.user, title="Emma", create_ebook=False)
+        self.assertEqual(title_index.existing_titles(["Emma"]), {"emma"})
+
+    @override_settings(TITLE_BLOOM_FILTER_CHECK_INTERVAL=0)
+    def test_books_renamed_by_other_workers_are_seen(self):
+        title_index.existing_titles(["warm up"])
+        # Another process: no save signal reaches this one.
+        book = create_book(self.user, title="Placeholder", create_ebook=False)
+        Book.objects.filter(id=book.id).update(
+            title="Persuasion", normalized_title="persuasion", updated_at=timezone.now() + timedelta(seconds=1),
+        )
+        self.assertEqual(title_index.existing_titles(["Persuasion"]), {"persuasion"})
+
+    @override_settings(TITLE_BLOOM_FILTER_CHECK_INTERVAL=0)
+    def test_saved_books_are_added_without_a_rebuild(self):
+        book = create_book(self.user, title="Emma", create_ebook=False)
+        title_index.existing_titles(["warm up"])
+        book.status = "read"
+        book.save()
+        Book.objects.filter(id=book.id).update(updated_at=timezone.now() + timedelta(seconds=1))
+        with patch.object(title_index, '_build') as build:
+            self.assertEqual(title_index.existing_titles(["Emma"]), {"emma"})
+        build.assert_not_called()
+
+    @override_settings(TITLE_BLOOM_FILTER_ENABLED=False)
+    def test_works_without_bloom_filter(self):
+        create_book(self.user, title="Emma", create_ebook=False)
+        with self.assertNumQueries(1):
+            self.assertEqual(title_index.existing_titles(["emma", "Persuasion"]), {"emma"})
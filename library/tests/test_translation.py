@@ -0,0 +1,116 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+import httpx
+from django.test import SimpleTestCase, override_settings
+
+from .. import http_client, translation
+from ..http_client import UpstreamUnavailable
+from ..translation import TranslatorPool
+
+
+class TranslatorPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.created = []
+
+        def factory():
+            client = MagicMock()
+            client.client.is_closed = False
+            self.created.append(client)
+            return client
+
+        self.factory = factory
+
+    def test_clients_are_reused(self):
+        pool = TranslatorPool(2, self.factory)
+        for _ in range(5):
+            with pool.borrow() as client:
+                client.translate("a")
+        self.assertEqual(len(self.created), 1)
+        self.assertEqual(pool.stats()['borrows'], 5)
+
+    def test_stats_are_logged_periodically(self):
+        pool = TranslatorPool(1, self.factory)
+        with self.settings(TRANSLATOR_POOL_STATS_INTERVAL=0.05):
+            with pool.borrow():
+                pass
+            time.sleep(0.06)
+            with self.assertLogs('library.translation', 'INFO') as logs:
+                with pool.borrow():
+                    pass
+        self.assertIn("Translator pool: 2 borrows", logs.output[0])
+
+    def test_borrowers_wait_for_a_free_client(self):
+        pool = TranslatorPool(1, self.factory)
+        held = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with pool.borrow():
+                held.set()
+                release.wait(1)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        held.wait(1)
+        with self.assertRaises(UpstreamUnavailable):
+            with pool.borrow(timeout=0.05):
+                pass
+
+        threading.Timer(0.1, release.set).start()
+        with pool.borrow(timeout=1):
+            pass
+        thread.join()
+
+        stats = pool.stats()
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertGreater(stats['wait_max'], 0.05)
+        self.assertEqual(len(self.created), 1)
+
+    def test_failed_clients_are_replaced(self):
+        pool = TranslatorPool(1, self.factory)
+        with self.assertRaises(ValueError):
+            with pool.borrow():
+                raise ValueError("bad response")
+        with pool.borrow() as client:
+            self.assertIs(client, self.created[1])
+        self.created[0].client.close.assert_called_once()
+        self.assertEqual(pool.stats()['recycled'], 1)
+
+    def test_rejected_calls_keep_the_client(self):
+        pool = TranslatorPool(1, self.factory)
+        with self.assertRaises(UpstreamUnavailable):
+            with pool.borrow():
+                raise UpstreamUnavailable("circuit open")
+        with pool.borrow() as client:
+            self.assertIs(client, self.created[0])
+        self.assertEqual(pool.stats()['recycled'], 0)
+
+    def test_closed_and_worn_out_clients_are_recycled(self):
+        pool = TranslatorPool(1, self.factory)
+        with pool.borrow() as client:
+            client.client.is_closed = True
+        with pool.borrow():
+            pass
+        self.assertEqual(len(self.created), 2)
+
+        with override_settings(TRANSLATOR_POOL_MAX_USES=2):
+            with pool.borrow():
+                pass
+            with pool.borrow():
+                pass
+        self.assertEqual(len(self.created), 3)
+
+
+@override_settings(OUTBOUND_HTTP={'default': {'failure_threshold': 1, 'retries': 0}})
+class GoogletransGuardTests(SimpleTestCase):
+    def setUp(self):
+        http_client.reset()
+
+    def test_timeouts_count_against_the_translator(self):
+        translator = MagicMock()
+        translator.translate.side_effect = httpx.ReadTimeout()
+        with self.assertRaises(httpx.ReadTimeout):
+            translation._googletrans(translator, "cat", "en", "bg")
+        self.assertEqual(http_client._get_upstream(translation.TRANSLATE_HOST).breaker.state, 'open')
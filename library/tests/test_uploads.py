@@ -0,0 +1,184 @@
+import hashlib
+import os
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import uploads
+from ..models import ChunkedUpload, EbookBlob, EbookFile
+from .utils import TempMediaRootMixin, create_user, login, make_text_pdf
+
+
+@override_settings(CHUNKED_UPLOAD_CHUNK_SIZE=1024, BACKGROUND_JOBS_INLINE=True)
+class ChunkedUploadTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        chunks = self.settings(CHUNKED_UPLOAD_DIR=os.path.join(self.media_root, 'chunks'))
+        chunks.enable()
+        self.addCleanup(chunks.disable)
+        self.user, self.pw = create_user()
+        login(self.client, self.user, self.pw)
+        self.content = make_text_pdf([f"Page {number} of a long scanned book" for number in range(1, 6)])
+
+    def _init(self, filename="big.pdf", size=None):
+        return self.client.post(
+            reverse('upload_init'),
+            data={'filename': filename, 'size': len(self.content) if size is None else size},
+            content_type='application/json',
+        )
+
+    def _put(self, upload_id, offset, data):
+        url = reverse('upload_chunk', args=[upload_id]) + f"?offset={offset}"
+        return self.client.put(url, data=data, content_type='application/octet-stream')
+
+    def _upload_all(self, upload_id, start=0):
+        offset = start
+        while offset < len(self.content):
+            res = self._put(upload_id, offset, self.content[offset:offset + 1024])
+            self.assertEqual(res.status_code, 200, res.content)
+            offset = res.json()['offset']
+        return self.client.post(reverse('upload_finalize', args=[upload_id]), data={}, content_type='application/json')
+
+    def test_upload_in_chunks(self):
+        res = self._init()
+        self.assertEqual(res.status_code, 201)
+        upload_id = res.json()['upload_id']
+
+        res = self._upload_all(upload_id)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['sha256'], hashlib.sha256(self.content).hexdigest())
+        upload = ChunkedUpload.objects.get(id=upload_id)
+        self.assertEqual(upload.status, 'complete')
+        with open(uploads.path(upload), 'rb') as handle:
+            self.assertEqual(handle.read(), self.content)
+
+    def test_resume_after_interruption(self):
+        upload_id = self._init().json()['upload_id']
+        self._put(upload_id, 0, self.content[:1024])
+        # The connection dropped halfway through the second chunk.
+        self._put(upload_id, 1024, self.content[1024:1500])
+        uploads._hashers.clear()
+
+        status = self.client.get(reverse('upload_chunk', args=[upload_id])).json()
+        self.assertEqual(status['offset'], 1500)
+
+        res = self._put(upload_id, 0, self.content[:1024])
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual(res.json()['offset'], 1500)
+
+        res = self._upload_all(upload_id, start=1500)
+        self.assertEqual(res.json()['sha256'], hashlib.sha256(self.content).hexdigest())
+
+    def test_stale_retry_keeps_confirmed_bytes(self):
+        upload_id = self._init().json()['upload_id']
+        self._put(upload_id, 0, self.content[:1024])
+        self._put(upload_id, 1024, self.content[1024:2048])
+
+        # A retry of the first chunk arriving after the second was confirmed.
+        self.assertEqual(self._put(upload_id, 0, self.content[:1024]).status_code, 409)
+        upload = ChunkedUpload.objects.get(id=upload_id)
+        with open(uploads.path(upload), 'rb') as handle:
+            self.assertEqual(handle.read(), self.content[:2048])
+
+    def test_finalize_checks_file_on_disk(self):
+        upload_id = self._init().json()['upload_id']
+        self._upload_all(upload_id)
+        upload = ChunkedUpload.objects.get(id=upload_id)
+        ChunkedUpload.objects.filter(id=upload_id).update(status='uploading', sha256='')
+        with open(uploads.path(upload), 'ab') as handle:
+            handle.write(b'garbage')
+
+        res = self.client.post(reverse('upload_finalize', args=[upload_id]), data={}, content_type='application/json')
+        self.assertEqual(res.status_code, 409)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self._init(filename="book.epub").status_code, 400)
+        self.assertEqual(self._init(size=0).status_code, 413)
+
+        upload_id = self._init().json()['upload_id']
+        self.assertEqual(self._put(upload_id, 0, b'x' * 2048).status_code, 413)
+        self.assertEqual(self._put(upload_id, len(self.content), b'x').status_code, 409)
+        res = self.client.post(reverse('upload_finalize', args=[upload_id]), data={}, content_type='application/json')
+        self.assertEqual(res.status_code, 409)
+
+    def test_checksum_mismatch(self):
+        upload_id = self._init().json()['upload_id']
+        for offset in range(0, len(self.content), 1024):
+            self._put(upload_id, offset, self.content[offset:offset + 1024])
+        res = self.client.post(
+            reverse('upload_finalize', args=[upload_id]), data={'sha256': '0' * 64}, content_type='application/json',
+        )
+        self.assertEqual(res.status_code, 400)
+
+    def test_uploads_are_private(self):
+        upload_id = self._init().json()['upload_id']
+        other, pw = create_user("other")
+        self.client.logout()
+        login(self.client, other, pw)
+        self.assertEqual(self.client.get(reverse('upload_chunk', args=[upload_id])).status_code, 404)
+        self.assertEqual(self._put(upload_id, 0, self.content[:1024]).status_code, 404)
+
+    def test_add_book_page_reverses_the_upload_urls(self):
+        placeholder = '00000000-0000-0000-0000-000000000000'
+        res = self.client.get(reverse('add_book'))
+        self.assertContains(res, reverse('upload_chunk', args=[placeholder]))
+        self.assertContains(res, reverse('upload_finalize', args=[placeholder]))
+        self.assertNotContains(res, "`/uploads/")
+
+    def test_add_book_with_finished_upload(self):
+        upload_id = self._init().json()['upload_id']
+        self._upload_all(upload_id)
+        upload = ChunkedUpload.objects.get(id=upload_id)
+        part = uploads.path(upload)
+
+        data = {
+            'title': 'Scanned', 'author': 'Me', 'genre': ['Fantasy'], 'mood': ['Funny'],
+            'isbn': '1', 'description': '', 'language': 'English', 'status': 'to_read',
+            'upload_id': upload_id,
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(reverse('add_book'), data)
+        self.assertRedirects(res, reverse('main'), fetch_redirect_response=False)
+
+        ebook = EbookFile.objects.get(book__title='Scanned')
+        self.assertEqual(ebook.blob, EbookBlob.objects.get(sha256=hashlib.sha256(self.content).hexdigest()))
+        self.assertEqual(ebook.page_count, 5)
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertFalse(os.path.exists(part))
+
+    def test_add_book_rejects_unfinished_upload(self):
+        upload_id = self._init().json()['upload_id']
+        data = {
+            'title': 'Scanned', 'author': 'Me', 'genre': ['Fantasy'], 'mood': ['Funny'],
+            'isbn': '1', 'description': '', 'language': 'English', 'status': 'to_read',
+            'upload_id': upload_id,
+        }
+        res = self.client.post(reverse('add_book'), data)
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, "Каченият файл не е намерен")
+        self.assertFalse(EbookFile.objects.filter(book__title='Scanned').exists())
+
+    def test_invalid_book_form_does_not_open_the_upload(self):
+        upload_id = self._init().json()['upload_id']
+        self._upload_all(upload_id)
+        data = {
+            'author': 'Me', 'genre': ['Fantasy'], 'mood': ['Funny'],
+            'isbn': '1', 'description': '', 'language': 'English', 'status': 'to_read',
+            'upload_id': upload_id,
+        }
+        with patch('library.uploads.open_file') as mock_open:
+            res = self.client.post(reverse('add_book'), data)
+        self.assertEqual(res.status_code, 200)
+        mock_open.assert_not_called()
+        self.assertTrue(ChunkedUpload.objects.filter(id=upload_id).exists())
+
+    def test_abandoned_uploads_expire(self):
+        upload_id = self._init().json()['upload_id']
+        upload = ChunkedUpload.objects.get(id=upload_id)
+        ChunkedUpload.objects.filter(id=upload_id).update(updated_at=timezone.now() - timedelta(days=2))
+
+        self._init()
+        self.assertFalse(ChunkedUpload.objects.filter(id=upload_id).exists())
+        self.assertFalse(os.path.exists(uploads.path(upload)))
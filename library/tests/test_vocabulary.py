@@ -0,0 +1,102 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import definition_cache
+from ..models import DefinitionCache, EbookFile, PageText, WordLookup
+from .utils import TempMediaRootMixin, create_book, create_user, login, make_text_pdf, upload_pdf
+
+
+@override_settings(BACKGROUND_JOBS_INLINE=True)
+class PageVocabularyTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        self.user, self.pw = create_user()
+        login(self.client, self.user, self.pw)
+        self.book = create_book(self.user, create_ebook=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            EbookFile.objects.create(book=self.book, file=upload_pdf("text.pdf", make_text_pdf([
+                "The weary travellers crossed the river at dawn.",
+                "Second page.",
+            ])))
+
+    def _url(self, page):
+        return reverse('page_vocabulary', args=[self.book.id, page])
+
+    @patch('library.vocabulary.warm_definitions')
+    def test_returns_candidates_without_stopwords_or_known_words(self, mock_warm):
+        WordLookup.objects.create(user=self.user, word="River", definition="река")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            data = self.client.get(self._url(1)).json()
+
+        self.assertEqual(data['words'], ["travellers", "crossed", "weary", "dawn"])
+        self.assertEqual(data['warming'], 4)
+        mock_warm.assert_called_once_with(["travellers", "crossed", "weary", "dawn"])
+
+    @patch('library.vocabulary.warm_definitions')
+    def test_cached_words_are_not_warmed_again(self, mock_warm):
+        definition_cache.store("weary", "en", "bg", {"translated": "уморен", "definitions": {}})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            data = self.client.get(self._url(1)).json()
+
+        self.assertIn("weary", data['words'])
+        self.assertEqual(data['warming'], len(data['words']) - 1)
+        self.assertNotIn("weary", mock_warm.call_args.args[0])
+
+    @patch('library.vocabulary.warm_definitions')
+    def test_expired_words_are_warmed_again(self, mock_warm):
+        definition_cache.store("weary", "en", "bg", {"translated": "уморен", "definitions": {}})
+        DefinitionCache.objects.update(fetched_at=timezone.now() - timedelta(seconds=settings.DEFINITION_CACHE_TTL + 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(self._url(1))
+
+        self.assertIn("weary", mock_warm.call_args.args[0])
+
+    @patch('library.dictionary.lookup')
+    def test_background_job_fills_definition_cache(self, mock_lookup):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(self._url(1))
+
+        self.assertEqual(
+            [c.args for c in mock_lookup.call_args_list],
+            [(w, "en", "bg") for w in ["travellers", "crossed", "weary", "river", "dawn"]],
+        )
+
+    def test_missing_page(self):
+        res = self.client.get(self._url(5))
+        self.assertEqual(res.status_code, 404)
+
+    @patch('library.vocabulary.warm_definitions')
+    def test_ingested_books_read_stored_page_text(self, mock_warm):
+        PageText.objects.filter(page_number=1).update(text="Stored lighthouse")
+
+        data = self.client.get(self._url(1)).json()
+        self.assertEqual(data['words'], ["lighthouse", "stored"])
+        self.assertEqual(self.client.get(self._url(3)).status_code, 404)
+
+    @patch('library.ingestion.schedule_ingest')
+    def test_book_not_ingested_yet(self, mock_schedule):
+        EbookFile.objects.filter(book=self.book).update(ingest_status='pending')
+        with patch('library.ingestion.PdfReader', side_effect=AssertionError("parsed in request")):
+            res = self.client.get(self._url(1))
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual(res.json()['words'], [])
+        mock_schedule.assert_called_once()
+
+    @patch('library.ingestion.schedule_ingest')
+    def test_book_being_ingested_is_not_scheduled_again(self, mock_schedule):
+        EbookFile.objects.filter(book=self.book).update(ingest_status='processing')
+        self.assertEqual(self.client.get(self._url(1)).status_code, 202)
+        mock_schedule.assert_not_called()
+
+    def test_other_users_books_are_not_readable(self):
+        other, pw = create_user("other")
+        self.client.logout()
+        login(self.client, other, pw)
+        self.assertEqual(self.client.get(self._url(1)).status_code, 404)
@@ -1,5 +1,8 @@
+import shutil
+import tempfile
+
 from django.contrib.auth.models import User
-from django.test import Client
+from django.test import Client, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from PIL import Image
 from io import BytesIO
@@ -7,6 +10,25 @@ from library.models import Book, EbookFile
 
 DEFAULT_PW = "testpass"
 
+
+class TempMediaRootMixin:
+    # Test classes that store files get a MEDIA_ROOT of their own, removed
+    # once the class has run. Put it before TestCase in the bases.
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp(prefix='dl_media_')
+        cls._media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls._media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        try:
+            super().tearDownClass()
+        finally:
+            cls._media_override.disable()
+            shutil.rmtree(cls.media_root, ignore_errors=True)
+
 def create_user(username="testuser", password=DEFAULT_PW):
     user, _ = User.objects.get_or_create(username=username, defaults={"email": f"{username}@example.com"})
     user.set_password(password)
@@ -21,6 +43,17 @@ def login(client: Client, user_or_username, password=DEFAULT_PW):
 def upload_pdf(file_name="test.pdf", content=b"%PDF-1.4\n%..."):
     return SimpleUploadedFile(file_name, content, content_type="application/pdf")
 
+def make_text_pdf(pages):
+    # A real PDF with one line of extractable text per page.
+    from reportlab.pdfgen import canvas
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for text in pages:
+        pdf.drawString(72, 720, text)
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
 def create_book(user, title="Test Book", author="Anon", genre=None, mood=None, status="to_read", create_ebook=True):
     def norm(x):
         if x is None: 
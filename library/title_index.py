@@ -0,0 +1,117 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Max
+
+from .models import Book, normalize_title
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.count = 0
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        # Only keys that set a new bit count towards capacity, so titles read
+        # again after a status or rating change do not fill the filter.
+        added = False
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        self.count += added
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+_bloom = None
+_version = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _build():
+    # Cold start, or the filter outgrew its capacity: one scan of the column.
+    global _bloom, _version
+    version = Book.objects.aggregate(version=Max('updated_at'))['version']
+    titles = Book.objects.values_list('normalized_title', flat=True)
+    bloom = BloomFilter(int(titles.count() * 1.5) + 1000)
+    for title in titles.iterator():
+        bloom.add(title)
+    _bloom, _version = bloom, version
+
+
+def _catch_up():
+    # Bloom filters only ever need insertions, so books saved since the last
+    # check (by this or another worker) are added through the updated_at
+    # index. Rows at exactly _version are read again, as a save in the same
+    # instant may have committed after the last check.
+    global _version
+    rows = Book.objects.all()
+    if _version is not None:
+        rows = rows.filter(updated_at__gte=_version)
+    for title, updated_at in rows.values_list('normalized_title', 'updated_at').iterator():
+        _bloom.add(title)
+        if _version is None or updated_at > _version:
+            _version = updated_at
+
+
+def _get_bloom():
+    # Built once per process from the indexed column, then kept current at
+    # most every TITLE_BLOOM_FILTER_CHECK_INTERVAL seconds.
+    global _checked_at
+    with _lock:
+        now = time.monotonic()
+        if _bloom is not None and now - _checked_at < settings.TITLE_BLOOM_FILTER_CHECK_INTERVAL:
+            return _bloom
+        _checked_at = now
+        if _bloom is None or _bloom.count > _bloom.capacity:
+            _build()
+        else:
+            _catch_up()
+        return _bloom
+
+
+def remember(title):
+    with _lock:
+        if _bloom is not None:
+            _bloom.add(normalize_title(title))
+
+
+def reset():
+    global _bloom, _version, _checked_at
+    with _lock:
+        _bloom, _version, _checked_at = None, None, 0.0
+
+
+def existing_titles(titles):
+    # Returns the normalized keys of the given titles that are already in the
+    # catalog, using one IN query for the whole batch. The Bloom filter drops
+    # keys that are certainly absent before they reach the database.
+    keys = {normalize_title(title) for title in titles}
+    keys.discard('')
+    if not keys:
+        return set()
+
+    if settings.TITLE_BLOOM_FILTER_ENABLED:
+        bloom = _get_bloom()
+        keys = {key for key in keys if key in bloom}
+        if not keys:
+            return set()
+
+    return set(Book.objects.filter(normalized_title__in=keys).values_list('normalized_title', flat=True))
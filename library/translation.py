@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from googletrans import Translator
+
+from . import http_client, upstream_fixtures
+
+TRANSLATE_HOST = "translate.googleapis.com"
+
+logger = logging.getLogger(__name__)
+
+# Joins texts for one batched request. Translators keep punctuation-only
+# lines as they are, so the result can be split back apart.
+BATCH_SEPARATOR = "\n§\n"
+
+
+class _Pooled:
+    def __init__(self, client):
+        self.client = client
+        self.created = time.monotonic()
+        self.uses = 0
+
+
+class TranslatorPool:
+    # Process-wide set of googletrans clients. Callers borrow one for a
+    # request and give it back; clients are created lazily up to size and
+    # replaced after an error, after max_uses or once they are max_age old.
+
+    def __init__(self, size, factory):
+        self.size = size
+        self.factory = factory
+        self._idle = []
+        self._live = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'borrows': 0, 'created': 0, 'recycled': 0, 'timeouts': 0,
+            'wait_total': 0.0, 'wait_max': 0.0,
+        }
+        self._logged_at = time.monotonic()
+
+    def _healthy(self, pooled):
+        if pooled.uses >= settings.TRANSLATOR_POOL_MAX_USES:
+            return False
+        if time.monotonic() - pooled.created >= settings.TRANSLATOR_POOL_MAX_AGE:
+            return False
+        session = getattr(pooled.client, 'client', None)
+        return not getattr(session, 'is_closed', False)
+
+    def _close(self, pooled):
+        self._stats['recycled'] += 1
+        session = getattr(pooled.client, 'client', None)
+        try:
+            session.close()
+        except Exception:
+            pass
+
+    def _acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                while self._idle:
+                    pooled = self._idle.pop()
+                    if self._healthy(pooled):
+                        return pooled
+                    self._live -= 1
+                    self._close(pooled)
+                if self._live < self.size:
+                    self._live += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise http_client.UpstreamUnavailable("No translator client available")
+                self._cond.wait(remaining)
+
+        try:
+            pooled = _Pooled(self.factory())
+        except Exception:
+            with self._cond:
+                self._live -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['created'] += 1
+        return pooled
+
+    def _release(self, pooled, healthy):
+        with self._cond:
+            if healthy:
+                pooled.uses += 1
+                self._idle.append(pooled)
+            else:
+                self._live -= 1
+                self._close(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def borrow(self, timeout=None):
+        started = time.monotonic()
+        pooled = self._acquire(settings.TRANSLATOR_POOL_TIMEOUT if timeout is None else timeout)
+        waited = time.monotonic() - started
+        with self._cond:
+            self._stats['borrows'] += 1
+            self._stats['wait_total'] += waited
+            self._stats['wait_max'] = max(self._stats['wait_max'], waited)
+        if waited >= settings.TRANSLATOR_POOL_SLOW_WAIT:
+            logger.warning("Waited %.2fs for a translator client (pool size %s)", waited, self.size)
+        self._log_stats()
+
+        try:
+            yield pooled.client
+        except http_client.UpstreamUnavailable:
+            # Turned away before the client was used; it is still healthy.
+            self._release(pooled, healthy=True)
+            raise
+        except Exception:
+            self._release(pooled, healthy=False)
+            raise
+        else:
+            self._release(pooled, healthy=True)
+
+    def stats(self):
+        # Wait times tell whether TRANSLATOR_POOL_SIZE fits the traffic.
+        with self._cond:
+            stats = dict(self._stats, size=self.size, live=self._live, idle=len(self._idle))
+        stats['wait_avg'] = stats['wait_total'] / stats['borrows'] if stats['borrows'] else 0.0
+        return stats
+
+    def _log_stats(self):
+        # Every TRANSLATOR_POOL_STATS_INTERVAL seconds of use, so each worker
+        # reports its own pool.
+        interval = settings.TRANSLATOR_POOL_STATS_INTERVAL
+        with self._cond:
+            if not interval or time.monotonic() - self._logged_at < interval:
+                return
+            self._logged_at = time.monotonic()
+        stats = self.stats()
+        logger.info(
+            "Translator pool: %(borrows)s borrows, avg wait %(wait_avg).3fs, max wait %(wait_max).3fs, "
+            "%(timeouts)s timeouts, %(created)s created, %(recycled)s recycled, %(live)s/%(size)s live",
+            stats,
+        )
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = TranslatorPool(settings.TRANSLATOR_POOL_SIZE, lambda: Translator())
+        return _pool
+
+
+def reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def _googletrans(translator, text, src, dest):
+    with http_client.guard(TRANSLATE_HOST, failures=http_client.HTTPX_ERRORS + (OSError,)):
+        return translator.translate(text, src=src, dest=dest).text
+
+
+def translate(text, src, dest, translator=None):
+    # Single entry point for translations. TRANSLATOR_URL points it at an
+    # HTTP stand-in (see fake_upstreams); fixtures can record or replay it.
+    request_data = {'text': text, 'src': src, 'dest': dest}
+    if upstream_fixtures.mode() == 'replay':
+        return upstream_fixtures.load('translate', request_data)['text']
+
+    if settings.TRANSLATOR_URL:
+        response = http_client.get(settings.TRANSLATOR_URL, params={'q': text, 'src': src, 'dest': dest})
+        response.raise_for_status()
+        result = response.json()['text']
+    else:
+        if translator is not None:
+            result = _googletrans(translator, text, src, dest)
+        else:
+            with get_pool().borrow() as pooled:
+                result = _googletrans(pooled, text, src, dest)
+
+    if upstream_fixtures.mode() == 'record':
+        upstream_fixtures.save('translate', request_data, {'text': result})
+    return result
+
+
+def _chunks(texts):
+    chunk, size = [], 0
+    for text in texts:
+        if chunk and size + len(text) > settings.TRANSLATION_BATCH_MAX_CHARS:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(text)
+        size += len(text) + len(BATCH_SEPARATOR)
+    if chunk:
+        yield chunk
+
+
+def _split_batch(chunk, translated):
+    parts = [part.strip() for part in translated.split(BATCH_SEPARATOR.strip())]
+    if len(parts) == len(chunk) and all(parts):
+        return parts
+    return None
+
+
+def translate_many(texts, src, dest, translator=None):
+    # Translates a list of texts in as few requests as possible: the texts are
+    # joined into chunks and split back afterwards. A chunk that does not come
+    # back with the same number of parts is translated item by item on a
+    # small thread pool instead.
+    results = []
+    for chunk in _chunks(texts):
+        if len(chunk) > 1:
+            parts = _split_batch(chunk, translate(BATCH_SEPARATOR.join(chunk), src, dest, translator))
+            if parts is not None:
+                results.extend(parts)
+                continue
+
+        workers = min(settings.TRANSLATION_MAX_WORKERS, len(chunk))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results.extend(executor.map(lambda text: translate(text, src, dest, translator), chunk))
+    return results
+
+
+async def atranslate(text, src, dest, translator=None):
+    # The HTTP translator is called without blocking the event loop;
+    # googletrans is synchronous and runs in a worker thread instead.
+    if upstream_fixtures.mode() == 'replay' or not settings.TRANSLATOR_URL:
+        return await asyncio.to_thread(translate, text, src, dest, translator)
+
+    response = await http_client.aget(settings.TRANSLATOR_URL, params={'q': text, 'src': src, 'dest': dest})
+    response.raise_for_status()
+    result = response.json()['text']
+
+    if upstream_fixtures.mode() == 'record':
+        upstream_fixtures.save('translate', {'text': text, 'src': src, 'dest': dest}, {'text': result})
+    return result
+
+
+async def atranslate_many(texts, src, dest, translator=None):
+    semaphore = asyncio.Semaphore(settings.TRANSLATION_MAX_WORKERS)
+
+    async def one(text):
+        async with semaphore:
+            return await atranslate(text, src, dest, translator)
+
+    async def chunk_results(chunk):
+        if len(chunk) > 1:
+            parts = _split_batch(chunk, await one(BATCH_SEPARATOR.join(chunk)))
+            if parts is not None:
+                return parts
+        return await asyncio.gather(*(one(text) for text in chunk))
+
+    chunks = await asyncio.gather(*(chunk_results(chunk) for chunk in _chunks(texts)))
+    return [result for chunk in chunks for result in chunk]
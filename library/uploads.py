@@ -0,0 +1,181 @@
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from .models import ChunkedUpload
+
+try:
+    import fcntl
+except ImportError:  # Windows: uploads are only serialised within a process.
+    fcntl = None
+
+CHUNK_SIZE = 64 * 1024
+PDF_MAGIC = b'%PDF-'
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+# SHA-256 of each upload so far, kept per process as (offset, hasher, last
+# used) so that every chunk is hashed once as it is written. A process that
+# did not see the earlier chunks (another worker, a restart) re-reads the file
+# up to the offset. Entries idle for CHUNKED_UPLOAD_EXPIRY are dropped, which
+# covers uploads finished or abandoned in another process.
+_hashers = {}
+_hashers_lock = threading.Lock()
+_local_lock = threading.Lock()
+
+
+def path(upload):
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, f"{upload.id}.part")
+
+
+@contextmanager
+def _locked(upload):
+    # Everything that reads or moves an upload's offset holds this, so a
+    # retried chunk waits for the attempt still in flight instead of racing it.
+    try:
+        handle = open(path(upload), 'r+b')
+    except FileNotFoundError:
+        raise UploadError("Качването не е намерено.", status=404)
+    with handle:
+        if fcntl is None:
+            with _local_lock:
+                yield handle
+            return
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield handle
+        finally:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def _take_hasher(upload):
+    with _hashers_lock:
+        entry = _hashers.pop(upload.id, None)
+    if entry is not None and entry[0] == upload.offset:
+        return entry[1]
+    hasher = hashlib.sha256()
+    remaining = upload.offset
+    with open(path(upload), 'rb') as handle:
+        while remaining > 0:
+            data = handle.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                break
+            hasher.update(data)
+            remaining -= len(data)
+    return hasher
+
+
+def _keep_hasher(upload, hasher):
+    now = time.monotonic()
+    with _hashers_lock:
+        for upload_id, (_, _, used) in list(_hashers.items()):
+            if now - used > settings.CHUNKED_UPLOAD_EXPIRY:
+                del _hashers[upload_id]
+        _hashers[upload.id] = (upload.offset, hasher, now)
+
+
+def create(user, filename, size):
+    filename = os.path.basename(filename or '').strip()
+    if not filename.lower().endswith('.pdf'):
+        raise UploadError("Позволени са само PDF файлове.")
+    if size <= 0 or size > settings.CHUNKED_UPLOAD_MAX_SIZE:
+        raise UploadError("Файлът е твърде голям.", status=413)
+    expire()
+    upload = ChunkedUpload.objects.create(user=user, filename=filename[:255], size=size)
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(path(upload), 'wb').close()
+    return upload
+
+
+def write_chunk(upload, offset, stream, length):
+    # Appends one chunk at the offset the server has confirmed so far. A chunk
+    # for any other offset gets 409 and the client resumes from upload.offset.
+    if length is None or length <= 0:
+        raise UploadError("Липсва съдържание.")
+    if length > settings.CHUNKED_UPLOAD_CHUNK_SIZE:
+        raise UploadError("Частта е твърде голяма.", status=413)
+
+    with _locked(upload) as handle:
+        upload.refresh_from_db(fields=['offset', 'status'])
+        if upload.status != 'uploading':
+            raise UploadError("Качването вече е завършено.", status=409)
+        if offset != upload.offset:
+            raise UploadError("Очаква се друга част от файла.", status=409)
+        if offset + length > upload.size:
+            raise UploadError("Частта надхвърля размера на файла.")
+
+        hasher = _take_hasher(upload)
+        # Anything past the confirmed offset is left over from a failed attempt.
+        handle.truncate(upload.offset)
+        handle.seek(upload.offset)
+        written = 0
+        while written < length:
+            data = stream.read(min(CHUNK_SIZE, length - written))
+            if not data:
+                break
+            handle.write(data)
+            hasher.update(data)
+            written += len(data)
+        handle.flush()
+        if written != length:
+            raise UploadError("Частта не е получена изцяло.")
+
+        ChunkedUpload.objects.filter(id=upload.id).update(offset=offset + written, updated_at=timezone.now())
+        upload.offset = offset + written
+        _keep_hasher(upload, hasher)
+    return upload.offset
+
+
+def finalize(upload, sha256=''):
+    with _locked(upload) as handle:
+        upload.refresh_from_db()
+        if upload.status == 'complete':
+            return upload
+        if upload.offset != upload.size or os.fstat(handle.fileno()).st_size != upload.size:
+            raise UploadError("Файлът не е качен изцяло.", status=409)
+        if handle.read(len(PDF_MAGIC)) != PDF_MAGIC:
+            raise UploadError("Файлът не е PDF.")
+        digest = _take_hasher(upload).hexdigest()
+        if sha256 and sha256.lower() != digest:
+            raise UploadError("Контролната сума не съвпада.")
+        upload.sha256 = digest
+        upload.status = 'complete'
+        upload.save(update_fields=['sha256', 'status', 'updated_at'])
+    return upload
+
+
+def open_file(upload):
+    # The finished upload as a file for EbookFile.file, carrying its digest
+    # so the blob store does not hash it again.
+    file = File(open(path(upload), 'rb'), name=upload.filename)
+    file.sha256 = upload.sha256
+    return file
+
+
+def discard(upload):
+    with _hashers_lock:
+        _hashers.pop(upload.id, None)
+    try:
+        os.remove(path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def expire():
+    # Uploads nobody touched for CHUNKED_UPLOAD_EXPIRY seconds are abandoned.
+    cutoff = timezone.now() - timedelta(seconds=settings.CHUNKED_UPLOAD_EXPIRY)
+    for upload in ChunkedUpload.objects.filter(updated_at__lt=cutoff):
+        discard(upload)
@@ -0,0 +1,59 @@
+import hashlib
+import json
+from pathlib import Path
+
+import requests
+from django.conf import settings
+
+
+class FixtureMissing(requests.RequestException):
+    pass
+
+
+def mode():
+    return getattr(settings, 'UPSTREAM_FIXTURES_MODE', 'off')
+
+
+def _path(kind, request_data):
+    raw = json.dumps([kind, request_data], ensure_ascii=False, sort_keys=True)
+    digest = hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    return Path(settings.UPSTREAM_FIXTURES_DIR) / kind / f"{digest}.json"
+
+
+def load(kind, request_data):
+    path = _path(kind, request_data)
+    if not path.exists():
+        raise FixtureMissing(f"No recorded {kind} fixture for {request_data}")
+    return json.loads(path.read_text(encoding='utf-8'))['response']
+
+
+def save(kind, request_data, response_data):
+    path = _path(kind, request_data)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        json.dumps({'request': request_data, 'response': response_data}, ensure_ascii=False, indent=2),
+        encoding='utf-8',
+    )
+
+
+def _http_request_data(method, url, params):
+    return {'method': method, 'url': url, 'params': {k: str(v) for k, v in sorted((params or {}).items())}}
+
+
+def replay_response(method, url, params):
+    data = load('http', _http_request_data(method, url, params))
+    response = requests.Response()
+    response.status_code = data['status']
+    response.headers.update(data['headers'])
+    response._content = data['body'].encode('utf-8')
+    response.encoding = 'utf-8'
+    response.url = url
+    return response
+
+
+def record_response(method, url, params, response):
+    save('http', _http_request_data(method, url, params), {
+        'status': response.status_code,
+        'headers': {'Content-Type': response.headers.get('Content-Type', 'application/json')},
+        'body': response.text,
+    })
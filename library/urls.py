@@ -1,5 +1,4 @@
 from django.conf import settings
-from django.conf.urls.static import static
 from django.urls import path, include
 from . import views
 
@@ -17,6 +16,9 @@ urlpatterns = [
 
     path('book/<int:book_id>/read/', views.read_book, name='read_book'),
     path('book/<int:book_id>/pdf/', views.read_ebook, name='read_ebook'),
+    path('book/<int:book_id>/page/<int:page>/vocabulary/', views.page_vocabulary, name='page_vocabulary'),
+    path('book/<int:book_id>/page/<int:page>/image/<str:size>/', views.page_image, name='page_image'),
+    path('book/<int:book_id>/cover/', views.book_cover, name='book_cover'),
 
     path('book/<int:book_id>/', views.book_detail, name='book_detail'),
 
@@ -41,5 +43,10 @@ urlpatterns = [
 
     path('lookup/', views.lookup_word, name='lookup_word'),
     path("translate_define/", views.translate_and_define, name="translate_define"),
-    
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    path('search/', views.search_library, name='search_library'),
+    path('uploads/', views.upload_init, name='upload_init'),
+    path('uploads/<uuid:upload_id>/', views.upload_chunk, name='upload_chunk'),
+    path('uploads/<uuid:upload_id>/finalize/', views.upload_finalize, name='upload_finalize'),
+
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", views.serve_media, name='serve_media'),
+]
\ No newline at end of file
@@ -1,12 +1,15 @@
 from django.conf import settings
+from django.templatetags.static import static
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_http_methods, require_POST
 import json
-import requests
-from django.http import HttpResponse, FileResponse, JsonResponse
+import posixpath
+from django.http import Http404, HttpResponse, JsonResponse
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.models import User
 from django.contrib import messages
@@ -14,14 +17,15 @@ from django.template.loader import render_to_string
 from xhtml2pdf import pisa
 from docx import Document
 from bs4 import BeautifulSoup
-from django.db.models import Sum, Max
+from django.db.models import Count, Sum, Max
 from datetime import timedelta
 from django.utils import timezone
 from django.utils.timezone import localtime, localdate
 from dateutil.relativedelta import relativedelta
-from googletrans import Translator
 from .forms import BookForm, EbookFileForm, ChapterForm
-from .models import (Book, MyBook, Chapter, EbookFile,  SavedQuote, JournalEntry, WordLookup, Review, ReadingSession)
+from .models import (Book, Genre, Mood, MyBook, Chapter, ChunkedUpload, EbookFile,  SavedQuote, JournalEntry, WordLookup, Review, ReadingSession)
+from . import dictionary, file_responses, renditions, search, text_normalization, uploads, vocabulary
+from .recommendations import get_user_recommendations
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 import os
@@ -49,7 +53,7 @@ def main_page(request):
         user=user,
         start_time__in=[entry['latest_time'] for entry in latest_sessions],
         book_id__in=[entry['book'] for entry in latest_sessions]
-    ).order_by('-start_time')[:3]
+    ).select_related('book__ebookfile').order_by('-start_time')[:3]
 
     user_sessions = ReadingSession.objects.filter(user=user)
     stats = {
@@ -57,15 +61,11 @@ def main_page(request):
         'today_pages': user_sessions.filter(start_time__date=today).aggregate(total=Sum('pages_read'))['total'] or 0,
     }
 
-    read_books = Book.objects.filter(added_by=user, status='read')
-
-    if read_books.exists():
-        external_recommendations = get_google_books_recommendations(read_books)
-    else:
-        external_recommendations = []
+    external_recommendations, recommendations_pending = get_user_recommendations(user)
 
     return render(request, 'library/main.html', {
         'external_recommendations': external_recommendations,
+        'recommendations_pending': recommendations_pending,
         'recent_books': recent_books,
         'stats': stats,
     })
@@ -157,7 +157,7 @@ def logout_view(request):
 
 @login_required
 def read_book(request, book_id):
-    book = get_object_or_404(Book, id=book_id)
+    book = get_object_or_404(Book, id=book_id, added_by=request.user)
     quotes = SavedQuote.objects.filter(user=request.user, book=book)
     notes = JournalEntry.objects.filter(user=request.user, book=book)
     return render(request, 'library/read_book.html', {
@@ -169,15 +169,119 @@ def read_book(request, book_id):
 
 @login_required
 def read_ebook(request, book_id):
-    ebook = get_object_or_404(EbookFile, book_id=book_id)
-    return FileResponse(ebook.file.open('rb'), content_type='application/pdf')
+    # Byte ranges and validators let pdf.js fetch only the pages it renders
+    # and turn repeat visits into 304s.
+    ebook = get_object_or_404(EbookFile, book_id=book_id, book__added_by=request.user)
+    return file_responses.deliver(request, ebook.file.storage, ebook.file.name, 'application/pdf')
+
+
+@login_required
+def page_image(request, book_id, page, size):
+    # Small JPEG of one page from the rendition cache. A page that is not
+    # rendered yet is queued for a background job and the placeholder is
+    # shown meanwhile.
+    ebook = get_object_or_404(EbookFile, book_id=book_id, book__added_by=request.user)
+    if not ebook.file:
+        raise Http404
+    try:
+        name = renditions.cached(ebook, page, size)
+    except (renditions.RenditionError, OSError):
+        raise Http404
+    if name is None:
+        renditions.schedule(ebook, page, size)
+        return redirect(static('images/book_placeholder.jpg'))
+    return file_responses.deliver(request, default_storage, name, 'image/jpeg')
+
+
+@login_required
+def book_cover(request, book_id):
+    # Uploaded cover, else the first page of the ebook once it is rendered,
+    # else the placeholder.
+    book = get_object_or_404(Book, id=book_id, added_by=request.user)
+    if book.cover_image:
+        return redirect(book.cover_image.url)
+    ebook = EbookFile.objects.filter(book=book).first()
+    if ebook and ebook.file:
+        try:
+            name = renditions.cached(ebook, 1, 'cover')
+        except (renditions.RenditionError, OSError):
+            name = None
+        else:
+            if name is None:
+                renditions.schedule(ebook, 1, 'cover')
+        if name is not None:
+            return file_responses.deliver(request, default_storage, name, 'image/jpeg')
+    return redirect(static('images/no_cover.png'))
+
+
+def _owns_media(user, name):
+    # Renditions are only served through page_image/book_cover, which check
+    # the book; ebook and blob files belong to whoever added the book.
+    if name.startswith(settings.RENDITION_CACHE_DIR):
+        return False
+    return (
+        EbookFile.objects.filter(file=name, book__added_by=user).exists()
+        or Book.objects.filter(pdf_file=name, added_by=user).exists()
+    )
+
+
+def serve_media(request, path):
+    # Uploaded files go through here instead of being served directly, so
+    # protected folders (ebooks) are only served to the book's owner.
+    name = posixpath.normpath(path).lstrip('/')
+    if name.startswith('..') or name == '.' or not default_storage.exists(name):
+        raise Http404
+    if name.startswith(settings.MEDIA_PROTECTED_PREFIXES):
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        if not _owns_media(request.user, name):
+            raise Http404
+    return file_responses.deliver(request, default_storage, name)
+
+
+@login_required
+def page_vocabulary(request, book_id, page):
+    ebook = get_object_or_404(EbookFile, book_id=book_id, book__added_by=request.user)
+    result = vocabulary.prefetch(ebook, page, request.user)
+    if result is None:
+        return JsonResponse({"status": "not found"}, status=404)
+    if result is vocabulary.PENDING:
+        return JsonResponse({"status": "pending", "page": page, "words": [], "warming": 0}, status=202)
+    words, warming = result
+    return JsonResponse({"page": page, "words": words, "warming": len(warming)})
+
+
+@login_required
+def search_library(request):
+    # Ranked full-text search over the reader's own pages, quotes, notes,
+    # chapters and book descriptions.
+    query = request.GET.get("q", "").strip()
+    results = []
+    for result in search.search(request.user, query) if query else []:
+        document = result.document
+        if document.mybook_id:
+            url = reverse('view_mybook', args=[document.mybook_id])
+        elif document.kind == 'book':
+            url = reverse('book_detail', args=[document.book_id])
+        else:
+            url = reverse('read_book', args=[document.book_id])
+            if document.page:
+                url += f"#page={document.page}"
+        results.append({
+            "kind": document.kind,
+            "title": document.title,
+            "page": document.page,
+            "snippet": search.highlight(result.snippet),
+            "url": url,
+        })
+    return JsonResponse({"query": query, "results": results})
 
 
 @login_required
 def add_book(request):
     if request.method == 'POST':
         book_form = BookForm(request.POST, request.FILES)
-        file_form = EbookFileForm(request.POST, request.FILES)
+        file_form = EbookFileForm(request.POST, request.FILES, user=request.user)
 
         if book_form.is_valid() and file_form.is_valid():
             book = book_form.save(commit=False)
@@ -190,12 +294,22 @@ def add_book(request):
 
             ebook = file_form.save(commit=False)
             ebook.book = book
-            ebook.save()
+
+            upload = file_form.cleaned_data.get('upload')
+            if upload is None:
+                ebook.save()
+            else:
+                ebook.file = uploads.open_file(upload)
+                try:
+                    ebook.save()
+                finally:
+                    ebook.file.close()
+                uploads.discard(upload)
 
             return redirect('main')
     else:
         book_form = BookForm()
-        file_form = EbookFileForm()
+        file_form = EbookFileForm(user=request.user)
 
     return render(request, 'library/add_book.html', {
         'book_form': book_form,
@@ -204,6 +318,66 @@ def add_book(request):
     })
 
 
+def _upload_status(upload):
+    return {
+        "upload_id": str(upload.id),
+        "filename": upload.filename,
+        "size": upload.size,
+        "offset": upload.offset,
+        "status": upload.status,
+        "chunk_size": settings.CHUNKED_UPLOAD_CHUNK_SIZE,
+    }
+
+
+@require_POST
+@login_required
+def upload_init(request):
+    # Starts a chunked upload: {"filename", "size"} -> upload_id and offset 0.
+    try:
+        data = json.loads(request.body)
+        upload = uploads.create(request.user, data.get("filename", ""), int(data.get("size", 0)))
+    except (ValueError, TypeError):
+        return JsonResponse({"error": "Невалидна заявка."}, status=400)
+    except uploads.UploadError as exc:
+        return JsonResponse({"error": str(exc)}, status=exc.status)
+    return JsonResponse(_upload_status(upload), status=201)
+
+
+@require_http_methods(["GET", "PUT", "POST"])
+@login_required
+def upload_chunk(request, upload_id):
+    # GET reports how far the upload got; PUT/POST ?offset=N with the raw
+    # bytes as body appends the next chunk.
+    upload = get_object_or_404(ChunkedUpload, id=upload_id, user=request.user)
+    if request.method == "GET":
+        return JsonResponse(_upload_status(upload))
+    try:
+        offset = int(request.GET.get("offset", ""))
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return JsonResponse({"error": "Невалидно отместване."}, status=400)
+    try:
+        uploads.write_chunk(upload, offset, request, length)
+    except uploads.UploadError as exc:
+        upload.refresh_from_db()
+        return JsonResponse({"error": str(exc), **_upload_status(upload)}, status=exc.status)
+    return JsonResponse(_upload_status(upload))
+
+
+@require_POST
+@login_required
+def upload_finalize(request, upload_id):
+    upload = get_object_or_404(ChunkedUpload, id=upload_id, user=request.user)
+    try:
+        data = json.loads(request.body or b"{}")
+        uploads.finalize(upload, data.get("sha256", ""))
+    except ValueError:
+        return JsonResponse({"error": "Невалидна заявка."}, status=400)
+    except uploads.UploadError as exc:
+        return JsonResponse({"error": str(exc)}, status=exc.status)
+    return JsonResponse({**_upload_status(upload), "sha256": upload.sha256})
+
+
 @csrf_exempt
 @require_POST
 @login_required
@@ -232,85 +406,6 @@ def save_reading_duration(request, book_id):
         return JsonResponse({"success": False, "error": str(e)}, status=400)
     
 
-GOOGLE_BOOKS_API_URL = "https://www.googleapis.com/books/v1/volumes"
-
-def get_google_books_recommendations(read_books):
-    recommendations = []
-    seen_titles = set()
-
-    existing_titles = set(Book.objects.values_list('title', flat=True))
-
-    preferred_authors = list(set(book.author for book in read_books if book.author))
-    preferred_genres = list(set(book.genre for book in read_books if book.genre))
-    preferred_moods = list(set(book.mood for book in read_books if book.mood))
-
-    queries = []
-
-    for author in preferred_authors:
-        queries.append(f"inauthor:{author}")
-
-    for genre in preferred_genres:
-        queries.append(f"subject:{genre}")
-
-    for mood in preferred_moods:
-        queries.append(mood)
-
-    for query in queries:
-        params = {
-            'q': query,
-            'maxResults': 3,
-            'printType': 'books',
-            'langRestrict': 'bg',
-        }
-        response = requests.get(GOOGLE_BOOKS_API_URL, params=params)
-
-        if response.status_code == 200:
-            items = response.json().get('items', [])
-            for item in items:
-                volume_info = item.get('volumeInfo', {})
-                title = volume_info.get('title')
-
-                if title and title not in seen_titles and title not in existing_titles:
-                    recommendations.append({
-                        'title': title,
-                        'authors': ', '.join(volume_info.get('authors', [])),
-                        'description': volume_info.get('description', '')[:300],
-                        'thumbnail': volume_info.get('imageLinks', {}).get('thumbnail', ''),
-                        'link': volume_info.get('infoLink', '#')
-                    })
-                    seen_titles.add(title)
-
-        if len(recommendations) >= 10:
-            break
-
-    if not recommendations:
-        fallback_params = {
-            'q': 'books',  
-            'maxResults': 10,
-            'printType': 'books',
-            'langRestrict': 'bg',
-        }
-        fallback_response = requests.get(GOOGLE_BOOKS_API_URL, params=fallback_params)
-        if fallback_response.status_code == 200:
-            items = fallback_response.json().get('items', [])
-            for item in items:
-                volume_info = item.get('volumeInfo', {})
-                title = volume_info.get('title')
-                if title and title not in seen_titles and title not in existing_titles:
-                    recommendations.append({
-                        'title': title,
-                        'authors': ', '.join(volume_info.get('authors', [])),
-                        'description': volume_info.get('description', '')[:300],
-                        'thumbnail': volume_info.get('imageLinks', {}).get('thumbnail', ''),
-                        'link': volume_info.get('infoLink', '#')
-                    })
-                    seen_titles.add(title)
-                if len(recommendations) >= 10:
-                    break
-
-    return recommendations[:10]
-
-
 @login_required
 def book_detail(request, book_id):
     book = get_object_or_404(Book, pk=book_id)
@@ -346,11 +441,8 @@ def book_detail(request, book_id):
     genre_dict = dict(BookForm.PREDEFINED_GENRES)
     mood_dict = dict(BookForm.PREDEFINED_MOODS)
 
-    genres = book.genre.split(',') if book.genre else []
-    translated_genres = ', '.join([genre_dict.get(g.strip(), g.strip()) for g in genres])
-
-    moods = book.mood.split(',') if book.mood else []
-    translated_moods = ', '.join([mood_dict.get(m.strip(), m.strip()) for m in moods])
+    translated_genres = ', '.join([genre_dict.get(g.name, g.name) for g in book.genres.all()])
+    translated_moods = ', '.join([mood_dict.get(m.name, m.name) for m in book.moods.all()])
 
     return render(request, 'library/book_detail.html', {
         'book': book,
@@ -371,10 +463,10 @@ def my_added_books(request):
     author = request.GET.get('author', '')
 
     if genre:
-        books = books.filter(genre__icontains=genre) 
+        books = books.filter(genres__name=genre)
 
     if mood:
-        books = books.filter(mood__icontains=mood)   
+        books = books.filter(moods__name=mood)
 
     if title:
         books = books.filter(title__icontains=title)
@@ -382,10 +474,20 @@ def my_added_books(request):
     if author:
         books = books.filter(author__icontains=author)
 
-    books = books.order_by('title')
+    books = books.select_related('ebookfile').order_by('title')
 
-    genres = BookForm.PREDEFINED_GENRES
-    moods = BookForm.PREDEFINED_MOODS
+    genre_counts = dict(
+        Genre.objects.filter(books__added_by=request.user)
+        .annotate(book_count=Count('books'))
+        .values_list('name', 'book_count')
+    )
+    mood_counts = dict(
+        Mood.objects.filter(books__added_by=request.user)
+        .annotate(book_count=Count('books'))
+        .values_list('name', 'book_count')
+    )
+    genres = [(value, label, genre_counts.get(value, 0)) for value, label in BookForm.PREDEFINED_GENRES]
+    moods = [(value, label, mood_counts.get(value, 0)) for value, label in BookForm.PREDEFINED_MOODS]
 
     return render(request, 'library/my_added_books.html', {
         'books': books,
@@ -660,51 +762,42 @@ def lookup_word(request):
     query = request.GET.get("q", "").strip()
     result = None
     if query:
-        result = WordLookup.objects.filter(word__iexact=query).first()
+        # Indexed on the normalized form: the reader's own lookup first, then
+        # anyone else's. The exact word wins over others sharing its stem.
+        key = text_normalization.word_key(query)
+        folded = text_normalization.fold(query)
+        for lookups in (WordLookup.objects.filter(user=request.user), WordLookup.objects.all()):
+            matches = list(lookups.filter(normalized_word=key)[:20])
+            exact = [lookup for lookup in matches if text_normalization.fold(lookup.word) == folded]
+            result = (exact or matches or [None])[0]
+            if result is not None:
+                break
     return render(request, "library/lookup_result.html", {"query": query, "result": result})
 
+
 @login_required
-def translate_and_define(request):
+async def translate_and_define(request):
+    # Async so that a worker is not tied up while the translator and the
+    # dictionary answer; both are asked at the same time.
     word = request.GET.get("word", "").strip()
 
     if not word:
         return JsonResponse({"error": "Няма въведена дума."})
 
     try:
-        translator = Translator()
-
-        is_cyrillic = all('а' <= c.lower() <= 'я' for c in word if c.isalpha())
-
-        if is_cyrillic:
-            translation = translator.translate(word, src='bg', dest='en')
-            lookup_word = translation.text
-            display_translation = word
-        else:
-            lookup_word = word
-            translation = translator.translate(word, src='en', dest='bg')
-            display_translation = translation.text
-
-        definitions = {}
-        dict_response = requests.get(f"https://api.dictionaryapi.dev/api/v2/entries/en/{lookup_word}")
-
-        if dict_response.status_code == 200:
-            dict_data = dict_response.json()
-            meanings = dict_data[0].get("meanings", [])
-
-            for meaning in meanings:
-                part = meaning.get("partOfSpeech", "").strip().lower()
-                for d in meaning.get("definitions", []):
-                    eng_def = d.get("definition", "")
-                    if eng_def:
-                        bul_def = translator.translate(eng_def, src='en', dest='bg').text
-                        definitions.setdefault(part, []).append(bul_def)
-
-        if request.user.is_authenticated:
-            WordLookup.objects.update_or_create(
-                user=request.user,
+        src, dest = dictionary.language_pair(word)
+        entry = await dictionary.alookup(word, src, dest)
+        display_translation = word if src == 'bg' else entry.payload["translated"]
+        definitions = entry.payload["definitions"]
+
+        user = await request.auser()
+        if user.is_authenticated:
+            await WordLookup.objects.aupdate_or_create(
+                user=user,
                 word=word,
                 defaults={
                     'definition': display_translation,
+                    'entry': entry if entry.pk else None,
                     'created_at': timezone.now()
                 }
             )
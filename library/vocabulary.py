@@ -0,0 +1,106 @@
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import dictionary, ingestion, jobs
+from .models import DefinitionCache, PageText, WordLookup
+from .text_normalization import fold, word_key
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each even few for from further had has have
+having he her here hers herself him himself his how however i if in into is it its itself just like made
+make many may me might more most much must my myself never no nor not now of off on once one only or
+other our ours ourselves out over own said same say says she should since so some still such than that
+the their theirs them themselves then there these they this those through to too under until up upon
+us very was we well were what when where which while who whom why will with would yet you your yours
+yourself yourselves
+а аз ако ала би бил била били било бъде в вас ваш ваша ваше ви вие все всички всеки всичко във въпреки
+където да дали до докато е едва ето за защо зад заедно и из или им има ими й каза как каква
+какво както като кога когато което които кой който към ли ме между мен ми много мога могат може
+моля му на над наш не него нея ни ние нищо но нас нещо някой някои обаче около освен от отново
+още пак по повече под покрай после поради при пред преди през с са само се сега си след сме със сте
+съм също така там те тези ти то това тогава този той толкова точно тук тя тях утре че често чрез
+ще щом я
+""".split())
+
+_WORD_RE = re.compile(r"[^\W\d_]+(?:['\-][^\W\d_]+)*")
+
+# Returned for books whose text has not been extracted yet.
+PENDING = object()
+
+
+def page_text(ebook, page_number):
+    # Extracted text of one page (1-based), or None when the page does not
+    # exist. The PDF is never parsed in the request: until ingestion has run
+    # this returns PENDING, scheduling it only if no job has picked it up.
+    if ebook.ingest_status == 'failed':
+        return None
+    if ebook.ingest_status != 'done':
+        if ebook.ingest_status == 'pending':
+            ingestion.schedule_ingest(ebook)
+        return PENDING
+    return PageText.objects.filter(ebook=ebook, page_number=page_number).values_list('text', flat=True).first()
+
+
+def candidates(text, user, limit=None):
+    # Words a reader is likely to look up on the page: no stopwords, no very
+    # short tokens, nothing the user has looked up before. Longer (usually
+    # rarer) words come first.
+    limit = limit or settings.VOCABULARY_PREFETCH_LIMIT
+    seen = {}
+    for match in _WORD_RE.finditer(text):
+        word = fold(match.group())
+        if len(word) < settings.VOCABULARY_MIN_LENGTH or word in STOPWORDS:
+            continue
+        key = word_key(word)
+        if key and key not in seen and key not in STOPWORDS:
+            seen[key] = word
+
+    known = set(
+        WordLookup.objects.filter(user=user, normalized_word__in=list(seen)).values_list('normalized_word', flat=True)
+    )
+    words = [word for key, word in seen.items() if key not in known]
+    words.sort(key=len, reverse=True)
+    return words[:limit]
+
+
+def uncached(words):
+    # The subset of words with no fresh definition cache entry; expired ones
+    # would be fetched again on tap, so they are warmed too.
+    keys = {}
+    for word in words:
+        src, dest = dictionary.language_pair(word)
+        keys[(dictionary.cache_key(word), src, dest)] = word
+    fresh_since = timezone.now() - timedelta(seconds=settings.DEFINITION_CACHE_TTL)
+    cached = set(
+        DefinitionCache.objects.filter(word__in={key for key, _, _ in keys}, fetched_at__gt=fresh_since)
+        .values_list('word', 'source_lang', 'target_lang')
+    )
+    return [word for key, word in keys.items() if key not in cached]
+
+
+def warm_definitions(words):
+    for word in words:
+        src, dest = dictionary.language_pair(word)
+        try:
+            dictionary.lookup(word, src, dest)
+        except Exception:
+            # A word that cannot be fetched now is simply looked up on tap.
+            continue
+
+
+def prefetch(ebook, page_number, user):
+    # Returns the candidate words and schedules the uncached ones to be
+    # defined in the background, None when the page does not exist, or
+    # PENDING while the book is still being ingested.
+    text = page_text(ebook, page_number)
+    if text is None or text is PENDING:
+        return text
+    words = candidates(text, user)
+    missing = uncached(words)
+    if missing:
+        jobs.enqueue(warm_definitions, missing, dedupe_key=('vocabulary', ebook.id, page_number))
+    return words, missing